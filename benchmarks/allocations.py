@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+    Compares reading a savegame through a file with reading it from a buffer.
+
+    usage: allocations.py COLONY00.SAV [repetitions]
+
+    For every read path the script prints the time per parse, the number of reads (read() calls on the file, read() and
+    unpack() calls on the buffer context), the number of bytes copied into new bytes objects by these reads and the
+    peak memory allocated while parsing.
+"""
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "colsaves"))
+
+import reader
+
+
+class CountingFile(io.BytesIO):
+    def __init__(self, data):
+        super().__init__(data)
+        self.reads = 0
+        self.copied = 0
+
+    def read(self, size=-1):
+        self.reads += 1
+        data = super().read(size)
+        self.copied += len(data)
+        return data
+
+
+class CountingBufferContext(reader.BufferContext):
+    def __init__(self, data):
+        super().__init__(data)
+        self.reads = 0
+        self.copied = 0
+
+    def read(self, size):
+        self.reads += 1
+        data = super().read(size)
+        # slices of the buffer are memoryviews, only bytes objects are copies
+        if isinstance(data, bytes):
+            self.copied += len(data)
+        return data
+
+    def unpack(self, struct):
+        self.reads += 1
+        return super().unpack(struct)
+
+
+def parse_file(data, compiled):
+    file = CountingFile(data)
+    reader.get_format(compiled).read(reader.Context(file))
+    return file.reads, file.copied
+
+
+def parse_buffer(data, compiled):
+    context = CountingBufferContext(data)
+    try:
+        reader.get_format(compiled).read(context)
+    finally:
+        context.release()
+    return context.reads, context.copied
+
+
+def measure(name, function, data, compiled, repetitions):
+    start = time.perf_counter()
+    for _ in range(repetitions):
+        reads, copied = function(data, compiled)
+    elapsed = (time.perf_counter() - start) / repetitions
+
+    tracemalloc.start()
+    function(data, compiled)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print("{:<24} {:>10.2f} ms {:>10} reads {:>10} bytes copied {:>10} bytes peak".format(
+        name, elapsed * 1000, reads, copied, peak))
+
+
+def main():
+    with open(sys.argv[1], "rb") as file:
+        data = file.read()
+    repetitions = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    for compiled in [False, True]:
+        suffix = " (compiled)" if compiled else ""
+        measure("file" + suffix, parse_file, data, compiled, repetitions)
+        measure("buffer" + suffix, parse_buffer, data, compiled, repetitions)
+
+
+if __name__ == "__main__":
+    main()
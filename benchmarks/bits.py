@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+    Microbenchmarks of the bit extraction functions in tools.
+
+    usage: bits.py [repetitions]
+"""
+import os
+import sys
+import random
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "colsaves"))
+
+import tools
+
+
+def main():
+    repetitions = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    rnd = random.Random(0)
+    cases = [
+        ("cargo types (3 bytes, 4 bits)", bytes(rnd.randrange(256) for _ in range(3)), 4),
+        ("buildings (6 bytes, 1 bit)", bytes(rnd.randrange(256) for _ in range(6)), 1),
+        ("3 bytes, 3 bits", bytes(rnd.randrange(256) for _ in range(3)), 3),
+        ("64 bytes, 2 bits", bytes(rnd.randrange(256) for _ in range(64)), 2),
+    ]
+    for name, data, num_bits in cases:
+        stream = timeit.timeit(lambda: list(tools.stream_bits(data, num_bits)), number=repetitions)
+        unpack = timeit.timeit(lambda: tools.unpack_bits(data, num_bits), number=repetitions)
+        print("{:<32} stream_bits {:>8.2f} us  unpack_bits {:>8.2f} us".format(
+            name, stream / repetitions * 1e6, unpack / repetitions * 1e6))
+
+    data = bytes(rnd.randrange(256) for _ in range(4))
+
+    def reversed_flags():
+        bits = list(tools.stream_bits(data))
+        for start in range(0, len(bits), 8):
+            bits[start:start + 8] = bits[start:start + 8][::-1]
+        return [index for index, flag in enumerate(bits) if flag == 1]
+
+    stream = timeit.timeit(reversed_flags, number=repetitions)
+    indices = timeit.timeit(lambda: tools.set_bit_indices(data, msb_first=False), number=repetitions)
+    print("{:<32} stream_bits {:>8.2f} us  set_bit_indices {:>8.2f} us".format(
+        "founding fathers (4 bytes)", stream / repetitions * 1e6, indices / repetitions * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+    Compares the memory needed to keep parsed savegames with plain and with slotted records.
+
+    usage: memory.py COLONY00.SAV [copies]
+
+    The savegame is parsed :copies times (default 20) and all results are kept. The script prints the memory allocated
+    per savegame and the time per parse.
+"""
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "colsaves"))
+
+import reader
+
+
+def measure(data, copies, **options):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    savegames = [reader.parse_savegame(data, **options) for _ in range(copies)]
+    elapsed = (time.perf_counter() - start) / copies
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del savegames
+    return current / copies, elapsed
+
+
+def main():
+    with open(sys.argv[1], "rb") as file:
+        data = file.read()
+    copies = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    # warm up the format caches
+    reader.parse_savegame(data, compiled=True, slots=True)
+    for options in [{}, {"slots": True}, {"compiled": True}, {"compiled": True, "slots": True}]:
+        name = ", ".join(options) or "plain"
+        size, elapsed = measure(data, copies, **options)
+        print("{:<16} {:>12.0f} bytes per savegame {:>10.2f} ms per parse".format(name, size, elapsed * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+    Measures reading, exporting and rendering of synthetic savegames and compares the results with a baseline.
+
+    usage: suite.py [-s WIDTHxHEIGHT] [-c COLONIES] [-u UNITS] [-t TRIBES] [-n SAVES] [-r REPEAT]
+                    [--images DIRECTORY] [--save-baseline FILE] [--baseline FILE] [--threshold FRACTION]
+
+    Every benchmark processes the :saves generated savegames (default 10) once per repetition and keeps the fastest
+    repetition. It reports the time per savegame, savegames per second, MB per second and the peak memory allocated
+    during one extra traced repetition. The sections of the format ("header" sums up the fields which are no section)
+    are timed separately, "map" is Map.read. The parse cache benchmarks load entries of parsecache.ParseCache, only the
+    header or all sections.
+
+    --save-baseline writes the results as JSON. Otherwise the results are compared with the baseline (default:
+    baseline.json next to this script) and the script exits with 1 when the time or the peak memory of a benchmark grew
+    by more than the threshold (default 0.2 = 20%), with 2 when the baseline is missing or was measured with other
+    options. Times depend on the machine, so write the baseline on the machine which runs the comparison.
+"""
+import io
+import gc
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "colsaves"))
+
+import reader
+import export
+import render
+import synthetic
+import parsecache
+
+
+SECTIONS = ["players", "colonies", "units", "europe", "tribes", "indians", "map"]
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+
+def read_sections(data, compiled, times, sizes):
+    """Reads a savegame field by field like format.read() and adds the time and the bytes per section to :times and :sizes."""
+    format = reader.get_format(compiled, False)
+    context = reader.BufferContext(data)
+    savegame = format.factory()
+    context.objects.append(savegame)
+    for name, field in format.reader.items():
+        offset = context.tell()
+        start = time.perf_counter()
+        setattr(savegame, name, field.read(context))
+        section = name if name in SECTIONS else "header"
+        times[section] = times.get(section, 0) + time.perf_counter() - start
+        sizes[section] = sizes.get(section, 0) + context.tell() - offset
+    context.release()
+
+
+def benchmarks(saves, atlas, cache_directory):
+    """Returns (name, function) of all benchmarks. A function processes all savegames once and returns None."""
+    parsed = [reader.parse_savegame(data, compiled=True) for data in saves]
+    cache = parsecache.ParseCache(cache_directory)
+    for data in saves:
+        cache.parse(data, slots=True)
+    result = [
+        ("parse", lambda: [reader.parse_savegame(data) for data in saves]),
+        ("parse compiled", lambda: [reader.parse_savegame(data, compiled=True) for data in saves]),
+        ("parse compiled slots", lambda: [reader.parse_savegame(data, compiled=True, slots=True) for data in saves]),
+    ]
+    if reader.numpy is not None:
+        result.append(("parse compiled map arrays",
+                       lambda: [reader.parse_savegame(data, compiled=True, map_arrays=True) for data in saves]))
+    result += [
+        ("parse cache warm slots", lambda: [cache.parse(data, slots=True) for data in saves]),
+        ("parse cache warm slots sections",
+         lambda: [[getattr(cache.parse(data, slots=True), name) for name in SECTIONS] for data in saves]),
+        ("export json", lambda: [export.write_json(savegame, io.StringIO()) for savegame in parsed]),
+        ("write map", lambda: [render.write_map(savegame.map, savegame.map_size, io.BytesIO(), atlas) for savegame in parsed]),
+    ]
+    return result
+
+
+def measure(function, repeat):
+    """Returns the fastest of :repeat runs and the peak memory of a traced run."""
+    best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    gc.collect()
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+
+def result(seconds, peak, saves, size=None):
+    if size is None:
+        size = sum(len(data) for data in saves)
+    return {
+        "seconds_per_save": seconds / len(saves),
+        "saves_per_second": len(saves) / seconds,
+        "mb_per_second": size / seconds / 1e6,
+        "peak_memory": peak,
+    }
+
+
+def run(saves, repeat, atlas, cache_directory):
+    results = {}
+    for name, function in benchmarks(saves, atlas, cache_directory):
+        results[name] = result(*measure(function, repeat), saves)
+
+    for compiled in [False, True]:
+        best = {}
+        for _ in range(repeat):
+            times = {}
+            sizes = {}
+            for data in saves:
+                read_sections(data, compiled, times, sizes)
+            for section, seconds in times.items():
+                best[section] = min(best.get(section, float("inf")), seconds)
+        # the peak memory of single sections is not measured
+        for section, seconds in best.items():
+            name = "section {}{}".format(section, " compiled" if compiled else "")
+            results[name] = result(seconds, 0, saves, sizes[section])
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Returns the (name, measure, baseline value, value) of all results which are worse than the baseline by more than :threshold."""
+    regressions = []
+    for name, values in results.items():
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        for measure in ["seconds_per_save", "peak_memory"]:
+            if expected[measure] and values[measure] > expected[measure] * (1 + threshold):
+                regressions.append((name, measure, expected[measure], values[measure]))
+    return regressions
+
+
+def print_results(results, file=sys.stdout):
+    file.write("{:<32} {:>12} {:>10} {:>10} {:>12}\n".format("benchmark", "ms per save", "saves/s", "MB/s", "peak KiB"))
+    for name, values in results.items():
+        file.write("{:<32} {:>12.3f} {:>10.1f} {:>10.2f} {:>12.1f}\n".format(
+            name, values["seconds_per_save"] * 1000, values["saves_per_second"], values["mb_per_second"],
+            values["peak_memory"] / 1024))
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Benchmark reading, exporting and rendering savegames.")
+    parser.add_argument("-s", "--map-size", type=synthetic.parse_map_size, default=(58, 72), help="WIDTHxHEIGHT (default: 58x72)")
+    parser.add_argument("-c", "--colonies", type=int, default=20)
+    parser.add_argument("-u", "--units", type=int, default=100)
+    parser.add_argument("-t", "--tribes", type=int, default=40)
+    parser.add_argument("-n", "--saves", type=int, default=10, help="number of savegames (default: 10)")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="repetitions per benchmark (default: 5)")
+    parser.add_argument("--images", help="directory of the sprites (default: generated sprites)")
+    parser.add_argument("--save-baseline", metavar="FILE", help="write the results to FILE")
+    parser.add_argument("--baseline", metavar="FILE", default=BASELINE,
+                        help="compare the results with FILE (default: baseline.json)")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed regression (default: 0.2)")
+    options = parser.parse_args(args)
+    if not options.save_baseline and not os.path.exists(options.baseline):
+        sys.stderr.write("no baseline {}, write one with --save-baseline\n".format(options.baseline))
+        return 2
+
+    config = {
+        "map_size": list(options.map_size),
+        "colonies": options.colonies,
+        "units": options.units,
+        "tribes": options.tribes,
+        "saves": options.saves,
+    }
+    saves = [synthetic.build_savegame(options.colonies, options.units, options.tribes, options.map_size, seed)
+             for seed in range(options.saves)]
+    with tempfile.TemporaryDirectory() as directory:
+        if options.images is None:
+            synthetic.write_sprites(directory)
+        atlas = render.SpriteAtlas.load(options.images or directory)
+        results = run(saves, options.repeat, atlas, os.path.join(directory, "cache"))
+    print_results(results)
+
+    if options.save_baseline:
+        with open(options.save_baseline, "w") as file:
+            json.dump({"config": config, "results": results}, file, indent=2)
+        return 0
+
+    with open(options.baseline) as file:
+        baseline = json.load(file)
+    if baseline["config"] != config:
+        sys.stderr.write("the baseline was measured with {}\n".format(baseline["config"]))
+        return 2
+    regressions = compare(results, baseline["results"], options.threshold)
+    for name, measure, expected, value in regressions:
+        sys.stderr.write("{}: {} {:.6g} -> {:.6g} ({:+.0%})\n".format(name, measure, expected, value, value / expected - 1))
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+    Parses many savegames in a process pool and writes one JSON object per savegame (JSON Lines).
+
+    usage: batch.py [-w WORKERS] [-c CHUNKSIZE] [-o OUTPUT] PATH [PATH ...]
+
+    PATH is a savegame, a directory (all *.SAV files in it) or a glob pattern. The lines are written in the order in
+    which the savegames are parsed. A savegame which can't be parsed results in a line with an "error" attribute.
+"""
+import os
+import sys
+import glob
+import json
+import argparse
+import itertools
+
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+
+import reader
+import tools
+
+
+def find_savegames(paths):
+    """Returns the savegame files for files, directories and glob patterns."""
+    filenames = []
+    for path in paths:
+        if os.path.isdir(path):
+            filenames.extend(sorted(os.path.join(path, name) for name in os.listdir(path) if name.upper().endswith(".SAV")))
+        elif os.path.exists(path):
+            filenames.append(path)
+        else:
+            filenames.extend(sorted(glob.glob(path, recursive=True)))
+    return filenames
+
+
+def parse_file(filename):
+    """Returns the JSON line for a savegame."""
+    try:
+        savegame = reader.read_savegame(filename, compiled=True, use_mmap=True, map_arrays=reader.numpy is not None)
+        return json.dumps({"file": filename, "savegame": savegame}, cls=tools.Encoder)
+    except Exception as e:
+        return error_lines([filename], e)[0]
+
+
+def parse_chunk(filenames):
+    return [parse_file(filename) for filename in filenames]
+
+
+def chunks(filenames, chunksize):
+    for start in range(0, len(filenames), chunksize):
+        yield filenames[start:start + chunksize]
+
+
+def error_lines(filenames, exception):
+    return [json.dumps({"file": filename, "error": "{}: {}".format(type(exception).__name__, exception)})
+            for filename in filenames]
+
+
+def parse_files(filenames, workers=None, chunksize=8, task=parse_chunk):
+    """
+        Returns an iterator over the JSON lines of the savegames in the order in which they are parsed. task(chunk)
+        returns the lines of a chunk of filenames in a worker; at most two chunks per worker are submitted at a time.
+        When a task fails, i.e. because its worker crashed, the files of the chunk get error lines. A crashed worker
+        breaks the pool, which fails the other submitted chunks too; the pool is replaced for the remaining chunks.
+    """
+    workers = workers or os.cpu_count() or 1
+    remaining = chunks(filenames, chunksize)
+    # future -> chunk
+    pending = {}
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        while True:
+            for chunk in itertools.islice(remaining, 2 * workers - len(pending)):
+                pending[executor.submit(task, chunk)] = chunk
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            broken = False
+            for future in done:
+                chunk = pending.pop(future)
+                try:
+                    lines = future.result()
+                except Exception as e:
+                    broken = broken or isinstance(e, BrokenProcessPool)
+                    lines = error_lines(chunk, e)
+                yield from lines
+            if broken:
+                executor.shutdown(wait=False)
+                executor = ProcessPoolExecutor(max_workers=workers)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def write_lines(lines, output):
+    count = 0
+    for line in lines:
+        output.write(line)
+        output.write("\n")
+        count += 1
+    output.flush()
+    return count
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Parse savegames into JSON Lines.")
+    parser.add_argument("paths", nargs="+", metavar="PATH", help="savegame, directory or glob pattern")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="number of worker processes (default: number of cpus)")
+    parser.add_argument("-c", "--chunksize", type=int, default=8, help="number of savegames per task")
+    parser.add_argument("-o", "--output", default="-", help="output file (default: stdout)")
+    options = parser.parse_args(args)
+
+    lines = parse_files(find_savegames(options.paths), options.workers, options.chunksize)
+    if options.output == "-":
+        write_lines(lines, sys.stdout)
+    else:
+        with open(options.output, "w") as output:
+            write_lines(lines, output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+    Counts the records of a section of many savegames by the value of a field, with numpy arrays of the sections.
+
+    usage: columns.py [-s SECTION] [-f FIELD] PATH [PATH ...]
+
+    PATH is a savegame, a directory or a glob pattern (see batch.py). The default counts the units by type. FIELD is a
+    field of the records as declared in reader.py, i.e. "type" or "order" of units or "nation" of colonies.
+
+    The sections are read with LazySavegame.to_numpy(), no record objects are created.
+"""
+import argparse
+
+import numpy
+
+import batch
+import reader
+
+
+def read_section(filename, section):
+    """Returns the records of a section of a savegame file as structured array (a view of the bytes of the file)."""
+    with open(filename, "rb") as file:
+        data = file.read()
+    return reader.load_savegame(data).to_numpy(section)
+
+
+def field_names(section, field):
+    """Returns the lookup table of a field of the records of a section, None if the field is no lookup."""
+    field_reader = reader.format.reader[section].reader.reader.get(field)
+    return field_reader.array if isinstance(field_reader, reader.Lookup) else None
+
+
+def count_by(arrays, field):
+    """Returns the number of records with each value of :field as array indexed by the value."""
+    counts = numpy.zeros(0, dtype=numpy.int64)
+    for array in arrays:
+        values = numpy.bincount(array[field].ravel())
+        if len(values) > len(counts):
+            counts = numpy.pad(counts, (0, len(values) - len(counts)))
+        counts[:len(values)] += values
+    return counts
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Count the records of savegames by a field.")
+    parser.add_argument("paths", nargs="+", metavar="PATH", help="savegame, directory or glob pattern")
+    parser.add_argument("-s", "--section", default="units", help="section of the records (default: units)")
+    parser.add_argument("-f", "--field", default="type", help="field to count by (default: type)")
+    options = parser.parse_args(args)
+
+    arrays = (read_section(filename, options.section) for filename in batch.find_savegames(options.paths))
+    names = field_names(options.section, options.field)
+    for value, count in enumerate(count_by(arrays, options.field)):
+        if count:
+            name = names[value] if names is not None and value in range(len(names)) else value
+            print("{}: {}".format(name, count))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+    Compares two savegames field by field.
+
+    usage: diff.py [--json] OLD NEW
+
+    The byte ranges of the header fields, of every record (colonies, units, europe, tribes, ...) and of every map row
+    are hashed first. Only records whose hashes differ are decoded and compared.
+"""
+import sys
+import json
+import hashlib
+import argparse
+import collections
+
+import reader
+import tools
+
+
+Change = collections.namedtuple("Change", ["section", "index", "field", "old", "new"])
+
+
+def digest(data):
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+def savegame_digests(savegame):
+    """
+        Returns the digests of a LazySavegame: a digest per header field, a list of digests per record section and a
+        list of digests of the map rows. Fields without bytes (Tell) have no digest, their values are compared. The
+        digests are computed once per savegame.
+    """
+    digests = getattr(savegame, "digests", None)
+    if digests is not None:
+        return digests
+    digests = {}
+    buffer = savegame.context.buffer
+    for name, (offset, size) in savegame.section_index.items():
+        section_reader = savegame.sections.get(name)
+        if isinstance(section_reader, reader.Map):
+            width = savegame.map_size.x
+            digests[name] = [digest(buffer[start:start + width]) for start in range(offset, offset + size, width)]
+        elif section_reader is not None:
+            record_size = reader.reader_size(section_reader.reader, savegame.context)
+            digests[name] = [digest(buffer[start:start + record_size]) for start in range(offset, offset + size, record_size)]
+        elif size > 0:
+            digests[name] = digest(buffer[offset:offset + size])
+    savegame.digests = digests
+    return digests
+
+
+def to_json(value):
+    return json.loads(json.dumps(value, cls=tools.Encoder))
+
+
+def flatten(value, prefix=""):
+    """Returns an iterator over (path, value) of all leaves of a JSON value, i.e. ("goods.Food", 12)."""
+    if isinstance(value, dict):
+        for key, child in value.items():
+            yield from flatten(child, "{}.{}".format(prefix, key) if prefix else key)
+    elif isinstance(value, list):
+        for index, child in enumerate(value):
+            yield from flatten(child, "{}[{}]".format(prefix, index))
+    else:
+        yield prefix, value
+
+
+def diff_values(section, index, old, new):
+    """Returns the changes between two serialized values, one for every changed leaf."""
+    old_fields = dict(flatten(old))
+    new_fields = dict(flatten(new))
+    return [Change(section, index, field, old_fields.get(field), new_fields.get(field))
+            for field in dict.fromkeys(list(old_fields) + list(new_fields))
+            if old_fields.get(field) != new_fields.get(field)]
+
+
+def diff_map(old, new, old_digests, new_digests):
+    changes = []
+    width = new.map_size.x
+    old_data = old.raw("map")
+    new_data = new.raw("map")
+    for y, (old_digest, new_digest) in enumerate(zip(old_digests, new_digests)):
+        if old_digest == new_digest:
+            continue
+        for x in range(width):
+            index = y * width + x
+            if old_data[index] != new_data[index]:
+                changes.append(Change("map", (x, y), "tile", old_data[index], new_data[index]))
+    return changes
+
+
+def diff_records(name, old, new, old_digests, new_digests):
+    changes = []
+    old_records = getattr(old, name)
+    new_records = getattr(new, name)
+    for index in range(max(len(old_digests), len(new_digests))):
+        if index >= len(old_digests):
+            changes.append(Change(name, index, None, None, to_json(new_records[index])))
+        elif index >= len(new_digests):
+            changes.append(Change(name, index, None, to_json(old_records[index]), None))
+        elif old_digests[index] != new_digests[index]:
+            changes.extend(diff_values(name, index, to_json(old_records[index]), to_json(new_records[index])))
+    return changes
+
+
+def diff_savegames(old, new):
+    """
+        Returns the list of changes between two LazySavegames. A change of a header field or a record field has the
+        section ("header", "colonies", ...), the index of the record, the path of the field and the old and new value.
+        Added and removed records have no field and no old or new value. A changed map tile has "map" as section and
+        (x, y) as index.
+    """
+    if (old.map_size.x, old.map_size.y) != (new.map_size.x, new.map_size.y):
+        raise ValueError("can't compare maps of different size")
+    old_digests = savegame_digests(old)
+    new_digests = savegame_digests(new)
+    changes = []
+    for name in new.section_index:
+        if name in new_digests and old_digests[name] == new_digests[name]:
+            continue
+        section_reader = new.sections.get(name)
+        if isinstance(section_reader, reader.Map):
+            changes.extend(diff_map(old, new, old_digests[name], new_digests[name]))
+        elif section_reader is not None:
+            changes.extend(diff_records(name, old, new, old_digests[name], new_digests[name]))
+        else:
+            changes.extend(diff_values("header", None, {name: to_json(getattr(old, name))}, {name: to_json(getattr(new, name))}))
+    return changes
+
+
+def format_change(change):
+    location = change.section if change.index is None else "{}[{}]".format(change.section, change.index)
+    if change.field is None:
+        return "{}: {}".format(location, "added" if change.old is None else "removed")
+    text = "{}.{}: {} -> {}".format(location, change.field, change.old, change.new)
+    if isinstance(change.old, int) and isinstance(change.new, int) and not isinstance(change.old, bool):
+        text += " ({:+d})".format(change.new - change.old)
+    return text
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Compare two savegames.")
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument("--json", action="store_true", help="write the changes as JSON Lines")
+    options = parser.parse_args(args)
+
+    with reader.open_savegame(options.old, compiled=True, slots=True) as old, \
+            reader.open_savegame(options.new, compiled=True, slots=True) as new:
+        for change in diff_savegames(old, new):
+            if options.json:
+                sys.stdout.write(json.dumps(change._asdict()) + "\n")
+            else:
+                sys.stdout.write(format_change(change) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+    Writes savegames as JSON to a file section by section, without building the whole document in memory.
+
+    usage: export.py [-s SECTION ...] [-o OUTPUT] SAVEGAME
+"""
+import sys
+import argparse
+
+import reader
+import tools
+
+
+SECTIONS = ["header", "players", "colonies", "units", "europe", "tribes", "indians", "map"]
+
+
+def records(savegame, name):
+    """Returns an iterator over the records of a section. Records of a LazySavegame are not kept in memory."""
+    section = getattr(savegame, name)
+    if isinstance(section, reader.Records):
+        return section.stream()
+    return iter(section)
+
+
+def map_rows(savegame):
+    """Returns an iterator over the rows of the map as bytes. A LazySavegame doesn't decode the tiles for this."""
+    if isinstance(savegame, reader.LazySavegame) and "map" not in vars(savegame):
+        width = savegame.map_size.x
+        data = savegame.raw("map")
+        for start in range(0, len(data), width):
+            yield bytes(data[start:start + width])
+    else:
+        yield from savegame.map.map_data
+
+
+def write_list(file, encoder, items):
+    file.write("[")
+    separator = ""
+    for item in items:
+        file.write(separator)
+        for chunk in encoder.iterencode(item):
+            file.write(chunk)
+        separator = ",\n"
+    file.write("]")
+
+
+def write_json(savegame, file, sections=SECTIONS):
+    """
+        Writes the savegame as JSON object to :file. The header fields are the attributes of the object, every other
+        section in :sections is written as list of its records. The map is written as {"map_data": [rows]}.
+    """
+    encoder = tools.Encoder()
+    separator = "{"
+    if "header" in sections:
+        for name in dict.fromkeys(savegame.ATTRIBUTES):
+            if name == "map":
+                continue
+            file.write("{}{}: ".format(separator, encoder.encode(name)))
+            for chunk in encoder.iterencode(getattr(savegame, name)):
+                file.write(chunk)
+            separator = ",\n"
+    for name in SECTIONS[1:-1]:
+        if name in sections:
+            file.write("{}{}: ".format(separator, encoder.encode(name)))
+            write_list(file, encoder, records(savegame, name))
+            separator = ",\n"
+    if "map" in sections:
+        file.write('{}"map": {{"map_data": '.format(separator))
+        write_list(file, encoder, map_rows(savegame))
+        file.write("}")
+        separator = ",\n"
+    if separator == "{":
+        file.write("{")
+    file.write("}\n")
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Export a savegame as JSON.")
+    parser.add_argument("savegame")
+    parser.add_argument("-s", "--section", action="append", choices=SECTIONS, help="section to export (default: all)")
+    parser.add_argument("-o", "--output", default="-", help="output file (default: stdout)")
+    options = parser.parse_args(args)
+
+    with reader.open_savegame(options.savegame, compiled=True) as savegame:
+        sections = options.section or SECTIONS
+        if options.output == "-":
+            write_json(savegame, sys.stdout, sections)
+        else:
+            with open(options.output, "w") as output:
+                write_json(savegame, output, sections)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+    Continents, oceans and travel distances of the map of a savegame.
+
+    usage: geography.py SAVEGAME
+
+    The command prints the continents (land components) with their colonies.
+
+    Tiles are connected to their 8 neighbours, like the moves of units. A Geography is computed once per map content,
+    geography() returns the cached one for maps with the same map data.
+"""
+import heapq
+import hashlib
+import argparse
+import collections
+
+import reader
+
+
+# moves to the 8 neighbours
+DIRECTIONS = [(-1, -1), (0, -1), (1, -1), (-1, 0), (1, 0), (-1, 1), (0, 1), (1, 1)]
+
+# movement costs of land tiles: plain, forest, mountain
+LAND_COSTS = (1, 2, 3)
+
+# number of maps whose geography is kept
+CACHE_SIZE = 16
+
+# number of distance fields kept per geography
+DISTANCE_FIELDS = 64
+
+
+def map_hash(map):
+    return hashlib.blake2b(b"".join(map.map_data), digest_size=16).digest()
+
+
+class Geography:
+
+    """
+        Connected components of the land and of the water tiles of a map and distance fields over them. Positions are
+        indexed y * width + x.
+    """
+
+    def __init__(self, map_data, map_size):
+        self.width = map_size.x
+        self.height = map_size.y
+        data = b"".join(map_data)
+        self.land = [byte & 0x10 == 0 for byte in data]
+        # 0 plain, 1 forest, 2 mountain; mountains with forest count as mountains
+        self.terrain = [0 if not land else 2 if byte & 0x20 else 1 if byte & 0x08 else 0
+                        for land, byte in zip(self.land, data)]
+        self.labels = self.label_components()
+        self.sizes = collections.Counter(self.labels)
+        # (sources, land, costs) -> distances, least recently used first
+        self.distance_fields = collections.OrderedDict()
+
+    def index(self, x, y):
+        return y * self.width + x
+
+    def neighbours(self, index):
+        y, x = divmod(index, self.width)
+        for dx, dy in DIRECTIONS:
+            nx, ny = x + dx, y + dy
+            if 0 <= nx < self.width and 0 <= ny < self.height:
+                yield ny * self.width + nx
+
+    def label_components(self):
+        """Returns the component label of every tile. Land and water tiles are never in the same component."""
+        parent = list(range(self.width * self.height))
+
+        def find(index):
+            while parent[index] != index:
+                parent[index] = parent[parent[index]]
+                index = parent[index]
+            return index
+
+        land = self.land
+        width = self.width
+        # union with the neighbours which come before the tile: left, top left, top, top right
+        for index in range(len(parent)):
+            y, x = divmod(index, width)
+            previous = []
+            if x > 0:
+                previous.append(index - 1)
+            if y > 0:
+                previous.append(index - width)
+                if x > 0:
+                    previous.append(index - width - 1)
+                if x < width - 1:
+                    previous.append(index - width + 1)
+            for neighbour in previous:
+                if land[neighbour] == land[index]:
+                    root, neighbour_root = find(index), find(neighbour)
+                    if root != neighbour_root:
+                        parent[max(root, neighbour_root)] = min(root, neighbour_root)
+
+        # number the components in the order of their first tile
+        labels = {}
+        return [labels.setdefault(find(index), len(labels)) for index in range(len(parent))]
+
+    def component(self, x, y):
+        """Returns the label of the component of a tile."""
+        return self.labels[self.index(x, y)]
+
+    def same_component(self, first, second):
+        """Returns whether two (x, y) positions are on the same continent or the same water."""
+        return self.component(*first) == self.component(*second)
+
+    def components(self, land=True):
+        """Returns the labels of the land or water components, the largest first."""
+        labels = {label for label, is_land in zip(self.labels, self.land) if is_land == land}
+        return sorted(labels, key=lambda label: (-self.sizes[label], label))
+
+    def coastal(self, x, y):
+        """Returns whether a land tile is next to water."""
+        return any(not self.land[neighbour] for neighbour in self.neighbours(self.index(x, y)))
+
+    def distances(self, sources, land=True, costs=LAND_COSTS):
+        """
+            Returns the cost of the cheapest path from the nearest of the (x, y) :sources to every tile, None for tiles
+            which can't be reached. Paths only enter land tiles (with the costs of plain, forest and mountain tiles) or,
+            with land=False, only water tiles, which cost 1. The result is cached, don't modify it.
+        """
+        key = (frozenset(sources), land, tuple(costs))
+        field = self.distance_fields.get(key)
+        if field is not None:
+            self.distance_fields.move_to_end(key)
+            return field
+        field = self.compute_distances(key[0], land, costs)
+        self.distance_fields[key] = field
+        if len(self.distance_fields) > DISTANCE_FIELDS:
+            self.distance_fields.popitem(last=False)
+        return field
+
+    def compute_distances(self, sources, land, costs):
+        field = [None] * (self.width * self.height)
+        queue = []
+        for x, y in sources:
+            index = self.index(x, y)
+            field[index] = 0
+            queue.append((0, index))
+        heapq.heapify(queue)
+        while queue:
+            distance, index = heapq.heappop(queue)
+            if distance > field[index]:
+                continue
+            for neighbour in self.neighbours(index):
+                if self.land[neighbour] != land:
+                    continue
+                neighbour_distance = distance + (costs[self.terrain[neighbour]] if land else 1)
+                if field[neighbour] is None or neighbour_distance < field[neighbour]:
+                    field[neighbour] = neighbour_distance
+                    heapq.heappush(queue, (neighbour_distance, neighbour))
+        return field
+
+    def distance(self, sources, x, y, land=True, costs=LAND_COSTS):
+        """Returns the distance of (x, y) from the nearest source, None if it can't be reached."""
+        return self.distances(sources, land, costs)[self.index(x, y)]
+
+
+geographies = collections.OrderedDict()
+
+
+def geography(map):
+    """Returns the Geography of a map. It is computed once for maps with the same data."""
+    key = (map.map_size.x, map.map_size.y, map_hash(map))
+    result = geographies.get(key)
+    if result is not None:
+        geographies.move_to_end(key)
+        return result
+    result = Geography(map.map_data, map.map_size)
+    geographies[key] = result
+    if len(geographies) > CACHE_SIZE:
+        geographies.popitem(last=False)
+    return result
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Show the continents of a savegame and their colonies.")
+    parser.add_argument("savegame")
+    options = parser.parse_args(args)
+
+    with reader.open_savegame(options.savegame, compiled=True) as savegame:
+        world = geography(savegame.map)
+        colonies = collections.defaultdict(list)
+        for colony in savegame.colonies:
+            colonies[world.component(colony.x, colony.y)].append(colony)
+        for label in world.components(land=True):
+            names = ", ".join("{} ({}{})".format(colony.name, colony.nation, ", coastal" if world.coastal(colony.x, colony.y) else "")
+                              for colony in colonies[label])
+            print("continent {}: {} tiles{}".format(label, world.sizes[label], ": " + names if names else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+    Stores the turns of campaigns in an SQLite database.
+
+    usage: history.py [-g GAME] DATABASE PATH [PATH ...]
+
+    PATH is a savegame, a directory or a glob pattern (see batch.py). Savegames which are already stored for the game
+    (same content hash) are skipped. The game defaults to the name of the directory of the savegame.
+"""
+import os
+import sys
+import hashlib
+import sqlite3
+import argparse
+
+import batch
+import reader
+
+
+SCHEMA = """
+create table if not exists games (
+    id integer primary key,
+    name text not null unique
+);
+create table if not exists saves (
+    id integer primary key,
+    game_id integer not null references games(id),
+    file text,
+    hash text not null,
+    turn integer,
+    year integer,
+    autumn integer,
+    difficulty text,
+    num_colonies integer,
+    num_units integer,
+    num_tribes integer,
+    unique (game_id, hash)
+);
+create index if not exists saves_turn on saves (game_id, turn, year, autumn);
+create table if not exists players (
+    save_id integer not null references saves(id),
+    nation_index integer not null,
+    name text,
+    continent text,
+    control text,
+    primary key (save_id, nation_index)
+);
+create table if not exists europe (
+    save_id integer not null references saves(id),
+    nation_index integer not null,
+    tax_rate integer,
+    gold integer,
+    current_bells integer,
+    current_crosses integer,
+    needed_crosses integer,
+    current_founding_father text,
+    bought_artillery integer,
+    primary key (save_id, nation_index)
+);
+create table if not exists europe_goods (
+    save_id integer not null references saves(id),
+    nation_index integer not null,
+    goods text not null,
+    price integer,
+    balance integer,
+    demand integer,
+    primary key (save_id, nation_index, goods)
+);
+create table if not exists colonies (
+    save_id integer not null references saves(id),
+    colony_index integer not null,
+    name text,
+    nation text,
+    x integer,
+    y integer,
+    colonists_num integer,
+    hammers integer,
+    current_production text,
+    bells integer,
+    primary key (save_id, colony_index)
+);
+create index if not exists colonies_nation on colonies (nation, save_id);
+create index if not exists colonies_position on colonies (save_id, x, y);
+create table if not exists colony_goods (
+    save_id integer not null references saves(id),
+    colony_index integer not null,
+    goods text not null,
+    amount integer,
+    primary key (save_id, colony_index, goods)
+);
+create table if not exists colony_buildings (
+    save_id integer not null references saves(id),
+    colony_index integer not null,
+    building text not null
+);
+create index if not exists colony_buildings_colony on colony_buildings (save_id, colony_index);
+create table if not exists units (
+    save_id integer not null references saves(id),
+    unit_index integer not null,
+    type text,
+    nation text,
+    x integer,
+    y integer,
+    goto_x integer,
+    goto_y integer,
+    "order" text,
+    profession text,
+    num_cargo integer,
+    primary key (save_id, unit_index)
+);
+create index if not exists units_nation on units (nation, save_id);
+create index if not exists units_position on units (save_id, x, y);
+create table if not exists unit_cargo (
+    save_id integer not null references saves(id),
+    unit_index integer not null,
+    slot integer not null,
+    goods text,
+    amount integer,
+    primary key (save_id, unit_index, slot)
+);
+create table if not exists tribes (
+    save_id integer not null references saves(id),
+    tribe_index integer not null,
+    nation text,
+    x integer,
+    y integer,
+    state integer,
+    population integer,
+    mission text,
+    panic integer,
+    primary key (save_id, tribe_index)
+);
+create index if not exists tribes_nation on tribes (nation, save_id);
+"""
+
+
+class History:
+
+    """
+        SQLite database with the header fields, european economics, colonies, units and tribes of savegames. Every
+        savegame belongs to a game and is identified by the sha256 hash of its content.
+    """
+
+    def __init__(self, filename):
+        self.connection = sqlite3.connect(filename)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def game_id(self, game):
+        self.connection.execute("insert or ignore into games (name) values (?)", (game,))
+        return self.connection.execute("select id from games where name = ?", (game,)).fetchone()[0]
+
+    def ingest_file(self, filename, game=None):
+        """Stores a savegame file. Returns the id of the save or None when it is already stored."""
+        if game is None:
+            game = os.path.basename(os.path.dirname(os.path.abspath(filename)))
+        with open(filename, "rb") as file:
+            data = file.read()
+        return self.ingest(data, game, filename)
+
+    def ingest(self, data, game, filename=None):
+        """Stores the bytes of a savegame. Returns the id of the save or None when it is already stored."""
+        content_hash = hashlib.sha256(data).hexdigest()
+        with self.connection:
+            game_id = self.game_id(game)
+            if self.connection.execute("select 1 from saves where game_id = ? and hash = ?", (game_id, content_hash)).fetchone():
+                return None
+            # the map is not needed, the lazy savegame never reads it
+            savegame = reader.load_savegame(data, compiled=True, slots=True)
+            try:
+                return self.insert(savegame, game_id, content_hash, filename)
+            finally:
+                savegame.close()
+
+    def insert(self, savegame, game_id, content_hash, filename):
+        execute = self.connection.execute
+        executemany = self.connection.executemany
+        save_id = execute(
+            "insert into saves (game_id, file, hash, turn, year, autumn, difficulty, num_colonies, num_units, num_tribes) "
+            "values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (game_id, filename, content_hash, savegame.turn, savegame.year, savegame.autumn, savegame.difficulty,
+             savegame.num_colonies, savegame.num_units, savegame.num_tribes)).lastrowid
+
+        executemany("insert into players values (?, ?, ?, ?, ?)", [
+            (save_id, index, player.name, player.continent, player.control)
+            for index, player in enumerate(savegame.players)])
+
+        executemany("insert into europe values (?, ?, ?, ?, ?, ?, ?, ?, ?)", [
+            (save_id, index, europe.tax_rate, europe.gold, europe.current_bells, europe.current_crosses,
+             europe.needed_crosses, europe.current_founding_father, europe.bought_artillery)
+            for index, europe in enumerate(savegame.europe)])
+        executemany("insert into europe_goods values (?, ?, ?, ?, ?, ?)", [
+            (save_id, index, goods, europe.goods_price[goods_index], europe.goods_balance[goods_index],
+             europe.goods_demand[goods_index])
+            for index, europe in enumerate(savegame.europe)
+            for goods_index, goods in enumerate(reader.GOODS)])
+
+        colonies = list(enumerate(savegame.colonies))
+        executemany("insert into colonies values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", [
+            (save_id, index, colony.name, colony.nation, colony.x, colony.y, colony.colonists_num, colony.hammers,
+             colony.current_production, colony.bells)
+            for index, colony in colonies])
+        executemany("insert into colony_goods values (?, ?, ?, ?)", [
+            (save_id, index, goods, amount)
+            for index, colony in colonies
+            for goods, amount in colony.goods.items()])
+        executemany("insert into colony_buildings values (?, ?, ?)", [
+            (save_id, index, building)
+            for index, colony in colonies
+            for building in colony.buildings])
+
+        units = list(savegame.units)
+        executemany("insert into units values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", [
+            (save_id, unit.id, unit.type, unit.nation, unit.pos.x, unit.pos.y, unit.goto_pos.x, unit.goto_pos.y,
+             unit.order, unit.profession, unit.num_cargo)
+            for unit in units])
+        executemany("insert into unit_cargo values (?, ?, ?, ?, ?)", [
+            (save_id, unit.id, slot, goods, amount)
+            for unit in units
+            for slot, (goods, amount) in enumerate(unit.cargo)])
+
+        executemany("insert into tribes values (?, ?, ?, ?, ?, ?, ?, ?, ?)", [
+            (save_id, index, tribe.nation, tribe.pos.x, tribe.pos.y, tribe.state, tribe.population, tribe.mission,
+             tribe.panic)
+            for index, tribe in enumerate(savegame.tribes)])
+        return save_id
+
+    def query(self, sql, parameters=()):
+        return self.connection.execute(sql, parameters).fetchall()
+
+    def gold_per_turn(self, game):
+        """Returns (turn, year, autumn, nation index, gold) of every stored turn of the game."""
+        return self.query(
+            "select s.turn, s.year, s.autumn, e.nation_index, e.gold from saves s "
+            "join games g on g.id = s.game_id join europe e on e.save_id = s.id "
+            "where g.name = ? order by s.turn, s.year, s.autumn, e.nation_index", (game,))
+
+    def unit_positions(self, game, unit_index):
+        """Returns (turn, year, autumn, x, y) of a unit in every stored turn of the game."""
+        return self.query(
+            "select s.turn, s.year, s.autumn, u.x, u.y from saves s "
+            "join games g on g.id = s.game_id join units u on u.save_id = s.id "
+            "where g.name = ? and u.unit_index = ? order by s.turn, s.year, s.autumn", (game, unit_index))
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Store savegames in an SQLite database.")
+    parser.add_argument("database")
+    parser.add_argument("paths", nargs="+", metavar="PATH", help="savegame, directory or glob pattern")
+    parser.add_argument("-g", "--game", help="name of the game (default: directory of the savegame)")
+    options = parser.parse_args(args)
+
+    with History(options.database) as history:
+        for filename in batch.find_savegames(options.paths):
+            try:
+                if history.ingest_file(filename, options.game) is None:
+                    sys.stderr.write("{}: already stored\n".format(filename))
+            except Exception as e:
+                sys.stderr.write("{}: {}: {}\n".format(filename, type(e).__name__, e))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+    On-disk cache of parsed savegames.
+
+    usage: parsecache.py [-s MB] [--clear] DIRECTORY
+
+    The command removes the entries of old schema versions and the least recently used entries above MB (default: 256)
+    or, with --clear, all entries, and prints the number and size of the remaining entries.
+
+    The entries are savegames pickled section by section in a directory. A loaded entry only unpickles the header, the
+    sections are unpickled on first access, so a warm load doesn't create any record objects (see CachedSavegame). An entry is found by the hash of the savegame bytes, the schema
+    version and the options which change the parsed objects (slots, map arrays, codes). The schema version is a hash of
+    the format declaration and of the source of reader.py and tools.py, so any change of a bean or a reader makes the
+    old entries unreachable; they are removed when a cache is opened.
+"""
+import os
+import argparse
+import pickle
+import hashlib
+import inspect
+import functools
+
+import reader
+import tools
+
+
+def describe(node):
+    """Returns a text which describes a reader and all its child readers."""
+    if isinstance(node, reader.CompiledBean):
+        node = node.bean
+    if isinstance(node, reader.Bean):
+        fields = ", ".join("{}={}".format(name, describe(child)) for name, child in node.reader.items())
+        return "{}({})".format(node.factory.__qualname__, fields)
+    if isinstance(node, reader.Loop):
+        return "Loop({}, {})".format("?" if callable(node.count) else node.count, describe(node.reader))
+    if isinstance(node, reader.Lookup):
+        return "{}({!r}, {}, {!r})".format(type(node).__name__, node.array, describe(node.reader), node.default)
+    attributes = ", ".join("{}={!r}".format(name, value) for name, value in sorted(vars(node).items()) if not callable(value))
+    return "{}({})".format(type(node).__name__, attributes)
+
+
+@functools.lru_cache(maxsize=None)
+def schema_version():
+    """Returns the hash of the format declaration and of the code which creates the parsed objects."""
+    digest = hashlib.sha256(describe(reader.format).encode("utf-8"))
+    for module in [reader, tools]:
+        digest.update(inspect.getsource(module).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+class CachedSavegame(reader.Savegame):
+
+    """
+        Savegame of a cache entry. The header values are set when the entry is loaded, the sections (the loops of
+        records and the map) are unpickled on first access.
+    """
+
+    def __init__(self, header, sections):
+        vars(self).update(header)
+        self.pickled_sections = sections
+
+    def __getattr__(self, name):
+        # only called when the attribute is not set yet
+        sections = self.__dict__.get("pickled_sections", {})
+        if name not in sections:
+            raise AttributeError(name)
+        value = pickle.loads(sections[name])
+        setattr(self, name, value)
+        sections.pop(name, None)
+        return value
+
+
+def dump_entry(savegame):
+    """Returns the bytes of a cache entry: the header values and every section pickled on its own."""
+    header = {}
+    sections = {}
+    for name, field in reader.format.reader.items():
+        if reader.LazySavegame.is_section(field):
+            sections[name] = pickle.dumps(getattr(savegame, name), protocol=pickle.HIGHEST_PROTOCOL)
+        else:
+            header[name] = getattr(savegame, name)
+    return pickle.dumps((header, sections), protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_entry(data):
+    return CachedSavegame(*pickle.loads(data))
+
+
+class ParseCache(tools.DiskCache):
+
+    """
+        Directory of pickled savegames with a limit of its total size. When the limit is exceeded, the least recently
+        used entries are removed.
+    """
+
+    SUFFIX = ".pickle"
+
+    def __init__(self, directory, max_size=256 * 1024 * 1024):
+        super().__init__(directory, max_size)
+        self.schema = schema_version()
+        self.prune()
+
+    def path(self, content_hash, map_arrays, slots, codes=False):
+        options = ("a" if map_arrays else "") + ("s" if slots else "") + ("c" if codes else "")
+        return os.path.join(self.directory, "{}-{}-{}{}".format(content_hash, self.schema, options, self.SUFFIX))
+
+    def parse(self, data, compiled=True, map_arrays=False, slots=False, codes=False):
+        """
+            Returns the savegame parsed from :data, from the cache if possible: a CachedSavegame, whose sections are
+            unpickled on first access. :compiled is only used on a miss.
+        """
+        path = self.path(hashlib.blake2b(data, digest_size=20).hexdigest(), map_arrays, slots, codes)
+        try:
+            savegame = load_entry(self.load(path))
+            self.hits += 1
+            return savegame
+        except FileNotFoundError:
+            pass
+        except Exception:
+            # a truncated or otherwise unreadable entry is replaced
+            self.remove(path)
+        self.misses += 1
+        savegame = reader.parse_savegame(data, compiled, map_arrays, slots, codes)
+        self.store(path, dump_entry(savegame))
+        return savegame
+
+    def prune(self):
+        """Removes the entries of other schema versions."""
+        for _, _, path in self.entries():
+            if os.path.basename(path).split("-")[1] != self.schema:
+                self.remove(path)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Clean up a cache of parsed savegames.")
+    parser.add_argument("directory")
+    parser.add_argument("-s", "--max-size", type=int, default=256, help="size of the cache in MB (default: 256)")
+    parser.add_argument("--clear", action="store_true", help="remove all entries")
+    options = parser.parse_args(args)
+
+    cache = ParseCache(options.directory, options.max_size * 1024 * 1024)
+    if options.clear:
+        for _, _, path in cache.entries():
+            cache.remove(path)
+    cache.evict()
+    print("{} entries, {:.1f} MB".format(len(cache.entries()), cache.size() / (1024 * 1024)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+    Measures the time, the bytes and the number of reads of every bean field and loop element while reading a savegame.
+
+    usage: profiling.py [--compiled] [--json FILE] [--collapsed FILE] SAVEGAME
+
+    The report is a tree of the fields: the elements of a loop are merged into one "[]" block, so the fields of all
+    units are summed up in "units/[]/<field>". The times include the times of the childs, "self" is the time without
+    them. --collapsed writes the self times in microseconds as collapsed stacks for flamegraph tools.
+"""
+import sys
+import json
+import time
+import argparse
+
+import reader
+import tools
+
+
+class ProfileBlock(tools.Block):
+
+    """
+        Block of all reads of a reader at the same position in the tree. start and end are the positions of the first
+        and the last byte read.
+    """
+
+    def __init__(self, name, start=None):
+        super().__init__(name, start)
+        self.time = 0.0
+        self.bytes = 0
+        self.count = 0
+        self.childs = {}
+
+    def child(self, name):
+        block = self.childs.get(name)
+        if block is None:
+            block = ProfileBlock(name)
+            self.childs[name] = block
+            self.blocks.append(block)
+        return block
+
+    def add(self, elapsed, start, end):
+        if self.start is None or start < self.start:
+            self.start = start
+        self.end = max(self.end or 0, end)
+        self.time += elapsed
+        self.bytes += end - start
+        self.count += 1
+
+    @property
+    def self_time(self):
+        return self.time - sum(block.time for block in self.blocks)
+
+
+class Profile:
+
+    """
+        Collects the measurements of a read. Set it as profile of the context before reading.
+    """
+
+    def __init__(self, name="savegame"):
+        self.root = ProfileBlock(name, 0)
+        self.stack = [self.root]
+
+    def measure(self, name, read, context):
+        """Calls read(context) and adds the time and the bytes it consumed to the block :name of the current block."""
+        block = self.stack[-1].child(name)
+        self.stack.append(block)
+        start = context.tell()
+        started = time.perf_counter()
+        try:
+            return read(context)
+        finally:
+            block.add(time.perf_counter() - started, start, context.tell())
+            self.stack.pop()
+
+    def finish(self):
+        """Sets time, bytes and count of the root block to the sums of its childs."""
+        blocks = self.root.blocks
+        self.root.time = sum(block.time for block in blocks)
+        self.root.bytes = sum(block.bytes for block in blocks)
+        self.root.end = max([block.end for block in blocks], default=0)
+        self.root.count = 1
+        return self
+
+    def to_dict(self):
+        """Returns the tree as nested dicts with name, time, self_time, bytes, count, start, end and blocks."""
+        result = []
+        # the dict of the last visited block per depth
+        parents = []
+
+        def visit(block, depth):
+            node = {
+                "name": block.name,
+                "time": block.time,
+                "self_time": block.self_time,
+                "bytes": block.bytes,
+                "count": block.count,
+                "start": block.start,
+                "end": block.end,
+                "blocks": [],
+            }
+            del parents[depth:]
+            (parents[-1]["blocks"] if parents else result).append(node)
+            parents.append(node)
+
+        tools.visit_tree(self.root, tools.Block.get_childs, visit)
+        return result[0]
+
+    def write_json(self, file):
+        json.dump(self.to_dict(), file, indent=1)
+
+    def write_collapsed(self, file):
+        """Writes a "root;child;grandchild <self time in us>" line per block."""
+        path = []
+
+        def visit(block, depth):
+            del path[depth:]
+            path.append(block.name.replace(";", ","))
+            micros = int(round(block.self_time * 1e6))
+            if micros > 0:
+                file.write("{} {}\n".format(";".join(path), micros))
+
+        tools.visit_tree(self.root, tools.Block.get_childs, visit)
+
+    def write_report(self, file):
+        file.write("{:<48} {:>8} {:>10} {:>10} {:>10}\n".format("reader", "count", "bytes", "ms", "self ms"))
+
+        def visit(block, depth):
+            file.write("{:<48} {:>8} {:>10} {:>10.3f} {:>10.3f}\n".format(
+                "  " * depth + block.name, block.count, block.bytes, block.time * 1000, block.self_time * 1000))
+
+        tools.visit_tree(self.root, tools.Block.get_childs, visit)
+
+
+def profile_savegame(data, compiled=False):
+    """Reads a savegame from a buffer with a profile. Returns the savegame and the profile."""
+    context = reader.BufferContext(data)
+    context.profile = Profile()
+    try:
+        savegame = reader.get_format(compiled, False).read(context)
+    finally:
+        context.release()
+    return savegame, context.profile.finish()
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Profile reading a savegame.")
+    parser.add_argument("savegame")
+    parser.add_argument("--compiled", action="store_true", help="read with the compiled format")
+    parser.add_argument("--json", metavar="FILE", help="write the tree as JSON")
+    parser.add_argument("--collapsed", metavar="FILE", help="write collapsed stacks for flamegraph tools")
+    options = parser.parse_args(args)
+
+    with open(options.savegame, "rb") as file:
+        _, profile = profile_savegame(file.read(), options.compiled)
+    profile.write_report(sys.stdout)
+    if options.json:
+        with open(options.json, "w") as file:
+            profile.write_json(file)
+    if options.collapsed:
+        with open(options.collapsed, "w") as file:
+            profile.write_collapsed(file)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+    Tile pyramid of the map of a savegame for zoomable viewers.
+
+    usage: pyramid.py [-o OUTPUT] [-c CACHE] [--images DIRECTORY] [-z ZOOM ...] SAVEGAME
+
+    The command writes the image tiles of the zoom levels (default: all) to OUTPUT/<zoom>/<x>/<y>.png (default: tiles).
+
+    The images are TILE_PIXELS x TILE_PIXELS. At the highest zoom level (max_zoom()) a pixel is a pixel of render.py, at
+    every lower level the map is scaled down by 2 and level 0 shows the whole map in one image. Images are generated on
+    demand: the highest level is rendered from the tiles of the map it covers, the lower levels are scaled down from
+    their 4 images of the next level.
+
+    Images are cached in a directory, keyed by zoom, x, y and the hash of the map data they show (with the neighbours
+    which change the forest and mountain sprites), so images whose part of the map didn't change since the last turn are
+    taken from the cache.
+"""
+import io
+import os
+import hashlib
+import argparse
+
+from PIL import Image
+
+import tools
+import reader
+import render
+
+
+TILE_PIXELS = 256
+
+# tiles of the map per image at the highest zoom level
+MAP_TILES = TILE_PIXELS // render.TILE_SIZE
+
+
+def max_zoom(map_size):
+    """Returns the zoom level which shows the map in the resolution of render.py."""
+    zoom = 0
+    while MAP_TILES << zoom < max(map_size.x, map_size.y):
+        zoom += 1
+    return zoom
+
+
+def tile_span(map_size, zoom):
+    """Returns the number of tiles of the map in the width and height of an image of the zoom level."""
+    return MAP_TILES << (max_zoom(map_size) - zoom)
+
+
+def tile_count(map_size, zoom):
+    """Returns the number of images (columns, rows) of a zoom level."""
+    span = tile_span(map_size, zoom)
+    return -(-map_size.x // span), -(-map_size.y // span)
+
+
+def region_hash(map_data, map_size, x1, y1, x2, y2):
+    """Returns the hash of the map data which determines the pixels of the tiles x1 <= x < x2, y1 <= y < y2."""
+    # the sprites of forests and mountains depend on the neighbours
+    x1, y1 = max(x1 - 1, 0), max(y1 - 1, 0)
+    x2, y2 = min(x2 + 1, map_size.x), min(y2 + 1, map_size.y)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update("{}x{}:{},{}".format(map_size.x, map_size.y, x1, y1).encode("ascii"))
+    for row in map_data[y1:y2]:
+        digest.update(row[x1:x2])
+    return digest.hexdigest()
+
+
+def atlas_digest(atlas):
+    """Returns a hash of the sprites of an atlas, images rendered with other sprites are not reused."""
+    digest = hashlib.blake2b(digest_size=8)
+    for group, key, _ in render.sprite_names():
+        digest.update(atlas.sprites[group][key].tobytes())
+    return digest.hexdigest()
+
+
+def to_png(image):
+    output = io.BytesIO()
+    image.save(output, "PNG")
+    return output.getvalue()
+
+
+class TilePyramid(tools.DiskCache):
+
+    """
+        Generates and caches the images of the zoom levels. The cache directory is limited to :max_size bytes, the least
+        recently used images are removed when it is exceeded.
+    """
+
+    SUFFIX = ".png"
+
+    def __init__(self, directory, atlas=None, max_size=256 * 1024 * 1024):
+        super().__init__(directory, max_size)
+        self.atlas = atlas or render.get_atlas()
+        self.sprites = atlas_digest(self.atlas)
+
+    def path(self, map, zoom, x, y):
+        map_size = map.map_size
+        span = tile_span(map_size, zoom)
+        content = region_hash(map.map_data, map_size, x * span, y * span, (x + 1) * span, (y + 1) * span)
+        return os.path.join(self.directory, "{}-{}-{}-{}-{}{}".format(zoom, x, y, self.sprites, content, self.SUFFIX))
+
+    def tile(self, map, zoom, x, y):
+        """Returns the PNG of an image of a zoom level. Raises IndexError for images outside of the map."""
+        if not 0 <= zoom <= max_zoom(map.map_size):
+            raise IndexError("no zoom level {}".format(zoom))
+        columns, rows = tile_count(map.map_size, zoom)
+        if not (0 <= x < columns and 0 <= y < rows):
+            raise IndexError("no tile {}/{}/{}".format(zoom, x, y))
+        path = self.path(map, zoom, x, y)
+        try:
+            png = self.load(path)
+            self.hits += 1
+            return png
+        except FileNotFoundError:
+            pass
+        self.misses += 1
+        png = to_png(self.build(map, zoom, x, y))
+        self.store(path, png)
+        return png
+
+    def image(self, map, zoom, x, y):
+        return Image.open(io.BytesIO(self.tile(map, zoom, x, y)))
+
+    def build(self, map, zoom, x, y):
+        map_size = map.map_size
+        image = Image.new("RGBA", (TILE_PIXELS, TILE_PIXELS))
+        if zoom == max_zoom(map_size):
+            x1, y1 = x * MAP_TILES, y * MAP_TILES
+            x2, y2 = min(x1 + MAP_TILES, map_size.x), min(y1 + MAP_TILES, map_size.y)
+            image.paste(render.render_region(map, map_size, x1, y1, x2, y2, self.atlas), (0, 0))
+            return image
+
+        columns, rows = tile_count(map_size, zoom + 1)
+        children = Image.new("RGBA", (2 * TILE_PIXELS, 2 * TILE_PIXELS))
+        for dy in range(2):
+            for dx in range(2):
+                if 2 * x + dx < columns and 2 * y + dy < rows:
+                    children.paste(self.image(map, zoom + 1, 2 * x + dx, 2 * y + dy), (dx * TILE_PIXELS, dy * TILE_PIXELS))
+        return children.reduce(2)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Write the tile pyramid of the map of a savegame.")
+    parser.add_argument("savegame")
+    parser.add_argument("-o", "--output", default="tiles", help="output directory (default: tiles)")
+    parser.add_argument("-c", "--cache", default=".tile-cache", help="cache directory (default: .tile-cache)")
+    parser.add_argument("--images", default=render.IMAGES_DIRECTORY, help="directory of the sprites (default: images)")
+    parser.add_argument("-z", "--zoom", type=int, nargs="+", help="zoom levels (default: all)")
+    options = parser.parse_args(args)
+
+    savegame = reader.read_savegame(options.savegame, compiled=True)
+    pyramid = TilePyramid(options.cache, render.get_atlas(options.images))
+    levels = options.zoom if options.zoom is not None else range(max_zoom(savegame.map_size) + 1)
+    for zoom in levels:
+        columns, rows = tile_count(savegame.map_size, zoom)
+        for x in range(columns):
+            os.makedirs(os.path.join(options.output, str(zoom), str(x)), exist_ok=True)
+            for y in range(rows):
+                with open(os.path.join(options.output, str(zoom), str(x), "{}.png".format(y)), "wb") as file:
+                    file.write(pyramid.tile(savegame.map, zoom, x, y))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,17 @@
 import os
 import sys
 import json
+import mmap
+import struct
+import collections.abc
+import functools
 
 import tools
 
-from PIL import Image
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 ORDERS = [
@@ -199,6 +206,9 @@ TERRAIN_NON_LAND = {
     2: "terrain/0A sealane.png", 
 }
 
+# value of Colony.tile_usage for a tile no colonist works on
+NO_COLONIST = 0xFF
+
 RIVER_START = 0
 MOUNTAIN_START = 32
 HILL_START = 48
@@ -209,15 +219,184 @@ COAST_FOG_OF_WAR = 112
 COAST = 150
 
 
+# codes of the lookup tables, read instead of the names with codes=True
+
+
+class Order(tools.Code):
+    names = ORDERS
+
+
+class Control(tools.Code):
+    names = CONTROL
+
+
+class Difficulty(tools.Code):
+    names = DIFFICULTY
+
+
+class Occupation(tools.Code):
+    names = OCCUPATIONS
+
+
+class Building(tools.Code):
+    names = BUILDINGS
+
+
+class Goods(tools.Code):
+    names = GOODS
+
+
+class Nation(tools.Code):
+    names = NATIONS
+
+
+class UnitType(tools.Code):
+    names = UNITS
+
+
+class FoundingFather(tools.Code):
+    names = FOUNDING_FATHERS
+
+
+# codes of lookups with a default name for the values which are not in the table
+
+
+class Production(Building):
+    default = BUILDINGS[-1]
+
+
+class Mission(Nation):
+    default = "none"
+
+
+class CurrentFoundingFather(FoundingFather):
+    default = "none"
+
+
+def code_type(array, default=None):
+    """Returns the Code class of a lookup table and default name, None if there is none."""
+    classes = list(tools.Code.__subclasses__())
+    for cls in classes:
+        if cls.names is array and cls.default == default:
+            return cls
+        classes.extend(cls.__subclasses__())
+    return None
+
+
+def name_index(names, value):
+    """Returns the index of a name in a lookup table. Codes and other numbers are the index themselves."""
+    return value if isinstance(value, int) else names.index(value)
+
+
+BYTE = struct.Struct("<B")
+SHORT = struct.Struct("<h")
+WORD = struct.Struct("<H")
+INT = struct.Struct("<i")
+
+
 class Context:
+
+    """
+     Read position in a savegame file and the stack of objects which are currently read.
+    """
+
     def __init__(self, file):
         self.file = file
         self.objects = []
+        # decode the map into numpy arrays instead of Tile objects
+        self.map_arrays = False
+        # read the values of lookup tables as tools.Code instead of names
+        self.codes = False
+        # profiling.Profile which measures the readers of bean fields and loop elements, None to read without measuring
+        self.profile = None
+
+    def read(self, size):
+        """Returns the next :size bytes."""
+        return self.file.read(size)
+
+    def unpack(self, struct):
+        """Unpacks the next struct.size bytes with the struct and returns the tuple of values."""
+        return struct.unpack(self.file.read(struct.size))
+
+    def tell(self):
+        return self.file.tell()
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        return self.file.seek(offset, whence)
+
+
+class BufferContext(Context):
+
+    """
+     Reads from a buffer (bytes, bytearray, mmap or memoryview) with an integer cursor. Numbers are unpacked directly at
+     the cursor position, no intermediate bytes objects are created.
+    """
+
+    def __init__(self, data):
+        super().__init__(None)
+        self.buffer = memoryview(data)
+        self.offset = 0
+
+    def read(self, size):
+        start = self.offset
+        self.offset = start + size
+        return self.buffer[start:self.offset]
+
+    def unpack(self, struct):
+        values = struct.unpack_from(self.buffer, self.offset)
+        self.offset += struct.size
+        return values
+
+    def tell(self):
+        return self.offset
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self.offset
+        elif whence == os.SEEK_END:
+            offset += len(self.buffer)
+        self.offset = offset
+        return offset
+
+    def release(self):
+        """Releases the buffer, i.e. to be able to close an underlying mmap."""
+        self.buffer.release()
+
+
+class Layout:
+
+    """
+     Describes how a fixed size reader is stored in a struct: the format characters, the number of values unpacked by
+     these characters and an optional function convert(value, context) to create the final value. The value passed to
+     convert is the unpacked value itself when count is 1, otherwise the tuple of the unpacked values.
+    """
+
+    def __init__(self, format, count=1, convert=None):
+        self.format = format
+        self.count = count
+        self.convert = convert
 
 
 class Tell:
     def read(self, context):
-        return context.file.tell()
+        return context.tell()
+
+    def compile(self):
+        return None
+
+    def size(self, context):
+        return 0
+
+    def encode(self, value, original):
+        return b""
+
+
+def decode_string(data):
+    string = str(data, "utf-8")
+    first_nul = string.find("\0")
+    if first_nul >= 0:
+        return string[:first_nul]
+    return string
 
 
 class String:
@@ -225,11 +404,16 @@ class String:
         self.length = length
 
     def read(self, context):
-        string = context.file.read(self.length).decode("utf-8")
-        first_nul = string.find("\0")
-        if first_nul >= 0:
-            return string[:first_nul]
-        return string
+        return decode_string(context.read(self.length))
+
+    def compile(self):
+        return Layout("{}s".format(self.length), convert=lambda data, _: decode_string(data))
+
+    def encode(self, value, original):
+        data = value.encode("utf-8")
+        if len(data) > self.length:
+            raise ValueError("string {!r} is longer than {} bytes".format(value, self.length))
+        return data + bytes(self.length - len(data))
 
 
 class Bits:
@@ -243,8 +427,14 @@ class Bits:
         self.num_bits = num_bits
 
     def read(self, context):
-        bytes = context.file.read(self.num_bytes)
-        return list(tools.stream_bits(bytes, self.num_bits))
+        bytes = context.read(self.num_bytes)
+        return tools.unpack_bits(bytes, self.num_bits)
+
+    def compile(self):
+        return Layout("{}s".format(self.num_bytes), convert=lambda data, _: tools.unpack_bits(data, self.num_bits))
+
+    def encode(self, value, original):
+        return tools.pack_bits(value, self.num_bits, self.num_bytes)
 
 
 class Skip:
@@ -252,12 +442,24 @@ class Skip:
         self.bytes = bytes
 
     def read(self, context):
-        return context.file.seek(bytes, os.SEEK_CUR)
+        return context.seek(self.bytes, os.SEEK_CUR)
+
+    def compile(self):
+        return Layout("{}x".format(self.bytes), count=0)
+
+    def encode(self, value, original):
+        return bytes(original)
 
 
 class Byte:
     def read(self, context):
-        return tools.readu8(context.file)
+        return context.unpack(BYTE)[0]
+
+    def compile(self):
+        return Layout("B")
+
+    def encode(self, value, original):
+        return BYTE.pack(value)
 
 
 class Bytes:
@@ -265,24 +467,50 @@ class Bytes:
         self.length = length
 
     def read(self, context):
-        return context.file.read(self.length)
+        return bytes(context.read(self.length))
+
+    def compile(self):
+        return Layout("{}s".format(self.length))
+
+    def encode(self, value, original):
+        if len(value) != self.length:
+            raise ValueError("expected {} bytes, got {}".format(self.length, len(value)))
+        return bytes(value)
 
 
 class Short:
 
     def read(self, context):
-        return tools.read16(context.file)
+        return context.unpack(SHORT)[0]
+
+    def compile(self):
+        return Layout("h")
+
+    def encode(self, value, original):
+        return SHORT.pack(value)
 
 
 class Word:
     def read(self, context):
-        return tools.readu16(context.file)
+        return context.unpack(WORD)[0]
+
+    def compile(self):
+        return Layout("H")
+
+    def encode(self, value, original):
+        return WORD.pack(value)
 
 
 class Int:
 
     def read(self, context):
-        return tools.read32(context.file)
+        return context.unpack(INT)[0]
+
+    def compile(self):
+        return Layout("i")
+
+    def encode(self, value, original):
+        return INT.pack(value)
 
 
 class Lookup:
@@ -290,9 +518,16 @@ class Lookup:
         self.array = array
         self.reader = reader
         self.default = default
+        self.code_type = code_type(array, default)
+        # the Codes of the indices of the array
+        self.codes = self.code_type.values if self.code_type is not None else []
 
     def read(self, context):
-        index = self.reader.read(context)
+        return self.convert(self.reader.read(context), context)
+
+    def convert(self, index, context):
+        if context.codes:
+            return self.code(index)
         return self.lookup_index(self.default, index)
 
     def lookup_index(self, default, index):
@@ -305,28 +540,124 @@ class Lookup:
         except KeyError:
             return default
 
+    def lookup(self, index):
+        return self.lookup_index(self.default, index)
+
+    def code(self, index):
+        """Returns the Code of an index. Indices which are not in the array get a Code of their own."""
+        try:
+            return self.codes[index]
+        except IndexError:
+            if self.code_type is None:
+                return self.lookup_index(self.default, index)
+            return self.code_type.of(index)
+
+    def compile(self):
+        layout = self.reader.compile()
+        if layout is None:
+            return None
+        return Layout(layout.format, layout.count, chain_convert(layout.convert, self.convert))
+
+    def index(self, value):
+        """Returns the index of a value in the array. Numbers which are not in the array are returned as they are."""
+        items = self.array.items() if isinstance(self.array, dict) else enumerate(self.array)
+        for index, item in items:
+            if item == value:
+                return index
+        if isinstance(value, int):
+            return value
+        raise ValueError("{!r} is not a known value".format(value))
+
+    def encode(self, value, original):
+        return self.reader.encode(self.index(value), original)
+
 
 class LookupList(Lookup):
-    def read(self, context):
-        index_list = self.reader.read(context)
+    def convert(self, index_list, context):
+        if context.codes:
+            return self.code(index_list)
+        return self.lookup(index_list)
+
+    def lookup(self, index_list):
         return [self.lookup_index(self.default, index) for index in index_list]
 
+    def code(self, index_list):
+        code = super().code
+        return [code(index) for index in index_list]
+
+    def encode(self, value, original):
+        return self.reader.encode([self.index(item) for item in value], original)
+
+
+def chain_convert(convert, function):
+    """Returns a convert function which applies function(value, context) to the result of convert."""
+    if convert is None:
+        return function
+    return lambda value, context: function(convert(value, context), context)
+
 
 class Loop:
-    def __init__(self, count_function, reader):
-        self.count_function = count_function
+
+    """
+     Reads :count elements with :reader. count is either a number or a function which calculates the number of elements
+     from the context.
+    """
+
+    def __init__(self, count, reader):
+        self.count = count
         self.reader = reader
 
+    def count_elements(self, context):
+        if callable(self.count):
+            return self.count(context)
+        return self.count
+
+    def size(self, context):
+        return self.count_elements(context) * reader_size(self.reader, context)
+
     def read(self, context):
         result = []
+        read = self.reader.read
+        if context.profile is not None:
+            read = functools.partial(context.profile.measure, "[]", read)
 
-        for i in range(self.count_function(context)):
+        for i in range(self.count_elements(context)):
             context.loop_index = i
-            result.append(self.reader.read(context))
+            result.append(read(context))
 
         context.loop_index = -1
         return result
 
+    def compile(self):
+        if callable(self.count):
+            return None
+        layout = self.reader.compile()
+        if layout is None:
+            return None
+        count = self.count
+        element_count = layout.count
+        element_convert = layout.convert
+        if element_count == 1 and element_convert is None:
+            return Layout(layout.format * count, count, lambda values, _: list(values))
+
+        def convert(values, context):
+            result = []
+            for i in range(count):
+                context.loop_index = i
+                value = values[i] if element_count == 1 else values[i * element_count:(i + 1) * element_count]
+                result.append(element_convert(value, context) if element_convert else value)
+            context.loop_index = -1
+            return result
+
+        return Layout(layout.format * count, element_count * count, convert)
+
+    def encode(self, value, original):
+        element_size = reader_size(self.reader, None)
+        if len(value) * element_size != len(original):
+            raise ValueError("expected {} elements, got {}".format(len(original) // element_size, len(value)))
+        return b"".join(encode_value(self.reader, element, original[index * element_size:(index + 1) * element_size])
+                        for index, element in enumerate(value))
+
 
 class Bean:
     def __init__(self, factory, **kwargs):
@@ -334,6 +665,9 @@ class Bean:
         self.reader = kwargs
 
     def read(self, context):
+        profile = context.profile
+        if profile is not None:
+            return self.read_profiled(context, profile)
         bean = self.factory()
         context.objects.append(bean)
         for name, reader in self.reader.items():
@@ -347,6 +681,279 @@ class Bean:
 
         return bean
 
+    def read_profiled(self, context, profile):
+        bean = self.factory()
+        context.objects.append(bean)
+        for name, reader in self.reader.items():
+            setattr(bean, name, profile.measure(name, reader.read, context))
+
+        context.objects.pop()
+        if hasattr(bean, 'after_read'):
+            profile.measure("after_read", bean.after_read, context)
+
+        return bean
+
+    def compile(self):
+        fields = FixedFields.create(self.reader.items())
+        if fields is None:
+            return None
+        return Layout(fields.format, fields.count, fields.create_bean(self.factory))
+
+    def read_fields(self, context):
+        """Returns the values of the fields as they are read, without creating the bean."""
+        return {name: reader.read(context) for name, reader in self.reader.items()}
+
+    def encode(self, bean, original):
+        """
+            Returns the bytes of a bean with fixed size. :original are the bytes the bean was read from. Fields whose
+            values didn't change keep their original bytes. If the bean has a before_write(fields) method, it gets the
+            fields read from original and returns the values of the fields which are derived by after_read().
+        """
+        values = {}
+        if hasattr(bean, "before_write"):
+            values = bean.before_write(self.read_fields(BufferContext(original)))
+        result = []
+        offset = 0
+        for name, reader in self.reader.items():
+            size = reader_size(reader, None)
+            value = values[name] if name in values else getattr(bean, name)
+            result.append(encode_value(reader, value, original[offset:offset + size]))
+            offset += size
+        return b"".join(result)
+
+
+class FixedFields:
+
+    """
+     Consecutive fixed size fields of a bean, which are unpacked with a single struct.
+    """
+
+    def __init__(self):
+        self.format = ""
+        self.count = 0
+        # list of (name, index of first value, number of values, convert function)
+        self.fields = []
+        self.struct = None
+
+    @staticmethod
+    def create(readers):
+        """Returns the FixedFields for (name, reader) pairs or None when one of the readers has no fixed size."""
+        fields = FixedFields()
+        for name, reader in readers:
+            layout = reader.compile()
+            if layout is None:
+                return None
+            fields.add(name, layout)
+        return fields
+
+    @property
+    def name(self):
+        """Name of the fields, i.e. for profiling: "first..last"."""
+        if len(self.fields) == 1:
+            return self.fields[0][0]
+        return "{}..{}".format(self.fields[0][0], self.fields[-1][0])
+
+    def add(self, name, layout):
+        self.fields.append((name, self.count, layout.count, layout.convert))
+        self.format += layout.format
+        self.count += layout.count
+        self.struct = None
+
+    def assign(self, bean, values, context):
+        for name, index, count, convert in self.fields:
+            value = values[index] if count == 1 else values[index:index + count]
+            if convert is not None:
+                value = convert(value, context)
+            setattr(bean, name, value)
+
+    def create_bean(self, factory):
+        def convert(values, context):
+            bean = factory()
+            self.assign(bean, values, context)
+            if hasattr(bean, 'after_read'):
+                bean.after_read(context)
+            return bean
+        return convert
+
+    def read(self, context, bean):
+        if self.struct is None:
+            self.struct = struct.Struct("<" + self.format)
+        values = context.unpack(self.struct)
+        self.assign(bean, values, context)
+
+
+class CompiledBean:
+
+    """
+     Reads the same objects as a Bean, but unpacks all consecutive fixed size fields with one precompiled struct.
+     Fields without a fixed size are still read by their reader.
+    """
+
+    def __init__(self, bean):
+        self.bean = bean
+        self.factory = bean.factory
+        self.reader = {name: compile_reader(reader) for name, reader in bean.reader.items()}
+        # list of FixedFields and (name, reader) pairs
+        self.segments = []
+        fields = None
+        for name, reader in bean.reader.items():
+            layout = reader.compile()
+            if layout is None:
+                fields = None
+                self.segments.append((name, self.reader[name]))
+            else:
+                if fields is None:
+                    fields = FixedFields()
+                    self.segments.append(fields)
+                fields.add(name, layout)
+
+    def compile(self):
+        return self.bean.compile()
+
+    def encode(self, bean, original):
+        return self.bean.encode(bean, original)
+
+    def read(self, context):
+        profile = context.profile
+        if profile is not None:
+            return self.read_profiled(context, profile)
+        bean = self.factory()
+        context.objects.append(bean)
+        for segment in self.segments:
+            if isinstance(segment, FixedFields):
+                segment.read(context, bean)
+            else:
+                name, reader = segment
+                setattr(bean, name, reader.read(context))
+
+        context.objects.pop()
+        if hasattr(bean, 'after_read'):
+            bean.after_read(context)
+
+        return bean
+
+    def read_profiled(self, context, profile):
+        bean = self.factory()
+        context.objects.append(bean)
+        for segment in self.segments:
+            if isinstance(segment, FixedFields):
+                profile.measure(segment.name, functools.partial(segment.read, bean=bean), context)
+            else:
+                name, reader = segment
+                setattr(bean, name, profile.measure(name, reader.read, context))
+
+        context.objects.pop()
+        if hasattr(bean, 'after_read'):
+            profile.measure("after_read", bean.after_read, context)
+
+        return bean
+
+
+class Record:
+
+    """
+        Base class of the slotted record classes created by record_class().
+    """
+
+    __slots__ = ()
+
+    def __repr__(self):
+        values = ("{}={!r}".format(name, getattr(self, name)) for name in self.__slots__ if hasattr(self, name))
+        return "{}({})".format(type(self).__name__, ", ".join(values))
+
+
+def record_class(bean):
+    """
+        Returns a class with __slots__ for the fields of :bean and the fields listed in DERIVED of its factory, which
+        are set by after_read(). The methods of the factory are copied to the class. The class is stored as
+        Record attribute of the factory so that its instances can be pickled.
+    """
+    factory = bean.factory
+    if "Record" in vars(factory):
+        return factory.Record
+    slots = tuple(dict.fromkeys(list(bean.reader) + list(getattr(factory, "DERIVED", []))))
+    excluded = {"__init__", "__dict__", "__weakref__", "__slots__", "__qualname__"}
+    namespace = {name: value for name, value in vars(factory).items() if name not in excluded and name not in slots}
+    namespace["__slots__"] = slots
+    cls = type(factory.__name__, (Record,), namespace)
+    cls.__qualname__ = factory.__qualname__ + ".Record"
+    factory.Record = cls
+    return cls
+
+
+def slotted_reader(reader):
+    """
+        Returns a reader which reads the same objects as :reader, but creates the beans as instances of slotted record
+        classes.
+    """
+    if isinstance(reader, Bean):
+        return Bean(record_class(reader), **{name: slotted_reader(child) for name, child in reader.reader.items()})
+    if isinstance(reader, Loop):
+        return Loop(reader.count, slotted_reader(reader.reader))
+    return reader
+
+
+def encode_value(reader, value, original):
+    """
+        Returns the bytes of a value with the reader. When :original (the bytes the value was read from) is read as
+        the same value, it is returned unchanged, so values which can't be encoded unambiguously (i.e. lookups with a
+        default or strings with data after the terminator) are kept.
+    """
+    if not isinstance(reader, (Bean, CompiledBean, Loop, Map)) and reader.read(BufferContext(original)) == value:
+        return bytes(original)
+    return reader.encode(value, original)
+
+
+def reader_size(reader, context):
+    """Returns the number of bytes read by :reader. Readers without a fixed size calculate it from the context."""
+    layout = reader.compile()
+    if layout is not None:
+        return struct.calcsize("<" + layout.format)
+    return reader.size(context)
+
+
+def compile_reader(reader):
+    """
+        Returns a reader which reads the same objects as :reader, but with all beans replaced by CompiledBeans.
+    """
+    if isinstance(reader, Bean):
+        return CompiledBean(reader)
+    if isinstance(reader, Loop):
+        return Loop(reader.count, compile_reader(reader.reader))
+    return reader
+
+
+def numpy_dtype(reader):
+    """
+        Returns the numpy dtype of the bytes read by :reader, a structured dtype for beans with the fields in the order
+        of the declaration. Lookups have the dtype of their codes, strings are bytes strings and bits and other bytes
+        are uint8 arrays. Returns None for readers without a fixed size.
+    """
+    if isinstance(reader, CompiledBean):
+        reader = reader.bean
+    if isinstance(reader, Bean):
+        fields = []
+        for name, field in reader.reader.items():
+            dtype = numpy_dtype(field)
+            if dtype is None:
+                return None
+            fields.append((name, dtype))
+        return numpy.dtype(fields)
+    if isinstance(reader, Loop):
+        dtype = numpy_dtype(reader.reader)
+        if dtype is None or callable(reader.count):
+            return None
+        return numpy.dtype((dtype, (reader.count,)))
+    if isinstance(reader, Lookup):
+        return numpy_dtype(reader.reader)
+    if isinstance(reader, (Byte, Short, Word, Int)):
+        return numpy.dtype("<" + reader.compile().format)
+    if isinstance(reader, String):
+        return numpy.dtype("S{}".format(reader.length))
+    if isinstance(reader, (Bits, Bytes, Skip)):
+        return numpy.dtype((numpy.uint8, (reader_size(reader, None),)))
+    return None
+
 
 class Position(Bean):
     def __init__(self, reader=Byte()):
@@ -361,7 +968,13 @@ class Position(Bean):
 class ColonistType(Byte):
     def read(self, context):
         byte = super().read(context)
-        return OCCUPATIONS[byte]
+        return Occupation.of(byte) if context.codes else OCCUPATIONS[byte]
+
+    def compile(self):
+        return Layout("B", convert=lambda byte, context: Occupation.of(byte) if context.codes else OCCUPATIONS[byte])
+
+    def encode(self, value, original):
+        return BYTE.pack(name_index(OCCUPATIONS, value))
 
 
 class Player(Bean):
@@ -378,6 +991,8 @@ class Player(Bean):
 
 
 class Colonist():
+    __slots__ = ("occupation", "specialization", "time", "tile")
+
     def __serialize__(self):
         tile_string = ""
         if hasattr(self, "tile"):
@@ -386,6 +1001,9 @@ class Colonist():
 
 
 class Colony(Bean):
+    # fields set by after_read()
+    DERIVED = ["colonists", "buildings", "goods"]
+
     def __init__(self):
         super().__init__(
             Colony,
@@ -395,8 +1013,8 @@ class Colony(Bean):
             nation=Lookup(NATIONS, Byte()),
             dummy1=Bytes(4),
             colonists_num=Byte(),
-            colonists_occupation=Loop(lambda _: 32, ColonistType()),
-            colonists_specialization=Loop(lambda _: 32, ColonistType()),
+            colonists_occupation=Loop(32, ColonistType()),
+            colonists_specialization=Loop(32, ColonistType()),
             colonists_time=Bytes(16),
             tile_usage=Bytes(8),
             dummy2=Bytes(12),
@@ -406,7 +1024,7 @@ class Colony(Bean):
             hammers=Word(),
             current_production=Lookup(BUILDINGS, Byte(), BUILDINGS[-1]),
             dummy4=Bytes(5),
-            storage=Loop(lambda _: len(GOODS), Word()),
+            storage=Loop(len(GOODS), Word()),
             dummy5=Bytes(8),
             bells=Int(),
             data=Int(),
@@ -432,21 +1050,87 @@ class Colony(Bean):
         del self.colonists_time
         del self.tile_usage
 
-    def merge_buildings_data(self):
-        buildings_bits = list(tools.stream_bits(self.buildings_bitset))
-        self.buildings = [BUILDINGS[building_index] for building_index, build_flag in enumerate(buildings_bits) if build_flag == 1]
+    def merge_buildings_data(self, names):
+        self.buildings = [names[building_index] for building_index in tools.set_bit_indices(self.buildings_bitset)]
         del self.buildings_bitset
 
-    def merge_goods_data(self):
-        self.goods = {GOODS[goods_index]: goods_count for goods_index, goods_count in enumerate(self.storage)}
+    def merge_goods_data(self, codes):
+        if codes:
+            self.goods = {Goods.of(goods_index): goods_count for goods_index, goods_count in enumerate(self.storage)}
+            self.customs_house = [Goods.of(goods_index) for goods_index in tools.set_bit_indices(self.customs_house)]
+        else:
+            self.goods = {GOODS[goods_index]: goods_count for goods_index, goods_count in enumerate(self.storage)}
+            self.customs_house = [GOODS[goods_index] for goods_index in tools.set_bit_indices(self.customs_house)]
         del self.storage
-        customs_house_bits = list(tools.stream_bits(self.customs_house))
-        self.customs_house = [GOODS[goods_index] for goods_index, flag in enumerate(customs_house_bits) if flag == 1]
 
-    def after_read(self, _):
+    def after_read(self, context):
         self.merge_colonist_data()
-        self.merge_buildings_data()
-        self.merge_goods_data()
+        self.merge_buildings_data(Building.values if context.codes else BUILDINGS)
+        self.merge_goods_data(context.codes)
+
+    def split_colonist_data(self, fields):
+        occupation = list(fields["colonists_occupation"])
+        specialization = list(fields["colonists_specialization"])
+        time = bytearray(fields["colonists_time"])
+        for i, colonist in enumerate(self.colonists):
+            occupation[i] = colonist.occupation
+            specialization[i] = colonist.specialization
+            shift = 4 if i % 2 else 0
+            time[i // 2] = (time[i // 2] & (0xF0 >> shift)) | (colonist.time << shift)
+
+        tile_usage = bytearray(fields["tile_usage"])
+        tiles = [getattr(colonist, "tile", None) for colonist in self.colonists]
+        read_tiles = [None] * len(tiles)
+        for direction_index, colonist in enumerate(tile_usage):
+            if colonist < len(read_tiles):
+                read_tiles[colonist] = DIRECTIONS[direction_index]
+        # only touch the tile usage when the tiles of the colonists changed, a colonist may be listed on more tiles
+        if tiles != read_tiles:
+            for direction_index, colonist in enumerate(tile_usage):
+                if colonist < len(tiles) and tiles[colonist] != DIRECTIONS[direction_index]:
+                    tile_usage[direction_index] = NO_COLONIST
+            for colonist_index, tile in enumerate(tiles):
+                if tile is not None:
+                    tile_usage[DIRECTIONS.index(tile)] = colonist_index
+
+        return {
+            "colonists_num": len(self.colonists),
+            "colonists_occupation": occupation,
+            "colonists_specialization": specialization,
+            "colonists_time": bytes(time),
+            "tile_usage": bytes(tile_usage),
+            }
+
+    def split_buildings_data(self, fields):
+        read_indices = tools.set_bit_indices(fields["buildings_bitset"])
+        indices = []
+        for name in self.buildings:
+            if isinstance(name, int):
+                indices.append(name)
+                continue
+            # some buildings have the same name, keep the index they were read from
+            candidates = [index for index in read_indices if BUILDINGS[index] == name and index not in indices]
+            candidates += [index for index, building in enumerate(BUILDINGS) if building == name and index not in indices]
+            if not candidates:
+                raise ValueError("unknown building {!r}".format(name))
+            indices.append(candidates[0])
+        return {"buildings_bitset": tools.pack_bit_indices(indices, len(fields["buildings_bitset"]))}
+
+    def split_goods_data(self, fields):
+        storage = list(fields["storage"])
+        for goods, goods_count in self.goods.items():
+            storage[name_index(GOODS, goods)] = goods_count
+        return {
+            "storage": storage,
+            "customs_house": tools.pack_bit_indices([name_index(GOODS, name) for name in self.customs_house],
+                                                    len(fields["customs_house"])),
+            }
+
+    def before_write(self, fields):
+        values = self.split_colonist_data(fields)
+        values.update(self.split_buildings_data(fields))
+        values.update(self.split_goods_data(fields))
+        return values
 
     def __serialize__(self):
         return tools.object_attributes_to_ordered_dict(
@@ -470,6 +1154,9 @@ class Colony(Bean):
 
 
 class Unit(Bean):
+    # fields set by after_read()
+    DERIVED = ["id", "cargo", "nation", "dummy0"]
+
     def __init__(self):
         super().__init__(
             Unit,
@@ -500,13 +1187,36 @@ class Unit(Bean):
 
         self.cargo = [(cargo_type, self.cargo_amount[index]) for index, cargo_type in enumerate(self.cargo_types[:self.num_cargo])]
 
-        self.nation = NATIONS[self.nation_index & 15]
+        self.nation = Nation.of(self.nation_index & 15) if context.codes else NATIONS[self.nation_index & 15]
         self.dummy0 = self.nation_index >> 4
 
 #        del self.num_cargo
 #        del self.cargo_types
 #        del self.cargo_amount
 
+    def split_cargo(self):
+        """Returns num_cargo, cargo_types and cargo_amount with the cargo, when it was changed, in the first slots."""
+        num_cargo, cargo_types, cargo_amount = self.num_cargo, list(self.cargo_types), bytes(self.cargo_amount)
+        cargo = [tuple(item) for item in self.cargo]
+        if cargo != [(cargo_type, cargo_amount[index]) for index, cargo_type in enumerate(cargo_types[:num_cargo])]:
+            # the last amount is the number of tools of a pioneer, not a cargo slot
+            if len(cargo) > len(cargo_types) - 1:
+                raise ValueError("a unit carries at most {} cargos".format(len(cargo_types) - 1))
+            num_cargo = len(cargo)
+            cargo_types[:num_cargo] = [cargo_type for cargo_type, _ in cargo]
+            cargo_amount = bytes(amount for _, amount in cargo) + cargo_amount[num_cargo:]
+        return num_cargo, cargo_types, cargo_amount
+
+    def before_write(self, fields):
+        # cargo is derived from num_cargo, cargo_types and cargo_amount, these are written
+        num_cargo, cargo_types, cargo_amount = self.split_cargo()
+        if num_cargo > 0:
+            cargo_types[0], cargo_types[1] = cargo_types[1], cargo_types[0]
+            cargo_types[2], cargo_types[3] = cargo_types[3], cargo_types[2]
+            cargo_types[4], cargo_types[5] = cargo_types[5], cargo_types[4]
+        return {"num_cargo": num_cargo, "cargo_types": cargo_types, "cargo_amount": cargo_amount,
+                "nation_index": name_index(NATIONS, self.nation) | (self.dummy0 << 4)}
+
     def __serialize__(self):
         return tools.object_attributes_to_ordered_dict(
             self, [
@@ -522,12 +1232,15 @@ class Unit(Bean):
 
 
 class Europe(Bean):
+    # fields set by after_read()
+    DERIVED = ["founding_fathers"]
+
     def __init__(self):
         super().__init__(
             Europe,
             padding1=Bytes(1),
             tax_rate=Byte(),
-            next_recruits=Loop(lambda _: 3, Lookup(OCCUPATIONS, Byte()),),
+            next_recruits=Loop(3, Lookup(OCCUPATIONS, Byte()),),
             padding2=Bytes(2),
             founding_fathers_bitset=Bytes(4),
             padding3=Bytes(1),
@@ -542,27 +1255,24 @@ class Europe(Bean):
             current_crosses=Word(),
             needed_crosses=Word(),
             padding8=Bytes(26),
-            goods_price=Loop(lambda _: len(GOODS), Byte()),
-            goods_unknown=Loop(lambda _: len(GOODS), Short()),
-            goods_balance=Loop(lambda _: len(GOODS), Int()),
-            goods_demand=Loop(lambda _: len(GOODS), Int()),
-            goods_demand2=Loop(lambda _: len(GOODS), Int()),
+            goods_price=Loop(len(GOODS), Byte()),
+            goods_unknown=Loop(len(GOODS), Short()),
+            goods_balance=Loop(len(GOODS), Int()),
+            goods_demand=Loop(len(GOODS), Int()),
+            goods_demand2=Loop(len(GOODS), Int()),
             )
 
-    def reverse_sublist(self, lst, start, end):
-        sublist = lst[start:end]
-        sublist.reverse()
-        lst[start:end] = sublist
-
-    def after_read(self, _):
-        founding_fathers_bits = list(tools.stream_bits(self.founding_fathers_bitset))
-        # reverse bits
-        self.reverse_sublist(founding_fathers_bits, 0, 8)
-        self.reverse_sublist(founding_fathers_bits, 8, 16)
-        self.reverse_sublist(founding_fathers_bits, 16, 24)
-        self.reverse_sublist(founding_fathers_bits, 24, 32)
+    def after_read(self, context):
+        name = FoundingFather.of if context.codes else FOUNDING_FATHERS.__getitem__
+        # the founding fathers are numbered from the least significant bit of each byte
+        self.founding_fathers = [name(father_index)
+                                 for father_index in tools.set_bit_indices(self.founding_fathers_bitset, msb_first=False)]
 
-        self.founding_fathers = [FOUNDING_FATHERS[father_index] for father_index, flag in enumerate(founding_fathers_bits) if flag == 1]
+    def before_write(self, fields):
+        indices = [name_index(FOUNDING_FATHERS, name) for name in self.founding_fathers]
+        bitset = fields["founding_fathers_bitset"]
+        unknown = [index for index in tools.set_bit_indices(bitset, msb_first=False) if index >= len(FOUNDING_FATHERS)]
+        return {"founding_fathers_bitset": tools.pack_bit_indices(indices + unknown, len(bitset), msb_first=False)}
 
     def __serialize__(self):
         return tools.object_attributes_to_ordered_dict(self, [
@@ -629,9 +1339,9 @@ class Indian(Bean):
         super().__init__(
             Indian,
             padding1=Bytes(58),
-            meet=Loop(lambda _: 4, Byte()),
+            meet=Loop(4, Byte()),
             padding2=Bytes(8),
-            aggression=Loop(lambda _: 4, Word())
+            aggression=Loop(4, Word())
             )
 
     def __serialize__(self):
@@ -645,25 +1355,43 @@ class Indian(Bean):
             )
 
 class Tile:
-    pass
+    __slots__ = ("image_id", "non_land", "forest", "mountain", "forest_neighbours", "mountain_neighbours")
+
 
 class Map:
-    def __init__(self, map_size_function):
-        self.map_size_function = map_size_function;
-            
+    def __init__(self, map_size_function=None):
+        self.map_size_function = map_size_function
+
+    def compile(self):
+        return None
+
+    def size(self, context):
+        map_size = self.map_size_function(context)
+        return map_size.x * map_size.y
+
     def read(self, context):
-        self.map_data = []
         map_size = self.map_size_function(context)
+        map_data = []
         for y in range(map_size.y):
-            self.map_data.append(context.file.read(map_size.x))
-            
+            map_data.append(bytes(context.read(map_size.x)))
+
+        if context.map_arrays:
+            return ArrayMap(map_data, map_size)
+
+        map = Map()
+        map.map_data = map_data
+        map.map_size = map_size
+        map.tiles = self.read_tiles(map_data, map_size)
+        return map
+
+    def read_tiles(self, map_data, map_size):
         tiles = []
         total_map_size = map_size.x * map_size.y
         for index in range(total_map_size):
             x = index % map_size.x
             y = index // map_size.x
             tile = Tile()
-            data = self.map_data[y][x]
+            data = map_data[y][x]
             tile.image_id = data & 7
             tile.non_land = (data & int('0x10', 16)) >> 4 
             if tile.non_land == 0:
@@ -674,61 +1402,150 @@ class Map:
                 tile.mountain = 0
 
             tiles.append(tile)
-            
-        # find neighbours
+
+        # find neighbours. Neighbours outside of the map don't count.
+        no_tile = Tile()
+        no_tile.forest = 0
+        no_tile.mountain = 0
         for index in range(total_map_size):
+            x = index % map_size.x
+            y = index // map_size.x
             tile = tiles[index]
-            top = tiles[index - map_size.x]
-            down = tiles[min(index + map_size.x, total_map_size - 1)]
-            left = tiles[index - 1]
-            right = tiles[min(index + 1, total_map_size - 1)]
-            
+            top = tiles[index - map_size.x] if y > 0 else no_tile
+            down = tiles[index + map_size.x] if y < map_size.y - 1 else no_tile
+            left = tiles[index - 1] if x > 0 else no_tile
+            right = tiles[index + 1] if x < map_size.x - 1 else no_tile
+
             tile.forest_neighbours = (top.forest << 3) + (down.forest << 2) + (left.forest << 1) + right.forest
             tile.mountain_neighbours = (top.mountain << 3) + (down.mountain << 2) + (left.mountain << 1) + right.mountain
 
-        self.tiles = tiles
-        return self
+        return tiles
+
+    def encode(self, map, original):
+        """Returns the rows of map_data. The tiles are derived from map_data, changes have to be made there."""
+        data = b"".join(map.map_data)
+        if len(data) != len(original):
+            raise ValueError("expected {} bytes of map data, got {}".format(len(original), len(data)))
+        return data
+
+    def __getattr__(self, name):
+        # only called when the attribute is not set: the tiles of an unpickled map are decoded on first access
+        if name == "tiles" and "map_data" in self.__dict__:
+            self.tiles = self.read_tiles(self.map_data, self.map_size)
+            return self.tiles
+        raise AttributeError(name)
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state.pop("tiles", None)
+        return state
 
     def __serialize__(self):
         return tools.object_attributes_to_ordered_dict(self, ["map_data"])
 
 
+def neighbour_mask(array):
+    """
+        Returns the top, down, left, right neighbours of every cell of a 2d 0/1 array as a 4 bit mask. Neighbours outside
+        of the array don't count.
+    """
+    padded = numpy.pad(array, 1)
+    return ((padded[:-2, 1:-1] << 3) | (padded[2:, 1:-1] << 2) | (padded[1:-1, :-2] << 1) | padded[1:-1, 2:])
+
+
+class ArrayMap(Map):
+
+    """
+        Map with the tile attributes decoded into 2d numpy arrays (indexed [y, x]). The tiles property provides Tile
+        objects for callers which work on single tiles.
+    """
+
+    def __init__(self, map_data, map_size):
+        if numpy is None:
+            raise ImportError("numpy is required to read the map into arrays")
+        super().__init__()
+        self.map_data = map_data
+        self.map_size = map_size
+        data = numpy.frombuffer(b"".join(map_data), dtype=numpy.uint8).reshape(map_size.y, map_size.x)
+        land = (data & 0x10) == 0
+        self.image_id = data & 7
+        self.non_land = (data >> 4) & 1
+        self.forest = ((data >> 3) & 1) * land
+        self.mountain = ((data >> 5) & 1) * land
+        self.forest_neighbours = neighbour_mask(self.forest)
+        self.mountain_neighbours = neighbour_mask(self.mountain)
+        self.tiles = TileArray(self)
+
+    def __getstate__(self):
+        # the arrays are faster to unpickle than to decode, keep them
+        return dict(self.__dict__)
+
+
+class TileArray(collections.abc.Sequence):
+
+    """Sequence of Tile objects over the arrays of an ArrayMap, in the same order as Map.tiles."""
+
+    ATTRIBUTES = ["image_id", "non_land", "forest", "mountain", "forest_neighbours", "mountain_neighbours"]
+
+    def __init__(self, map):
+        self.map = map
+        self.width = map.map_size.x
+
+    def __len__(self):
+        return self.map.map_size.x * self.map.map_size.y
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("tile index out of range")
+        y, x = divmod(index, self.width)
+        tile = Tile()
+        for attribute in self.ATTRIBUTES:
+            setattr(tile, attribute, int(getattr(self.map, attribute)[y, x]))
+        return tile
+
+
 class Savegame:
+    ATTRIBUTES = [
+        "magic", "padding1",
+        "map_size",
+        "padding2",
+        "year",
+        "autumn",
+        "turn",
+        "padding3",
+        "active_unit",
+        "padding4",
+        "num_tribes",
+        "num_units",
+        "num_colonies",
+        "padding5",
+        "difficulty",
+        "padding6",
+        "royal_force",
+        "padding7",
+        # "players",
+        "padding8",
+        # "colonies",
+        # "units",
+        # "europe",
+        # "tribes",
+        # "indians",
+        "padding9",
+        "cursor_pos",
+        "padding10",
+        "viewport",
+        "map", 
+        "pos",
+        "map", 
+        "padding_final",
+        ]
+
     def __serialize__(self):
-        return tools.object_attributes_to_ordered_dict(self, [
-            "magic", "padding1",
-            "map_size",
-            "padding2",
-            "year",
-            "autumn",
-            "turn",
-            "padding3",
-            "active_unit",
-            "padding4",
-            "num_tribes",
-            "num_units",
-            "num_colonies",
-            "padding5",
-            "difficulty",
-            "padding6",
-            "royal_force",
-            "padding7",
-            # "players",
-            "padding8",
-            # "colonies",
-            # "units",
-            # "europe",
-            # "tribes",
-            # "indians",
-            "padding9",
-            "cursor_pos",
-            "padding10",
-            "viewport",
-            "map", 
-            "pos",
-            "map", 
-            "padding_final",
-            ])
+        return tools.object_attributes_to_ordered_dict(self, self.ATTRIBUTES)
 
     def __str__(self):
         return json.dumps(self, indent=3, cls=tools.Encoder)
@@ -752,15 +1569,15 @@ format = Bean(
     padding5=Bytes(6),
     difficulty=Lookup(DIFFICULTY, Byte()),
     padding6=Bytes(51),
-    royal_force=Loop(lambda _: 4, Word()),
+    royal_force=Loop(4, Word()),
     padding7=Bytes(44),
-    players=Loop(lambda _: 4, Player()),
+    players=Loop(4, Player()),
     padding8=Bytes(24),
     colonies=Loop(lambda context: context.objects[-1].num_colonies, Colony()),
     units=Loop(lambda context: context.objects[-1].num_units, Unit()),
-    europe=Loop(lambda _: 4, Europe()),
+    europe=Loop(4, Europe()),
     tribes=Loop(lambda context: context.objects[-1].num_tribes, Tribe()),
-    indians=Loop(lambda _: 8, Indian()),
+    indians=Loop(8, Indian()),
     padding9=Bytes(717),
     cursor_pos=Position(Word()),
     padding10=Bytes(2),
@@ -769,55 +1586,262 @@ format = Bean(
     pos=Tell(),
     padding_final=Bytes(320)
     )
-    
-    
-def read_image(image_name):
-    image = Image.open("images/"+image_name)
-    rgba_image = image.convert("RGBA")
-    print("{} {} {}".format(image_name, image.mode, image.info))
-    return rgba_image
-
-    
-#from pudb import set_trace
-
-def write_map(map, map_size):
-#    set_trace()
-    images = {k: read_image(image_name) for k, image_name in TERRAIN.items()}
-    non_land_images = {k: read_image(image_name) for k, image_name in TERRAIN_NON_LAND.items()}
-    forest_images = [read_image("surface/PHYS0.SS.{:03d}.png".format(i+FOREST_START)) for i in range(16)]
-    mountain_images = [read_image("surface/PHYS0.SS.{:03d}.png".format(i+MOUNTAIN_START)) for i in range(16)]
-    
-    map_image = Image.new("RGBA", (map_size.x*16, map_size.y*16))
-    for index in range(map_size.x * map_size.y):
-        x = index % map_size.x
-        y = index // map_size.x
-        tile = map.tiles[index]
-        if tile.non_land == 1:
-            map_image.paste(non_land_images[tile.image_id], (x*16, y*16))
-        else:
-            if tile.image_id in images:
-                map_image.paste(images[tile.image_id], (x*16, y*16))
-            if tile.forest > 0:
-                map_image.paste(forest_images[tile.forest_neighbours], (x*16, y*16), forest_images[tile.forest_neighbours])
-                
-            if tile.mountain > 0:
-                map_image.paste(mountain_images[tile.mountain_neighbours], (x*16, y*16), forest_images[tile.mountain_neighbours])
-        
-        
-    map_image.save("map.png", "PNG")
-
-
-def read_savegame(filename):
+
+# same as format, but reads all fixed size records with precompiled structs
+compiled_format = compile_reader(format)
+
+
+@functools.lru_cache(maxsize=None)
+def get_format(compiled=False, slots=False):
+    """Returns the savegame format, optionally compiled and/or creating slotted records."""
+    if not slots:
+        return compiled_format if compiled else format
+    slotted_format = slotted_reader(format)
+    return compile_reader(slotted_format) if compiled else slotted_format
+
+
+# create the record classes when the module is imported, so that records can be unpickled in every process
+get_format(slots=True)
+
+
+class Records(collections.abc.Sequence):
+
+    """
+        Records of a section of a LazySavegame. A record is read on first access.
+    """
+
+    def __init__(self, context, offset, count, reader):
+        self.context = context
+        self.offset = offset
+        self.reader = reader
+        self.record_size = reader_size(reader, context)
+        self.records = [None] * count
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self.records)
+        record = self.records[index]
+        if record is None:
+            record = self.read_record(index)
+            self.records[index] = record
+        return record
+
+    def read_record(self, index):
+        self.context.seek(self.offset + index * self.record_size)
+        self.context.loop_index = index
+        record = self.reader.read(self.context)
+        self.context.loop_index = -1
+        return record
+
+    def stream(self):
+        """Returns an iterator over the records which doesn't keep records which are not read yet."""
+        for index, record in enumerate(self.records):
+            yield record if record is not None else self.read_record(index)
+
+    def __serialize__(self):
+        return list(self)
+
+
+class LazySavegame(Savegame):
+
+    """
+        Savegame which reads only the header when it is created. The sections (loops of records and the map) are read
+        on first access, the records of a loop one by one. section_index contains the (offset, size) of every field.
+    """
+
+    def __init__(self, context, format):
+        self.context = context
+        self.readers = format.reader
+        self.sections = {}
+        self.section_index = collections.OrderedDict()
+        context.objects.append(self)
+        for name, reader in format.reader.items():
+            offset = context.tell()
+            size = reader_size(reader, context)
+            self.section_index[name] = (offset, size)
+            if self.is_section(reader):
+                self.sections[name] = reader
+                context.seek(offset + size)
+            else:
+                setattr(self, name, reader.read(context))
+        context.objects.pop()
+
+    @staticmethod
+    def is_section(reader):
+        return isinstance(reader, Map) or (isinstance(reader, Loop) and isinstance(reader.reader, (Bean, CompiledBean)))
+
+    def __getattr__(self, name):
+        # only called when the attribute is not set yet
+        sections = self.__dict__.get("sections", {})
+        if name not in sections:
+            raise AttributeError(name)
+        value = self.read_section(name, sections[name])
+        setattr(self, name, value)
+        return value
+
+    def read_section(self, name, reader):
+        offset, _ = self.section_index[name]
+        self.context.objects.append(self)
+        try:
+            if isinstance(reader, Map):
+                self.context.seek(offset)
+                return reader.read(self.context)
+            return Records(self.context, offset, reader.count_elements(self.context), reader.reader)
+        finally:
+            self.context.objects.pop()
+
+    def raw(self, name):
+        """Returns the bytes of a field as memoryview."""
+        offset, size = self.section_index[name]
+        return self.context.buffer[offset:offset + size]
+
+    def to_numpy(self, name):
+        """
+            Returns the records of a section as numpy structured array (see numpy_dtype()) without reading them. The
+            array is a view of the buffer: copy it to keep it after close(), which fails while a view exists.
+        """
+        if numpy is None:
+            raise ImportError("numpy is required to read sections into arrays")
+        reader = self.sections.get(name)
+        dtype = numpy_dtype(reader.reader) if isinstance(reader, Loop) else None
+        if dtype is None:
+            raise ValueError("{} is not a section of fixed size records".format(name))
+        offset, size = self.section_index[name]
+        return numpy.frombuffer(self.context.buffer, dtype, size // dtype.itemsize, offset)
+
+    def patches(self):
+        """
+            Returns the (offset, bytes) of every byte range which differs between the values of the savegame and the
+            buffer it was read from. Only header fields, records which were accessed and the map, if it was read, are
+            encoded. Unchanged fields keep their original bytes.
+        """
+        patches = []
+        buffer = self.context.buffer
+        for name, (offset, size) in self.section_index.items():
+            if name not in vars(self):
+                continue
+            value = getattr(self, name)
+            if isinstance(value, Records):
+                for index, record in enumerate(value.records):
+                    if record is not None:
+                        start = value.offset + index * value.record_size
+                        patches += self.changed(start, encode_value(value.reader, record, buffer[start:start + value.record_size]))
+            else:
+                patches += self.changed(offset, encode_value(self.readers[name], value, buffer[offset:offset + size]))
+        return patches
+
+    def changed(self, offset, data):
+        original = self.context.buffer[offset:offset + len(data)]
+        return [(offset + start, data[start:end]) for start, end in tools.changed_ranges(original, data)]
+
+    def to_bytes(self):
+        """Returns the bytes of the savegame with all changes applied."""
+        data = bytearray(self.context.buffer)
+        for offset, patch in self.patches():
+            data[offset:offset + len(patch)] = patch
+        return bytes(data)
+
+    def save(self, filename=None):
+        """
+            Writes the changes into :filename, which defaults to the file the savegame was opened from. Only the
+            changed byte ranges are written. Returns the number of patches.
+        """
+        filename = filename or getattr(self, "filename", None)
+        if filename is None:
+            raise ValueError("the savegame was not opened from a file, a filename is needed")
+        patches = self.patches()
+        patch_file(filename, patches)
+        return len(patches)
+
+    def close(self):
+        """Releases the buffer of the savegame. Sections which are not read yet can't be accessed anymore."""
+        self.context.release()
+        if getattr(self, "mmap", None) is not None:
+            self.mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+
+def write_map(map, map_size, filename="map.png"):
+    # imported here, reading savegames doesn't need PIL
+    import render
+    render.write_map(map, map_size, filename)
+
+
+def parse_savegame(data, compiled=False, map_arrays=False, slots=False, codes=False):
+    """
+        Reads a savegame from a buffer, i.e. bytes of a save extracted from an archive. With codes=True the values of
+        the lookup tables are read as tools.Code (Nation, Goods, ...), also the keys of Colony.goods. The names are
+        only looked up when the savegame is serialized with tools.CodeEncoder.
+    """
+    context = BufferContext(data)
+    context.map_arrays = map_arrays
+    context.codes = codes
+    try:
+        return get_format(compiled, slots).read(context)
+    finally:
+        context.release()
+
+
+def load_savegame(data, compiled=False, map_arrays=False, slots=False, codes=False):
+    """Returns a LazySavegame over a buffer, i.e. bytes of a save extracted from an archive."""
+    context = BufferContext(data)
+    context.map_arrays = map_arrays
+    context.codes = codes
+    return LazySavegame(context, get_format(compiled, slots))
+
+
+def open_savegame(filename, compiled=False, map_arrays=False, slots=False, codes=False):
+    """Returns a LazySavegame over a memory map of the file. Use close() or a with block to unmap the file."""
+    with open(filename, "rb") as file:
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    savegame = load_savegame(buffer, compiled, map_arrays, slots, codes)
+    savegame.mmap = buffer
+    savegame.filename = filename
+    return savegame
+
+
+def patch_file(filename, patches):
+    """Writes the (offset, bytes) patches into a file in place."""
+    if not patches:
+        return
+    with open(filename, "r+b") as file:
+        with mmap.mmap(file.fileno(), 0) as buffer:
+            for offset, data in patches:
+                buffer[offset:offset + len(data)] = data
+            buffer.flush()
+
+
+def read_savegame(filename, compiled=False, use_mmap=False, map_arrays=False, slots=False, cache=None, codes=False):
+    """Reads a savegame file. With a parsecache.ParseCache as :cache, savegames with the same content are parsed once."""
+    if cache is not None:
+        with open(filename, "rb") as file:
+            return cache.parse(file.read(), compiled, map_arrays, slots, codes)
+
     with open(filename, "rb") as file:
+        if use_mmap:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                return parse_savegame(buffer, compiled, map_arrays, slots, codes)
 
         context = Context(file)
-        savegame = format.read(context)
-#        print(savegame)
-        write_map(savegame.map, savegame.map_size)
+        context.map_arrays = map_arrays
+        context.codes = codes
+        return get_format(compiled, slots).read(context)
 
 
 def main():
-    read_savegame(sys.argv[1])
+    savegame = read_savegame(sys.argv[1])
+#    print(savegame)
+    write_map(savegame.map, savegame.map_size)
 
 if __name__ == "__main__":
     main()
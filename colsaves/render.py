@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+    Renders the map of a savegame with the sprites of the images directory.
+
+    usage: render.py [-o OUTPUT] [--images DIRECTORY] [--bands BANDS] SAVEGAME
+           render.py --pack [--images DIRECTORY]
+
+    --pack writes all sprites needed for the map into one image (atlas.png) in the images directory. When it exists it
+    is loaded instead of the single sprites.
+
+    With numpy the tiles are copied into one RGBA array which becomes the image, otherwise they are pasted one by one.
+    --bands renders horizontal bands of the map in parallel processes.
+"""
+import os
+import argparse
+import functools
+
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+
+import reader
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+IMAGES_DIRECTORY = "images"
+ATLAS_NAME = "atlas.png"
+TILE_SIZE = 16
+GROUPS = ["terrain", "non_land", "forest", "mountain"]
+
+
+def read_image(directory, image_name):
+    image = Image.open(os.path.join(directory, image_name))
+    return image.convert("RGBA")
+
+
+def sprite_names():
+    """Returns (group, key, image name) of all sprites in the order of the packed atlas."""
+    names = [("terrain", key, name) for key, name in sorted(reader.TERRAIN.items())]
+    names += [("non_land", key, name) for key, name in sorted(reader.TERRAIN_NON_LAND.items())]
+    names += [("forest", i, "surface/PHYS0.SS.{:03d}.png".format(i + reader.FOREST_START)) for i in range(16)]
+    names += [("mountain", i, "surface/PHYS0.SS.{:03d}.png".format(i + reader.MOUNTAIN_START)) for i in range(16)]
+    return names
+
+
+def tile_key(tile):
+    """Returns the attributes of a tile which determine its image: (non_land, image_id, forest mask, mountain mask)."""
+    if tile.non_land == 1:
+        return (1, tile.image_id, None, None)
+    return (0,
+            tile.image_id,
+            tile.forest_neighbours if tile.forest > 0 else None,
+            tile.mountain_neighbours if tile.mountain > 0 else None)
+
+
+class SpriteAtlas:
+
+    """
+        The sprites needed to render a map and a cache of the composed tile images.
+    """
+
+    def __init__(self, sprites):
+        # group -> key -> image
+        self.sprites = sprites
+        # tile_key() -> image
+        self.tiles = {}
+        # tile_key() -> (TILE_SIZE, TILE_SIZE * 4) array of the RGBA rows of the image
+        self.arrays = {}
+
+    @staticmethod
+    def load(directory=IMAGES_DIRECTORY):
+        sprites = {group: {} for group in GROUPS}
+        if os.path.exists(os.path.join(directory, ATLAS_NAME)):
+            atlas = read_image(directory, ATLAS_NAME)
+            for index, (group, key, _) in enumerate(sprite_names()):
+                sprites[group][key] = atlas.crop((index * TILE_SIZE, 0, (index + 1) * TILE_SIZE, TILE_SIZE))
+        else:
+            for group, key, name in sprite_names():
+                sprites[group][key] = read_image(directory, name)
+        return SpriteAtlas(sprites)
+
+    def save(self, filename):
+        """Writes all sprites into one image."""
+        names = sprite_names()
+        atlas = Image.new("RGBA", (len(names) * TILE_SIZE, TILE_SIZE))
+        for index, (group, key, _) in enumerate(names):
+            atlas.paste(self.sprites[group][key], (index * TILE_SIZE, 0))
+        atlas.save(filename, "PNG")
+
+    def tile(self, tile):
+        """Returns the image of a tile."""
+        return self.tile_image(tile_key(tile))
+
+    def tile_image(self, key):
+        image = self.tiles.get(key)
+        if image is None:
+            image = self.compose(*key)
+            self.tiles[key] = image
+        return image
+
+    def tile_array(self, key):
+        array = self.arrays.get(key)
+        if array is None:
+            array = numpy.asarray(self.tile_image(key).convert("RGBA")).reshape(TILE_SIZE, TILE_SIZE * 4)
+            self.arrays[key] = array
+        return array
+
+    def compose(self, non_land, image_id, forest_mask, mountain_mask):
+        image = Image.new("RGBA", (TILE_SIZE, TILE_SIZE))
+        if non_land == 1:
+            sprite = self.sprites["non_land"].get(image_id)
+            if sprite is not None:
+                image.paste(sprite, (0, 0))
+            return image
+
+        sprite = self.sprites["terrain"].get(image_id)
+        if sprite is not None:
+            image.paste(sprite, (0, 0))
+        if forest_mask is not None:
+            sprite = self.sprites["forest"][forest_mask]
+            image.paste(sprite, (0, 0), sprite)
+        if mountain_mask is not None:
+            sprite = self.sprites["mountain"][mountain_mask]
+            image.paste(sprite, (0, 0), sprite)
+        return image
+
+
+@functools.lru_cache(maxsize=None)
+def get_atlas(directory=IMAGES_DIRECTORY):
+    """Returns the sprite atlas of the directory. It is loaded once per process."""
+    return SpriteAtlas.load(directory)
+
+
+def tile_codes(map_data, map_size):
+    """
+        Returns a 2d array with a number per tile which encodes tile_key(): bits 0-2 image id, bit 3 non land, bit 4
+        forest, bits 5-8 forest mask, bit 9 mountain, bits 10-13 mountain mask.
+    """
+    data = numpy.frombuffer(b"".join(map_data), dtype=numpy.uint8).reshape(map_size.y, map_size.x).astype(numpy.uint16)
+    non_land = (data >> 4) & 1
+    land = 1 - non_land
+    forest = ((data >> 3) & 1) * land
+    mountain = ((data >> 5) & 1) * land
+    codes = (data & 7) | (non_land << 3)
+    codes |= (forest << 4) | ((reader.neighbour_mask(forest) * forest) << 5)
+    codes |= (mountain << 9) | ((reader.neighbour_mask(mountain) * mountain) << 10)
+    return codes
+
+
+def code_key(code):
+    """Returns the tile_key() of a number of tile_codes()."""
+    if code & 8:
+        return (1, code & 7, None, None)
+    return (0,
+            code & 7,
+            (code >> 5) & 15 if code & 16 else None,
+            (code >> 10) & 15 if code & 512 else None)
+
+
+def compose_band(sprites, indices):
+    """
+        Returns the pixels of a band of tiles as (height, width, 4) array. sprites is an array of the RGBA rows of the
+        tile images, indices the 2d array of the sprite of every tile.
+    """
+    rows, columns = indices.shape
+    # one gather in the order of the image: (tile row, pixel row, tile column, pixels of the tile row)
+    pixels = sprites[indices[:, None, :], numpy.arange(TILE_SIZE)[None, :, None]]
+    return pixels.reshape(rows * TILE_SIZE, columns * TILE_SIZE, 4)
+
+
+def render_buffer(map, map_size, atlas=None, bands=1):
+    """
+        Returns the map as (height, width, 4) array. With bands > 1 the rows are split into bands which are composed
+        in worker processes.
+    """
+    atlas = atlas or get_atlas()
+    codes, indices = numpy.unique(tile_codes(map.map_data, map_size), return_inverse=True)
+    indices = indices.reshape(map_size.y, map_size.x)
+    sprites = numpy.stack([atlas.tile_array(code_key(int(code))) for code in codes])
+    if bands <= 1 or map_size.y < 2:
+        return compose_band(sprites, indices)
+    bounds = numpy.linspace(0, map_size.y, min(bands, map_size.y) + 1).astype(int)
+    parts = [indices[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+    with ProcessPoolExecutor(max_workers=len(parts)) as executor:
+        return numpy.concatenate(list(executor.map(compose_band, [sprites] * len(parts), parts)))
+
+
+def render_map(map, map_size, atlas=None, bands=1):
+    """Returns the map as image with 16x16 pixels per tile."""
+    if numpy is not None:
+        buffer = numpy.ascontiguousarray(render_buffer(map, map_size, atlas, bands))
+        return Image.frombuffer("RGBA", (buffer.shape[1], buffer.shape[0]), buffer, "raw", "RGBA", 0, 1)
+    return paste_map(map, map_size, atlas)
+
+
+def render_region(map, map_size, x1, y1, x2, y2, atlas=None):
+    """Returns the image of the tiles x1 <= x < x2, y1 <= y < y2 of the map."""
+    atlas = atlas or get_atlas()
+    if numpy is not None:
+        codes, indices = numpy.unique(tile_codes(map.map_data, map_size)[y1:y2, x1:x2], return_inverse=True)
+        sprites = numpy.stack([atlas.tile_array(code_key(int(code))) for code in codes])
+        buffer = compose_band(sprites, indices.reshape(y2 - y1, x2 - x1))
+        return Image.frombuffer("RGBA", (buffer.shape[1], buffer.shape[0]), buffer, "raw", "RGBA", 0, 1)
+    image = Image.new("RGBA", ((x2 - x1) * TILE_SIZE, (y2 - y1) * TILE_SIZE))
+    for y in range(y1, y2):
+        for x in range(x1, x2):
+            image.paste(atlas.tile(map.tiles[y * map_size.x + x]), ((x - x1) * TILE_SIZE, (y - y1) * TILE_SIZE))
+    return image
+
+
+def paste_map(map, map_size, atlas=None):
+    """Returns the map as image, the tiles are pasted one by one."""
+    atlas = atlas or get_atlas()
+    map_image = Image.new("RGBA", (map_size.x * TILE_SIZE, map_size.y * TILE_SIZE))
+    for index, tile in enumerate(map.tiles):
+        y, x = divmod(index, map_size.x)
+        map_image.paste(atlas.tile(tile), (x * TILE_SIZE, y * TILE_SIZE))
+    return map_image
+
+
+# bits of a map byte which change the forest or mountain mask of the neighbours: forest, non land, mountain
+NEIGHBOUR_BITS = 0x38
+
+
+def dirty_tiles(previous_map_data, map_data, map_size):
+    """
+        Returns the sorted indices of the tiles which have to be repainted when the map changes from :previous_map_data
+        to :map_data: the changed tiles and their neighbours, when their forest or mountain mask changes.
+    """
+    dirty = set()
+    width, height = map_size.x, map_size.y
+    for y, (previous_row, row) in enumerate(zip(previous_map_data, map_data)):
+        if previous_row == row:
+            continue
+        for x, (previous, current) in enumerate(zip(previous_row, row)):
+            if previous == current:
+                continue
+            index = y * width + x
+            dirty.add(index)
+            if (previous ^ current) & NEIGHBOUR_BITS:
+                if y > 0:
+                    dirty.add(index - width)
+                if y < height - 1:
+                    dirty.add(index + width)
+                if x > 0:
+                    dirty.add(index - 1)
+                if x < width - 1:
+                    dirty.add(index + 1)
+    return sorted(dirty)
+
+
+def update_map(map_image, previous_map_data, map, map_size, atlas=None):
+    """
+        Updates the image of a map rendered from :previous_map_data to :map and returns it. Only the tiles returned by
+        dirty_tiles() are repainted. When the size of the map changed, the map is rendered from scratch.
+    """
+    if map_image.size != (map_size.x * TILE_SIZE, map_size.y * TILE_SIZE) or len(previous_map_data) != map_size.y:
+        return render_map(map, map_size, atlas)
+    atlas = atlas or get_atlas()
+    for index in dirty_tiles(previous_map_data, map.map_data, map_size):
+        y, x = divmod(index, map_size.x)
+        map_image.paste(atlas.tile(map.tiles[index]), (x * TILE_SIZE, y * TILE_SIZE))
+    return map_image
+
+
+def write_map(map, map_size, filename="map.png", atlas=None, bands=1):
+    render_map(map, map_size, atlas, bands).save(filename, "PNG")
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Render the map of a savegame.")
+    parser.add_argument("savegame", nargs="?")
+    parser.add_argument("-o", "--output", default="map.png", help="image file (default: map.png)")
+    parser.add_argument("--images", default=IMAGES_DIRECTORY, help="directory of the sprites (default: images)")
+    parser.add_argument("--pack", action="store_true", help="pack the sprites into {}".format(ATLAS_NAME))
+    parser.add_argument("--bands", type=int, default=1, help="number of bands rendered in parallel (default: 1)")
+    options = parser.parse_args(args)
+
+    if options.pack:
+        SpriteAtlas.load(options.images).save(os.path.join(options.images, ATLAS_NAME))
+    if options.savegame:
+        savegame = reader.read_savegame(options.savegame, compiled=True)
+        write_map(savegame.map, savegame.map_size, options.output, get_atlas(options.images), options.bands)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+    Serves the savegames of a directory as JSON and rendered maps over HTTP.
+
+    usage: server.py [--host HOST] [-p PORT] [-w WORKERS] [--cache-size MB] [--images DIRECTORY] [--tiles DIRECTORY]
+                     DIRECTORY
+
+    GET /saves                     names of the savegames
+    GET /saves/<name>              header fields
+    GET /saves/<name>/<section>    players, colonies, units, europe, tribes, indians or map
+    GET /saves/<name>/map.png      rendered map
+    GET /saves/<name>/tiles/<zoom>/<x>/<y>.png
+                                   image of the tile pyramid of the map (see pyramid.py), cached in the --tiles directory
+
+    Savegames are parsed in a pool of worker processes and kept in an LRU cache together with the responses built from
+    them. A cache entry belongs to the path, modification time and content hash of the file, the content hash is the
+    ETag of all responses of a savegame. If-None-Match is answered with 304, for savegames which are not cached after
+    hashing the file without parsing it.
+"""
+import io
+import os
+import sys
+import json
+import asyncio
+import hashlib
+import argparse
+import collections
+import urllib.parse
+
+from http import HTTPStatus
+from concurrent.futures import ProcessPoolExecutor
+
+import batch
+import export
+import reader
+import tools
+
+
+SECTIONS = export.SECTIONS[1:-1] + ["map"]
+
+
+def file_digest(path):
+    """Returns the content hash of a file, the ETag of its responses."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def object_size(root, sample=8):
+    """
+        Returns an estimate of the memory of an object and the objects it references. Only the first :sample items of
+        lists and tuples are measured, the other items are counted as the same size.
+    """
+    seen = set()
+    stack = [(root, 1)]
+    total = 0
+    while stack:
+        value, weight = stack.pop()
+        # small ints are shared by all objects
+        if id(value) in seen or type(value) is int and -5 <= value <= 256:
+            continue
+        seen.add(id(value))
+        total += sys.getsizeof(value) * weight
+        if isinstance(value, (list, tuple)):
+            items = value[:sample]
+            stack.extend((item, weight * len(value) / len(items)) for item in items)
+        elif isinstance(value, dict):
+            stack.extend((item, weight) for item in value.keys())
+            stack.extend((item, weight) for item in value.values())
+        elif not isinstance(value, (str, bytes, int, float, type)):
+            if hasattr(value, "__dict__"):
+                stack.append((value.__dict__, weight))
+            for cls in type(value).__mro__:
+                for name in getattr(cls, "__slots__", ()):
+                    if hasattr(value, name):
+                        stack.append((getattr(value, name), weight))
+    return int(total)
+
+
+def load_file(path):
+    """
+        Reads and parses a savegame. Returns the content hash, the estimated memory of the savegame and the savegame.
+        Runs in a worker.
+    """
+    with open(path, "rb") as file:
+        data = file.read()
+    savegame = reader.parse_savegame(data, compiled=True, slots=True)
+    return hashlib.sha256(data).hexdigest(), object_size(savegame), savegame
+
+
+def to_json(value):
+    return json.dumps(value, cls=tools.Encoder).encode("utf-8")
+
+
+class HTTPError(Exception):
+    def __init__(self, status):
+        super().__init__(status.phrase)
+        self.status = status
+
+
+class CacheEntry:
+
+    def __init__(self, digest, size, savegame):
+        self.digest = digest
+        self.savegame = savegame
+        # resource -> (content type, body)
+        self.responses = {}
+        # estimated memory of the savegame and the responses
+        self.size = size
+        # key of the digest in SavegameCache.digests
+        self.file_key = None
+
+
+class SavegameCache:
+
+    """
+        Least recently used cache of parsed savegames with a limit of the estimated memory of the savegames (see
+        object_size()) and of the cached responses.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self.entries = collections.OrderedDict()
+        # (path, mtime, file size) -> content hash of the cached savegame
+        self.digests = {}
+
+    def key(self, path, stat):
+        digest = self.digests.get((path, stat.st_mtime_ns, stat.st_size))
+        return None if digest is None else (path, stat.st_mtime_ns, digest)
+
+    def get(self, path, stat):
+        key = self.key(path, stat)
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        return entry
+
+    def put(self, path, stat, entry):
+        entry.file_key = (path, stat.st_mtime_ns, stat.st_size)
+        self.digests[entry.file_key] = entry.digest
+        key = (path, stat.st_mtime_ns, entry.digest)
+        if key in self.entries:
+            self.size -= self.entries.pop(key).size
+        self.entries[key] = entry
+        self.size += entry.size
+        self.evict()
+
+    def add_response(self, entry, resource, content_type, body):
+        entry.responses[resource] = (content_type, body)
+        entry.size += len(body)
+        if any(value is entry for value in self.entries.values()):
+            self.size += len(body)
+            self.evict()
+
+    def evict(self):
+        # the most recently used entry is kept even if it is larger than the limit
+        while self.size > self.max_size and len(self.entries) > 1:
+            _, entry = self.entries.popitem(last=False)
+            self.size -= entry.size
+            if self.digests.get(entry.file_key) == entry.digest:
+                del self.digests[entry.file_key]
+
+
+class Server:
+
+    """
+        Answers the HTTP requests for the savegames in :directory. :executor parses the savegames, the responses are
+        built in the default executor of the event loop.
+    """
+
+    def __init__(self, directory, executor, cache_size=128 * 1024 * 1024, images=None, tiles=None):
+        self.directory = directory
+        self.executor = executor
+        self.cache = SavegameCache(cache_size)
+        self.images = images
+        self.tiles = tiles
+        self.pyramid = None
+        if tiles is not None:
+            # imported here, serving JSON doesn't need PIL
+            import pyramid
+            import render
+            self.pyramid = pyramid.TilePyramid(tiles, render.get_atlas(images or render.IMAGES_DIRECTORY))
+        # path -> future of a parse which is in progress
+        self.loading = {}
+
+    def savegame_names(self):
+        return [os.path.relpath(path, self.directory) for path in batch.find_savegames([self.directory])]
+
+    def savegame_path(self, name):
+        """Returns the path of a savegame in the directory. Names of other files raise HTTPError 404."""
+        directory = os.path.realpath(self.directory)
+        path = os.path.realpath(os.path.join(directory, name))
+        if os.path.commonpath([directory, path]) != directory or not path.upper().endswith(".SAV") or not os.path.isfile(path):
+            raise HTTPError(HTTPStatus.NOT_FOUND)
+        return path
+
+    async def digest(self, path):
+        """Returns the content hash of a savegame. Savegames which are not cached are hashed, not parsed."""
+        stat = os.stat(path)
+        entry = self.cache.get(path, stat)
+        if entry is not None:
+            return entry.digest
+        return await asyncio.get_running_loop().run_in_executor(None, file_digest, path)
+
+    async def entry(self, path):
+        stat = os.stat(path)
+        entry = self.cache.get(path, stat)
+        if entry is not None:
+            return entry
+        future = self.loading.get(path)
+        if future is None:
+            future = asyncio.get_running_loop().run_in_executor(self.executor, load_file, path)
+            self.loading[path] = future
+        try:
+            digest, size, savegame = await future
+        finally:
+            self.loading.pop(path, None)
+        entry = self.cache.get(path, stat)
+        if entry is None:
+            entry = CacheEntry(digest, size, savegame)
+            self.cache.put(path, stat, entry)
+        return entry
+
+    def build(self, savegame, resource):
+        """Returns (content type, body) of a resource of a savegame."""
+        if resource == "":
+            output = io.StringIO()
+            export.write_json(savegame, output, ["header"])
+            return "application/json", output.getvalue().encode("utf-8")
+        if resource == "map.png":
+            # imported here, serving JSON doesn't need PIL
+            import render
+            atlas = render.get_atlas(self.images or render.IMAGES_DIRECTORY)
+            output = io.BytesIO()
+            render.write_map(savegame.map, savegame.map_size, output, atlas)
+            return "image/png", output.getvalue()
+        if resource.startswith("tiles/"):
+            return "image/png", self.pyramid_tile(savegame, resource)
+        if resource in SECTIONS:
+            return "application/json", to_json(getattr(savegame, resource))
+        raise HTTPError(HTTPStatus.NOT_FOUND)
+
+    def pyramid_tile(self, savegame, resource):
+        try:
+            zoom, x, y = (int(part) for part in resource[len("tiles/"):-len(".png")].split("/"))
+        except ValueError:
+            raise HTTPError(HTTPStatus.NOT_FOUND)
+        try:
+            return self.pyramid.tile(savegame.map, zoom, x, y)
+        except IndexError:
+            raise HTTPError(HTTPStatus.NOT_FOUND)
+
+    async def get(self, path, headers):
+        """Returns the status, the headers and the body of the response to a GET request."""
+        parts = [urllib.parse.unquote(part) for part in path.strip("/").split("/")]
+        if parts == ["saves"]:
+            return HTTPStatus.OK, {"Content-Type": "application/json"}, to_json(self.savegame_names())
+        if len(parts) < 2 or parts[0] != "saves":
+            raise HTTPError(HTTPStatus.NOT_FOUND)
+        name = parts[1]
+        resource = "/".join(parts[2:])
+        tile = self.tiles is not None and len(parts) == 6 and parts[2] == "tiles" and parts[5].endswith(".png")
+        if not (len(parts) == 2 or len(parts) == 3 and (resource == "map.png" or resource in SECTIONS) or tile):
+            raise HTTPError(HTTPStatus.NOT_FOUND)
+
+        path = self.savegame_path(name)
+        tags = [tag.strip() for tag in headers.get("if-none-match", "").split(",")]
+        if tags != [""]:
+            # answer a revalidation without parsing the savegame
+            etag = '"{}"'.format(await self.digest(path))
+            if etag in tags:
+                return HTTPStatus.NOT_MODIFIED, {"ETag": etag}, b""
+        entry = await self.entry(path)
+        etag = '"{}"'.format(entry.digest)
+        response = entry.responses.get(resource)
+        if response is None:
+            response = await asyncio.get_running_loop().run_in_executor(None, self.build, entry.savegame, resource)
+            self.cache.add_response(entry, resource, *response)
+        content_type, body = response
+        return HTTPStatus.OK, {"Content-Type": content_type, "ETag": etag}, body
+
+    async def handle(self, stream_reader, stream_writer):
+        try:
+            request_line = (await stream_reader.readline()).decode("latin-1").split()
+            headers = {}
+            while True:
+                line = (await stream_reader.readline()).decode("latin-1")
+                if line in ["\r\n", "\n", ""]:
+                    break
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+
+            head = False
+            try:
+                if len(request_line) != 3:
+                    raise HTTPError(HTTPStatus.BAD_REQUEST)
+                method, target, _ = request_line
+                if method not in ["GET", "HEAD"]:
+                    raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED)
+                head = method == "HEAD"
+                status, response_headers, body = await self.get(urllib.parse.urlsplit(target).path, headers)
+            except HTTPError as e:
+                status, response_headers, body = e.status, {"Content-Type": "application/json"}, to_json({"error": e.status.phrase})
+            except Exception as e:
+                status, response_headers = HTTPStatus.INTERNAL_SERVER_ERROR, {"Content-Type": "application/json"}
+                body = to_json({"error": "{}: {}".format(type(e).__name__, e)})
+
+            response_headers["Content-Length"] = str(len(body))
+            response_headers["Connection"] = "close"
+            lines = ["HTTP/1.1 {} {}".format(status.value, status.phrase)]
+            lines += ["{}: {}".format(name, value) for name, value in response_headers.items()]
+            stream_writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+            if not head:
+                stream_writer.write(body)
+            await stream_writer.drain()
+        finally:
+            stream_writer.close()
+
+    async def start(self, host="127.0.0.1", port=8000):
+        return await asyncio.start_server(self.handle, host, port)
+
+
+async def serve(server, host, port):
+    http_server = await server.start(host, port)
+    async with http_server:
+        await http_server.serve_forever()
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Serve savegames over HTTP.")
+    parser.add_argument("directory")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("-p", "--port", type=int, default=8000)
+    parser.add_argument("-w", "--workers", type=int, default=None, help="number of worker processes (default: number of cpus)")
+    parser.add_argument("--cache-size", type=int, default=128,
+                        help="estimated memory of the cached savegames and responses in MB (default: 128)")
+    parser.add_argument("--images", help="directory of the sprites (default: images)")
+    parser.add_argument("--tiles", help="cache directory of the tile pyramids (default: no tiles are served)")
+    options = parser.parse_args(args)
+
+    with ProcessPoolExecutor(max_workers=options.workers) as executor:
+        server = Server(options.directory, executor, options.cache_size * 1024 * 1024, options.images, options.tiles)
+        try:
+            asyncio.run(serve(server, options.host, options.port))
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+    Spatial index over the units, colonies and tribes of a savegame.
+
+    usage: spatial.py [-d DISTANCE] SAVEGAME
+
+    The command prints the units of other nations within DISTANCE tiles (default 3) of every colony.
+
+    Distances are counted in tiles with diagonal steps (the larger of the x and the y distance), like moves in the game.
+"""
+import argparse
+import collections
+
+import reader
+
+
+Entry = collections.namedtuple("Entry", ["x", "y", "kind", "nation", "item"])
+
+
+def tile_distance(x1, y1, x2, y2):
+    return max(abs(x1 - x2), abs(y1 - y2))
+
+
+def savegame_entries(savegame):
+    """Returns the entries of the units, colonies and tribes of a savegame."""
+    entries = [Entry(unit.pos.x, unit.pos.y, "unit", unit.nation, unit) for unit in savegame.units]
+    entries += [Entry(colony.x, colony.y, "colony", colony.nation, colony) for colony in savegame.colonies]
+    entries += [Entry(tribe.pos.x, tribe.pos.y, "tribe", tribe.nation, tribe) for tribe in savegame.tribes]
+    return entries
+
+
+class SpatialIndex:
+
+    """
+        Entries in buckets of cell_size x cell_size tiles. The queries only look at the buckets which overlap the
+        queried area. All queries can be restricted to a kind ("unit", "colony", "tribe") and to a nation.
+    """
+
+    def __init__(self, entries=(), cell_size=4):
+        self.cell_size = cell_size
+        # (cell x, cell y) -> list of entries
+        self.buckets = collections.defaultdict(list)
+        self.count = 0
+        for entry in entries:
+            self.add(entry)
+
+    @staticmethod
+    def from_savegame(savegame, cell_size=4):
+        return SpatialIndex(savegame_entries(savegame), cell_size)
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for bucket in self.buckets.values():
+            yield from bucket
+
+    def add(self, entry):
+        self.buckets[(entry.x // self.cell_size, entry.y // self.cell_size)].append(entry)
+        self.count += 1
+
+    def candidates(self, x1, y1, x2, y2):
+        """Returns an iterator over the entries of the buckets which overlap the rectangle."""
+        size = self.cell_size
+        cell_x1, cell_x2 = x1 // size, x2 // size
+        cell_y1, cell_y2 = y1 // size, y2 // size
+        if (cell_x2 - cell_x1 + 1) * (cell_y2 - cell_y1 + 1) > len(self.buckets):
+            # the rectangle covers more cells than there are buckets
+            for (cell_x, cell_y), bucket in self.buckets.items():
+                if cell_x1 <= cell_x <= cell_x2 and cell_y1 <= cell_y <= cell_y2:
+                    yield from bucket
+            return
+        for cell_y in range(cell_y1, cell_y2 + 1):
+            for cell_x in range(cell_x1, cell_x2 + 1):
+                bucket = self.buckets.get((cell_x, cell_y))
+                if bucket:
+                    yield from bucket
+
+    def rectangle(self, x1, y1, x2, y2, kind=None, nation=None):
+        """Returns the entries with x1 <= x <= x2 and y1 <= y <= y2."""
+        return [entry for entry in self.candidates(x1, y1, x2, y2)
+                if x1 <= entry.x <= x2 and y1 <= entry.y <= y2 and matches(entry, kind, nation)]
+
+    def point(self, x, y, kind=None, nation=None):
+        return self.rectangle(x, y, x, y, kind, nation)
+
+    def radius(self, x, y, distance, kind=None, nation=None):
+        """Returns the entries within :distance tiles of (x, y)."""
+        return self.rectangle(x - distance, y - distance, x + distance, y + distance, kind, nation)
+
+    def nearest(self, x, y, k=1, kind=None, nation=None):
+        """Returns the :k nearest entries as list of (distance, entry), sorted by distance."""
+        if self.count == 0:
+            return []
+        # a radius which covers all buckets
+        limit = max(max(abs(cell_x * self.cell_size - x), abs(cell_y * self.cell_size - y)) for cell_x, cell_y in self.buckets) \
+            + self.cell_size
+        distance = self.cell_size
+        while True:
+            # the radius query finds all entries within the distance, so k of them are the k nearest
+            found = self.radius(x, y, distance, kind, nation)
+            if len(found) >= k or distance >= limit:
+                pairs = sorted(((tile_distance(x, y, entry.x, entry.y), entry) for entry in found), key=lambda pair: pair[0])
+                return pairs[:k]
+            distance *= 2
+
+    def pairs(self, distance, other=None, kind=None, nation=None, other_kind=None, other_nation=None):
+        """
+            Returns the (entry, other entry, distance) of all pairs of an entry of this index and an entry of :other
+            within :distance tiles. Without :other the pairs within this index are returned. An entry isn't paired with
+            itself, and with the same filters on both sides every pair is returned once.
+        """
+        other = self if other is None else other
+        symmetric = other is self and (kind, nation) == (other_kind, other_nation)
+        result = []
+        for (cell_x, cell_y), bucket in self.buckets.items():
+            entries = [entry for entry in bucket if matches(entry, kind, nation)]
+            if not entries:
+                continue
+            # the entries of other in the buckets which overlap the cell grown by distance
+            x1 = cell_x * self.cell_size - distance
+            y1 = cell_y * self.cell_size - distance
+            x2 = (cell_x + 1) * self.cell_size - 1 + distance
+            y2 = (cell_y + 1) * self.cell_size - 1 + distance
+            candidates = [entry for entry in other.candidates(x1, y1, x2, y2) if matches(entry, other_kind, other_nation)]
+            for entry in entries:
+                for candidate in candidates:
+                    if candidate is entry or (symmetric and id(candidate) < id(entry)):
+                        continue
+                    entry_distance = tile_distance(entry.x, entry.y, candidate.x, candidate.y)
+                    if entry_distance <= distance:
+                        result.append((entry, candidate, entry_distance))
+        return result
+
+
+def matches(entry, kind, nation):
+    return (kind is None or entry.kind == kind) and (nation is None or entry.nation == nation)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Show the units near the colonies of a savegame.")
+    parser.add_argument("savegame")
+    parser.add_argument("-d", "--distance", type=int, default=3)
+    options = parser.parse_args(args)
+
+    with reader.open_savegame(options.savegame, compiled=True, slots=True) as savegame:
+        index = SpatialIndex.from_savegame(savegame)
+        colonies = SpatialIndex([entry for entry in index if entry.kind == "colony"])
+        for colony, unit, distance in sorted(colonies.pairs(options.distance, index, other_kind="unit"),
+                                             key=lambda pair: (pair[0].item.name, pair[2])):
+            if unit.nation != colony.nation:
+                print("{} ({}): {} {} at {},{} ({} tiles)".format(
+                    colony.item.name, colony.nation, unit.nation, unit.item.type, unit.x, unit.y, distance))
+
+
+if __name__ == "__main__":
+    main()
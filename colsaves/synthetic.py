@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+    Generates synthetic savegames which follow the layout of reader.format, for tests and benchmarks.
+
+    usage: synthetic.py [-s WIDTHxHEIGHT] [-c COLONIES] [-u UNITS] [-t TRIBES] [--seed SEED] OUTPUT
+
+    The values are random but valid: lookups get indices into their arrays, the counts in the header match the
+    sections and the map data only uses known terrain.
+"""
+import os
+import random
+import struct
+import argparse
+
+
+def build_colony(rnd):
+    colonists_num = rnd.randint(0, 32)
+    return b"".join([
+        struct.pack("<BB", rnd.randrange(58), rnd.randrange(72)),
+        rnd.choice([b"Jamestown", b"Plymouth", b"Roanoke"]).ljust(24, b"\0"),
+        struct.pack("<B", rnd.randrange(4)),
+        bytes(rnd.randrange(256) for _ in range(4)),
+        struct.pack("<B", colonists_num),
+        bytes(rnd.randrange(32) for _ in range(64)),
+        bytes(rnd.randrange(256) for _ in range(16 + 8 + 12 + 6 + 2 + 6)),
+        struct.pack("<HB", rnd.randrange(1000), rnd.randrange(60)),
+        bytes(5),
+        struct.pack("<16H", *[rnd.randrange(300) for _ in range(16)]),
+        bytes(8),
+        struct.pack("<ii", rnd.randrange(2000), rnd.randrange(-100, 100)),
+        ])
+
+
+def build_unit(rnd):
+    return b"".join([
+        struct.pack("<BBBBBB", rnd.randrange(58), rnd.randrange(72), rnd.randrange(23), rnd.randrange(12) | rnd.randrange(16) << 4, rnd.randrange(256), rnd.randrange(6)),
+        bytes(2),
+        struct.pack("<BBB", rnd.randrange(10), rnd.randrange(58), rnd.randrange(72)),
+        bytes(1),
+        struct.pack("<B", rnd.randrange(7)),
+        bytes(rnd.randrange(256) for _ in range(3 + 6 + 1)),
+        struct.pack("<B", rnd.randrange(32)),
+        bytes(rnd.randrange(256) for _ in range(4)),
+        ])
+
+
+def build_europe(rnd):
+    return b"".join([
+        struct.pack("<BB3B", 0, rnd.randrange(70), *[rnd.randrange(32) for _ in range(3)]),
+        bytes(2),
+        # there are only 25 founding fathers
+        bytes([rnd.randrange(256), rnd.randrange(256), rnd.randrange(256), rnd.randrange(2)]),
+        bytes(1),
+        struct.pack("<H", rnd.randrange(5000)),
+        bytes(4),
+        struct.pack("<H", rnd.randrange(30)),
+        bytes(10),
+        struct.pack("<B", rnd.randrange(5)),
+        bytes(11),
+        struct.pack("<H", rnd.randrange(60000)),
+        bytes(2),
+        struct.pack("<HH", rnd.randrange(500), rnd.randrange(500)),
+        bytes(26),
+        bytes(rnd.randrange(20) for _ in range(16)),
+        struct.pack("<16h", *[rnd.randrange(-500, 500) for _ in range(16)]),
+        struct.pack("<48i", *[rnd.randrange(-10000, 10000) for _ in range(48)]),
+        ])
+
+
+def build_tribe(rnd):
+    return b"".join([
+        struct.pack("<BBBBBB", rnd.randrange(58), rnd.randrange(72), 4 + rnd.randrange(8), rnd.randrange(4), rnd.randrange(20), rnd.choice([0, 1, 255])),
+        bytes(4),
+        struct.pack("<B", rnd.randrange(10)),
+        bytes(5),
+        struct.pack("<BB", rnd.randrange(256), rnd.randrange(3)),
+        ])
+
+
+def build_indian(rnd):
+    return bytes(58) + bytes(rnd.randrange(2) for _ in range(4)) + bytes(8) + struct.pack("<4H", *[rnd.randrange(100) for _ in range(4)])
+
+
+def build_savegame(num_colonies=3, num_units=5, num_tribes=4, map_size=(12, 9), seed=0):
+    """Returns the bytes of a synthetic savegame."""
+    rnd = random.Random(seed)
+    width, height = map_size
+    players = b"".join(
+        name.ljust(24, b"\0") + continent.ljust(24, b"\0") + struct.pack("<BBH", 0, rnd.randrange(3), rnd.randrange(65536))
+        for name, continent in [(b"Walter Raleigh", b"Virginia"), (b"Jacques Cartier", b"New France"),
+                                (b"Hernan Cortes", b"New Spain"), (b"Peter Minuit", b"New Netherland")])
+    header = b"".join([
+        b"COLONIZE",
+        bytes(4),
+        struct.pack("<HH", width, height),
+        bytes(10),
+        struct.pack("<HHH", 1600 + rnd.randrange(200), rnd.randrange(2), rnd.randrange(300)),
+        bytes(2),
+        struct.pack("<H", rnd.randrange(max(num_units, 1))),
+        bytes(6),
+        struct.pack("<HHH", num_tribes, num_units, num_colonies),
+        bytes(6),
+        struct.pack("<B", rnd.randrange(5)),
+        bytes(51),
+        struct.pack("<4H", *[rnd.randrange(100) for _ in range(4)]),
+        bytes(44),
+        ])
+    map_data = bytes(rnd.choice([0x19, 0x1a, 0x02, 0x03, 0x0b, 0x23, 0x2a, 0x0a]) for _ in range(width * height))
+    return b"".join([
+        header,
+        players,
+        bytes(24),
+        b"".join(build_colony(rnd) for _ in range(num_colonies)),
+        b"".join(build_unit(rnd) for _ in range(num_units)),
+        b"".join(build_europe(rnd) for _ in range(4)),
+        b"".join(build_tribe(rnd) for _ in range(num_tribes)),
+        b"".join(build_indian(rnd) for _ in range(8)),
+        bytes(717),
+        struct.pack("<HH", rnd.randrange(width), rnd.randrange(height)),
+        bytes(2),
+        struct.pack("<HH", rnd.randrange(width), rnd.randrange(height)),
+        map_data,
+        bytes(320),
+        ])
+
+
+def write_sprites(directory, seed=1):
+    """Writes sprites with random colors for all images render.py needs, the forest and mountain sprites are partly transparent."""
+    # imported here, generating savegames doesn't need PIL
+    from PIL import Image
+    import render
+
+    rnd = random.Random(seed)
+    for group, _, name in render.sprite_names():
+        path = os.path.join(directory, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        image = Image.new("RGB" if group in ["terrain", "non_land"] else "RGBA", (16, 16))
+        image.putdata([(rnd.randrange(256), rnd.randrange(256), rnd.randrange(256), rnd.choice([0, 128, 255]))[:len(image.mode)]
+                       for _ in range(256)])
+        image.save(path)
+
+
+def parse_map_size(text):
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Write a synthetic savegame.")
+    parser.add_argument("output")
+    parser.add_argument("-s", "--map-size", type=parse_map_size, default=(58, 72), help="WIDTHxHEIGHT (default: 58x72)")
+    parser.add_argument("-c", "--colonies", type=int, default=3)
+    parser.add_argument("-u", "--units", type=int, default=5)
+    parser.add_argument("-t", "--tribes", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    options = parser.parse_args(args)
+
+    with open(options.output, "wb") as file:
+        file.write(build_savegame(options.colonies, options.units, options.tribes, options.map_size, options.seed))
+
+
+if __name__ == "__main__":
+    main()
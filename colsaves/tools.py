@@ -1,6 +1,9 @@
 #!/usr/bin/env python3
+import os
+import re
 import struct
 import json
+import tempfile
 
 from collections import OrderedDict
 
@@ -68,15 +71,70 @@ def read_byte_by_byte(file):
         yield file.read(1)
 
 
+def read_chunks(file, chunk_size=CHUNK_SIZE):
+    """Returns an iterator over the blocks of byte data of the file from the current position to the end."""
+    while True:
+        data = file.read(chunk_size)
+        if not data:
+            return
+        yield data
+
+
+def terminator_pattern(terminator):
+    """
+        Returns a compiled regular expression which matches one terminator byte. The terminator is either a bytes
+        object of terminator bytes (each of them terminates a token) or a function which gets a single byte (as bytes
+        object) and returns whether it is a terminator.
+    """
+    if callable(terminator):
+        terminator = bytes(value for value in range(256) if terminator(bytes([value])))
+    if not terminator:
+        raise ValueError("no terminator bytes")
+    return re.compile(b"[" + b"".join(re.escape(bytes([value])) for value in terminator) + b"]")
+
+
+def split_tokens(buffer, terminator=b"\x00"):
+    """
+        Returns an iterator over the tokens of a bytes like object (bytes, bytearray, mmap, memoryview). The tokens are
+        memoryviews of the buffer, no data is copied. The terminators are not returned, a last token without terminator
+        is returned when it is not empty.
+    """
+    view = memoryview(buffer)
+    start = 0
+    for match in terminator_pattern(terminator).finditer(view):
+        yield view[start:match.start()]
+        start = match.end()
+    if start < len(view):
+        yield view[start:]
+
+
+def read_tokens(file, terminator=b"\x00", size=None):
+    """
+        Returns an iterator over the tokens of a file from the current position. The file is read in CHUNK_SIZE blocks,
+        up to :size bytes when specified, otherwise to the end. The tokens are bytes, the terminators are not returned.
+        A last token without terminator is returned when it is not empty.
+    """
+    pattern = terminator_pattern(terminator)
+    chunks = read_chunks(file) if size is None else read_partial_stream(file, file.tell(), size)
+    pending = bytearray()
+    for chunk in chunks:
+        start = 0
+        for match in pattern.finditer(chunk):
+            if pending:
+                pending += chunk[start:match.start()]
+                yield bytes(pending)
+                pending.clear()
+            else:
+                yield chunk[start:match.start()]
+            start = match.end()
+        pending += chunk[start:]
+    if pending:
+        yield bytes(pending)
+
+
 def read_terminated_token(file, terminator_function):
     """Returns tokens until a separator is found. the separator is not returned."""
-    result = b""
-    for byte in read_byte_by_byte(file):
-        if terminator_function(byte):
-            yield result
-            result = b""
-        else:
-            result = result + byte
+    return read_tokens(file, terminator_function)
 
 
 def null_terminated(byte):
@@ -127,6 +185,91 @@ def stream_bits(byte_stream, num_bits=1):
         yield current_value
 
 
+def _bit_table(num_bits):
+    """Returns for every byte value the tuple of its :num_bits wide chunks, most significant first."""
+    mask = (1 << num_bits) - 1
+    shifts = range(8 - num_bits, -1, -num_bits)
+    return tuple(tuple((byte >> shift) & mask for shift in shifts) for byte in range(256))
+
+
+# lookup tables for the bit widths which divide a byte
+BIT_TABLES = {num_bits: _bit_table(num_bits) for num_bits in (1, 2, 4)}
+
+
+def unpack_bits(data, num_bits=1):
+    """
+        Returns the same list as list(stream_bits(data, num_bits)): the data split into :num_bits wide numbers, most
+        significant bit first, with the remaining bits of the last byte as last number.
+    """
+    if num_bits == 8:
+        return list(data)
+    table = BIT_TABLES.get(num_bits)
+    if table is not None:
+        return [value for byte in data for value in table[byte]]
+    total_bits = len(data) * 8
+    number = int.from_bytes(data, "big")
+    mask = (1 << num_bits) - 1
+    result = [(number >> shift) & mask for shift in range(total_bits - num_bits, -1, -num_bits)]
+    remaining_bits = total_bits % num_bits
+    if remaining_bits:
+        result.append(number & ((1 << remaining_bits) - 1))
+    return result
+
+
+# for every byte value the positions of its set bits, counted from the most or from the least significant bit
+SET_BITS_MSB_FIRST = tuple(tuple(bit for bit in range(8) if byte & (0x80 >> bit)) for byte in range(256))
+SET_BITS_LSB_FIRST = tuple(tuple(bit for bit in range(8) if byte & (1 << bit)) for byte in range(256))
+
+
+def set_bit_indices(data, msb_first=True):
+    """
+        Returns the indices of the set bits in data. With msb_first the bits of every byte are counted from the most
+        significant bit (the order of stream_bits), otherwise from the least significant bit.
+    """
+    table = SET_BITS_MSB_FIRST if msb_first else SET_BITS_LSB_FIRST
+    return [index * 8 + bit for index, byte in enumerate(data) if byte for bit in table[byte]]
+
+
+def pack_bits(values, num_bits, num_bytes):
+    """Returns :num_bytes bytes with the values packed like unpack_bits() returns them."""
+    total_bits = num_bytes * 8
+    full_values = total_bits // num_bits
+    number = 0
+    for value in values[:full_values]:
+        number = (number << num_bits) | value
+    remaining_bits = total_bits % num_bits
+    if remaining_bits:
+        number = (number << remaining_bits) | values[full_values]
+    return number.to_bytes(num_bytes, "big")
+
+
+def pack_bit_indices(indices, num_bytes, msb_first=True):
+    """Returns :num_bytes bytes with the bits set which set_bit_indices() returns."""
+    data = bytearray(num_bytes)
+    for index in indices:
+        bit = index % 8
+        data[index // 8] |= (0x80 >> bit) if msb_first else (1 << bit)
+    return bytes(data)
+
+
+def changed_ranges(old, new):
+    """Returns the (start, end) ranges in which two byte sequences of the same length differ."""
+    if old == new:
+        return []
+    ranges = []
+    start = None
+    for index, (old_byte, new_byte) in enumerate(zip(old, new)):
+        if old_byte != new_byte:
+            if start is None:
+                start = index
+        elif start is not None:
+            ranges.append((start, index))
+            start = None
+    if start is not None:
+        ranges.append((start, len(new)))
+    return ranges
+
+
 class Block:
 
     """
@@ -172,16 +315,140 @@ class Block:
         return "{}, {}".format(self.start, self.end)
 
 
+class DiskCache:
+
+    """
+        Directory of cache files with a limit of its total size. When the limit is exceeded, the least recently used
+        files are removed. The modification time of a file is the time of its last use.
+    """
+
+    SUFFIX = ".cache"
+
+    def __init__(self, directory, max_size):
+        self.directory = directory
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def load(self, path):
+        """Returns the content of a cache file and marks it as used. Raises FileNotFoundError when it doesn't exist."""
+        with open(path, "rb") as file:
+            data = file.read()
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # evicted by another thread after reading
+            pass
+        return data
+
+    def store(self, path, data):
+        """Writes a cache file atomically and removes the least recently used files above the limit."""
+        # a temporary file of its own for every store, the cache may be used from several threads
+        handle, temporary = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+        try:
+            with os.fdopen(handle, "wb") as file:
+                file.write(data)
+            os.replace(temporary, path)
+        except BaseException:
+            os.remove(temporary)
+            raise
+        self.evict()
+
+    def entries(self):
+        """Returns (last use, size, path) of all cache files, the least recently used first."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(self.SUFFIX):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, path))
+        return sorted(entries)
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            self.remove(path)
+            total -= size
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
 # serialisation stuff
 def object_attributes_to_ordered_dict(obj,  attributes):
     """Returns the specified attributes  from the object in an OrderedDict."""
     dict = OrderedDict()
-    object_vars = vars(obj)
     for attribute in attributes:
-        dict[attribute] = object_vars[attribute]
+        dict[attribute] = getattr(obj, attribute)
     return dict
 
 
+class Code(int):
+
+    """
+        Integer code of an entry of a lookup table. Subclasses set names (a list or a dict with the keys 0..n-1) and
+        the default name of codes which are not in the table (None: the number). Codes compare and hash like ints,
+        str() and the CodeEncoder return the name. Use of() to get the shared instance of a code.
+    """
+
+    __slots__ = ()
+    names = ()
+    default = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.values = [int.__new__(cls, index) for index in range(len(cls.names))]
+
+    @classmethod
+    def of(cls, index):
+        if 0 <= index < len(cls.values):
+            return cls.values[index]
+        return int.__new__(cls, index)
+
+    @property
+    def name(self):
+        try:
+            return self.names[self]
+        except (IndexError, KeyError):
+            return int(self) if self.default is None else self.default
+
+    def __reduce__(self):
+        return type(self).of, (int(self),)
+
+    def __str__(self):
+        return str(self.name)
+
+    def __format__(self, format_spec):
+        return str(self) if format_spec == "" else int.__format__(self, format_spec)
+
+    def __repr__(self):
+        return "<{}.{}: {}>".format(type(self).__name__, self.name, int(self))
+
+
+def resolve_codes(value):
+    """Returns :value with the Codes in it (also in lists, tuples and dicts) replaced by their names."""
+    if isinstance(value, Code):
+        return value.name
+    if type(value) in (list, tuple):
+        return type(value)(resolve_codes(item) for item in value)
+    if type(value) is dict or type(value) is OrderedDict:
+        return type(value)((resolve_codes(key), resolve_codes(item)) for key, item in value.items())
+    return value
+
+
 class Encoder(json.JSONEncoder):
     def default(self, object):
         # is it an object and has the serializeable function? Then use that
@@ -193,3 +460,17 @@ class Encoder(json.JSONEncoder):
             return ",".join([hex(b) for b in object])
         # Let the base class default method raise the TypeError
         return json.JSONEncoder.default(self, object)
+
+
+class CodeEncoder(Encoder):
+
+    """
+        Encoder for savegames read with codes=True. Codes are ints, which are written without calling default(), so
+        they are replaced by their names before.
+    """
+
+    def iterencode(self, object, _one_shot=False):
+        return super().iterencode(resolve_codes(object), _one_shot)
+
+    def default(self, object):
+        return resolve_codes(super().default(object))
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+    Watches savegames and parses them again when the game writes them.
+
+    usage: watch.py [-i INTERVAL] [-o OUTPUT] [--maps DIRECTORY] [--images DIRECTORY] PATH [PATH ...]
+
+    PATH is a savegame, a directory or a glob pattern (see batch.py). The files are polled every INTERVAL seconds
+    (default 1). A file is parsed when its modification time, size or header changed and stayed the same for one more
+    poll, so files which are still being written are skipped. Every parsed savegame is written as JSON line to OUTPUT
+    (default: stdout) and, with --maps, its map is rendered to DIRECTORY/<savegame>.png.
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import functools
+
+import batch
+import diff
+import reader
+import tools
+
+
+@functools.lru_cache(maxsize=None)
+def header_size():
+    """Returns the number of bytes of the fields before the first section of the format."""
+    size = 0
+    for field in reader.format.reader.values():
+        if reader.LazySavegame.is_section(field):
+            break
+        size += reader.reader_size(field, None)
+    return size
+
+
+def file_signature(filename):
+    """Returns (modification time, size, hash of the header) of a file."""
+    with open(filename, "rb") as file:
+        stat = os.fstat(file.fileno())
+        header = file.read(header_size())
+    return stat.st_mtime_ns, stat.st_size, hashlib.blake2b(header, digest_size=16).digest()
+
+
+def read_changes(data, previous=None, compiled=True):
+    """
+        Reads a savegame from bytes. Records and maps whose bytes are the same as in :previous (the savegame returned
+        for the last version of the file) are taken from it instead of being read again. The sections of the returned
+        LazySavegame are lists and the buffer is released.
+    """
+    savegame = reader.load_savegame(data, compiled=compiled)
+    try:
+        digests = diff.savegame_digests(savegame)
+        previous_digests = previous.digests if previous is not None else {}
+        for name in savegame.sections:
+            old_digests = previous_digests.get(name)
+            if old_digests == digests[name]:
+                setattr(savegame, name, getattr(previous, name))
+            elif isinstance(savegame.sections[name], reader.Map):
+                getattr(savegame, name)
+            else:
+                records = getattr(savegame, name)
+                old_records = getattr(previous, name) if old_digests is not None else []
+                setattr(savegame, name, [
+                    old_records[index] if index < len(old_records) and old_digests[index] == digest else records[index]
+                    for index, digest in enumerate(digests[name])])
+    finally:
+        savegame.close()
+    return savegame
+
+
+class Watcher:
+
+    """
+        Polls savegames and calls callback(filename, savegame) for every new or changed savegame. Errors are passed to
+        error(filename, exception).
+    """
+
+    def __init__(self, paths, callback, error=None, compiled=True):
+        self.paths = paths
+        self.callback = callback
+        self.error = error or write_error
+        self.compiled = compiled
+        # filename -> signature of the last poll, for files which changed and are not parsed yet
+        self.pending = {}
+        # filename -> signature when the file was parsed
+        self.signatures = {}
+        # filename -> last savegame read from the file
+        self.savegames = {}
+
+    def poll(self):
+        """Checks all savegames once. Returns the filenames which were parsed."""
+        parsed = []
+        for filename in batch.find_savegames(self.paths):
+            try:
+                signature = file_signature(filename)
+            except OSError:
+                # removed while polling
+                continue
+            if signature == self.signatures.get(filename):
+                self.pending.pop(filename, None)
+                continue
+            if self.pending.get(filename) != signature:
+                # wait for the next poll, the game might still be writing the file
+                self.pending[filename] = signature
+                continue
+            del self.pending[filename]
+            self.signatures[filename] = signature
+            self.parse(filename)
+            parsed.append(filename)
+        return parsed
+
+    def parse(self, filename):
+        try:
+            with open(filename, "rb") as file:
+                data = file.read()
+            savegame = read_changes(data, self.savegames.get(filename), self.compiled)
+        except Exception as e:
+            self.error(filename, e)
+            return
+        self.savegames[filename] = savegame
+        self.callback(filename, savegame)
+
+    def run(self, interval=1.0, polls=None):
+        """Polls every :interval seconds, :polls times or forever."""
+        count = 0
+        while polls is None or count < polls:
+            if count:
+                time.sleep(interval)
+            self.poll()
+            count += 1
+
+
+def write_error(filename, exception):
+    sys.stderr.write("{}: {}: {}\n".format(filename, type(exception).__name__, exception))
+
+
+class LineWriter:
+
+    """Callback which writes every savegame as JSON line like batch.py."""
+
+    def __init__(self, output):
+        self.output = output
+
+    def __call__(self, filename, savegame):
+        batch.write_lines([json.dumps({"file": filename, "savegame": savegame}, cls=tools.Encoder)], self.output)
+
+
+class MapWriter:
+
+    """Callback which renders the map of every savegame. Only the tiles which changed since the last render are painted."""
+
+    def __init__(self, directory, atlas=None):
+        self.directory = directory
+        self.atlas = atlas
+        # filename -> (image, map_data)
+        self.images = {}
+
+    def __call__(self, filename, savegame):
+        # imported here, watching without maps doesn't need PIL
+        import render
+
+        image, map_data = self.images.get(filename, (None, []))
+        if image is None:
+            image = render.render_map(savegame.map, savegame.map_size, self.atlas)
+        else:
+            image = render.update_map(image, map_data, savegame.map, savegame.map_size, self.atlas)
+        self.images[filename] = (image, savegame.map.map_data)
+        image.save(os.path.join(self.directory, os.path.basename(filename) + ".png"), "PNG")
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Parse savegames again when they change.")
+    parser.add_argument("paths", nargs="+", metavar="PATH", help="savegame, directory or glob pattern")
+    parser.add_argument("-i", "--interval", type=float, default=1.0, help="seconds between polls (default: 1)")
+    parser.add_argument("-o", "--output", default="-", help="JSON Lines output file (default: stdout)")
+    parser.add_argument("--maps", metavar="DIRECTORY", help="render the maps into DIRECTORY")
+    parser.add_argument("--images", help="directory of the sprites (default: images)")
+    options = parser.parse_args(args)
+
+    output = sys.stdout if options.output == "-" else open(options.output, "a")
+    callbacks = [LineWriter(output)]
+    if options.maps:
+        import render
+        callbacks.append(MapWriter(options.maps, render.get_atlas(options.images or render.IMAGES_DIRECTORY)))
+
+    def callback(filename, savegame):
+        for function in callbacks:
+            function(filename, savegame)
+
+    try:
+        Watcher(options.paths, callback).run(options.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
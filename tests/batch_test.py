@@ -0,0 +1,53 @@
+import os
+import json
+
+import batch
+
+from conftest import build_savegame
+
+
+def test_batch_writes_one_line_per_savegame(tmp_path):
+    for seed in range(5):
+        (tmp_path / "COLONY0{}.SAV".format(seed)).write_bytes(build_savegame(seed=seed))
+    (tmp_path / "COLONY09.SAV").write_bytes(b"COLONIZE")
+    (tmp_path / "notes.txt").write_text("not a savegame")
+    output = tmp_path / "saves.jsonl"
+
+    batch.main(["-w", "2", "-c", "2", "-o", str(output), str(tmp_path)])
+
+    lines = [json.loads(line) for line in output.read_text().splitlines()]
+    assert sorted(line["file"] for line in lines) == batch.find_savegames([str(tmp_path)])
+    assert len(lines) == 6
+    errors = [line for line in lines if "error" in line]
+    assert [line["file"] for line in errors] == [str(tmp_path / "COLONY09.SAV")]
+    for line in lines:
+        if "savegame" in line:
+            assert line["savegame"]["magic"] == "COLONIZE"
+
+
+def test_find_savegames_with_glob(tmp_path):
+    (tmp_path / "a.SAV").write_bytes(b"")
+    (tmp_path / "b.sav").write_bytes(b"")
+    assert batch.find_savegames([str(tmp_path / "*.SAV")]) == [str(tmp_path / "a.SAV")]
+    assert batch.find_savegames([str(tmp_path / "b.sav")]) == [str(tmp_path / "b.sav")]
+
+
+def crash_on_broken(filenames):
+    if any(filename.endswith("BROKEN.SAV") for filename in filenames):
+        os._exit(1)
+    return batch.parse_chunk(filenames)
+
+
+def test_crashed_worker_fails_only_submitted_chunks(tmp_path):
+    filenames = []
+    for seed in range(12):
+        filename = tmp_path / ("BROKEN.SAV" if seed == 0 else "COLONY{:02d}.SAV".format(seed))
+        filename.write_bytes(build_savegame(seed=seed))
+        filenames.append(str(filename))
+
+    lines = [json.loads(line) for line in batch.parse_files(filenames, workers=1, chunksize=1, task=crash_on_broken)]
+    assert sorted(line["file"] for line in lines) == sorted(filenames)
+    failed = [line["file"] for line in lines if "error" in line]
+    assert str(tmp_path / "BROKEN.SAV") in failed
+    # only the chunks submitted with the crashed one fail, the pool is replaced for the others
+    assert len(failed) <= 2
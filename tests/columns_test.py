@@ -0,0 +1,26 @@
+import collections
+
+import columns
+import reader
+
+from conftest import build_savegame
+
+
+def test_count_units_by_type(tmp_path):
+    expected = collections.Counter()
+    for seed in range(3):
+        data = build_savegame(num_units=5 + seed, seed=seed)
+        (tmp_path / "COLONY0{}.SAV".format(seed)).write_bytes(data)
+        expected.update(unit.type for unit in reader.parse_savegame(data).units)
+
+    filenames = sorted(str(path) for path in tmp_path.iterdir())
+    counts = columns.count_by((columns.read_section(filename, "units") for filename in filenames), "type")
+    names = columns.field_names("units", "type")
+    assert {names[value]: count for value, count in enumerate(counts) if count} == expected
+
+
+def test_main(tmp_path, capsys):
+    (tmp_path / "COLONY00.SAV").write_bytes(build_savegame(num_colonies=4, seed=2))
+    columns.main(["-s", "colonies", "-f", "nation", str(tmp_path)])
+    nations = collections.Counter(colony.nation for colony in reader.parse_savegame(build_savegame(num_colonies=4, seed=2)).colonies)
+    assert sorted(capsys.readouterr().out.splitlines()) == sorted("{}: {}".format(*item) for item in nations.items())
@@ -0,0 +1,25 @@
+import os
+import sys
+
+import pytest
+
+# reader.py imports its siblings as top level modules
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "colsaves"))
+
+import synthetic
+from synthetic import build_savegame
+
+
+@pytest.fixture
+def savegame_file(tmp_path):
+    path = tmp_path / "COLONY00.SAV"
+    path.write_bytes(build_savegame())
+    return str(path)
+
+
+@pytest.fixture(scope="session")
+def images_directory(tmp_path_factory):
+    """Directory with sprites for the map: random colors, the forest and mountain sprites are partly transparent."""
+    directory = tmp_path_factory.mktemp("images")
+    synthetic.write_sprites(str(directory))
+    return str(directory)
@@ -0,0 +1,63 @@
+import struct
+
+import diff
+import reader
+
+from conftest import build_savegame
+
+
+def patch(data, offset, format, *values):
+    data = bytearray(data)
+    struct.pack_into("<" + format, data, offset, *values)
+    return bytes(data)
+
+
+def test_identical_savegames():
+    data = build_savegame(seed=1)
+    assert diff.diff_savegames(reader.load_savegame(data), reader.load_savegame(data)) == []
+
+
+def test_diff_savegames():
+    data = build_savegame(num_colonies=3, num_units=4, seed=2)
+    old = reader.load_savegame(data, compiled=True, slots=True)
+    index = old.section_index
+    changed = patch(data, index["turn"][0], "H", old.turn + 1)
+    # unit 2 moves to 10, 11
+    changed = patch(changed, index["units"][0] + 2 * 28, "BB", 10, 11)
+    # colony 1: 20 more food (storage starts at offset 154 of the colony)
+    food = old.colonies[1].goods["Food"]
+    changed = patch(changed, index["colonies"][0] + 202 + 154, "H", food + 20)
+    # english gold
+    changed = patch(changed, index["europe"][0] + 42, "H", 1234)
+    changed = patch(changed, index["map"][0] + 13, "B", 0x19)
+    new = reader.load_savegame(changed, compiled=True, slots=True)
+
+    changes = diff.diff_savegames(old, new)
+    assert changes[0] == diff.Change("header", None, "turn", old.turn, old.turn + 1)
+    assert diff.Change("colonies", 1, "goods.Food", food, food + 20) in changes
+    assert diff.Change("units", 2, "pos.x", old.units[2].pos.x, 10) in changes
+    assert diff.Change("units", 2, "pos.y", old.units[2].pos.y, 11) in changes
+    assert diff.Change("europe", 0, "gold", old.europe[0].gold, 1234) in changes
+    assert changes[-1] == diff.Change("map", (1, 1), "tile", old.raw("map")[13], 0x19)
+    # only the changed records are decoded
+    assert new.units.records[1] is None
+    assert new.colonies.records[0] is None
+    assert diff.format_change(diff.Change("colonies", 1, "goods.Food", 10, 30)) == "colonies[1].goods.Food: 10 -> 30 (+20)"
+
+
+def test_added_records():
+    old = reader.load_savegame(build_savegame(num_units=2, seed=3))
+    new = reader.load_savegame(build_savegame(num_units=3, seed=3))
+    changes = [change for change in diff.diff_savegames(old, new) if change.section == "units"]
+    assert changes[-1].index == 2
+    assert changes[-1].field is None and changes[-1].old is None
+    assert diff.Change("header", None, "pos", old.pos, old.pos + 28) in diff.diff_savegames(old, new)
+
+
+def test_fields_without_bytes_are_compared_by_value():
+    data = build_savegame(seed=4)
+    old = reader.load_savegame(data)
+    new = reader.load_savegame(data)
+    # pos (Tell) covers no bytes, its digest would be the same for every savegame
+    new.pos = old.pos + 10
+    assert diff.diff_savegames(old, new) == [diff.Change("header", None, "pos", old.pos, old.pos + 10)]
@@ -0,0 +1,49 @@
+import io
+import json
+
+import export
+import reader
+import tools
+
+from conftest import build_savegame
+
+
+def expected_json(savegame, sections=export.SECTIONS):
+    expected = {}
+    if "header" in sections:
+        expected = json.loads(json.dumps(savegame, cls=tools.Encoder))
+        del expected["map"]
+    for name in export.SECTIONS[1:-1]:
+        if name in sections:
+            expected[name] = json.loads(json.dumps(getattr(savegame, name), cls=tools.Encoder))
+    if "map" in sections:
+        expected["map"] = json.loads(json.dumps(savegame.map, cls=tools.Encoder))
+    return expected
+
+
+def export_json(savegame, sections=export.SECTIONS):
+    output = io.StringIO()
+    export.write_json(savegame, output, sections)
+    return json.loads(output.getvalue())
+
+
+def test_write_json():
+    data = build_savegame(num_colonies=2, num_units=4, seed=1)
+    savegame = reader.parse_savegame(data)
+    assert export_json(savegame) == expected_json(savegame)
+    assert export_json(reader.load_savegame(data, compiled=True)) == expected_json(savegame)
+
+
+def test_write_json_sections():
+    data = build_savegame(num_colonies=2, num_units=4, seed=2)
+    savegame = reader.parse_savegame(data)
+    for sections in [["units"], ["header", "map"], ["map"], ["tribes", "colonies"], []]:
+        lazy = reader.load_savegame(data)
+        assert export_json(lazy, sections) == expected_json(savegame, sections)
+        assert "map" not in vars(lazy)
+
+
+def test_export_main(savegame_file, tmp_path):
+    output = tmp_path / "savegame.json"
+    export.main(["-s", "units", "-o", str(output), savegame_file])
+    assert list(json.loads(output.read_text())) == ["units"]
@@ -0,0 +1,92 @@
+import collections
+
+import reader
+import geography
+
+from conftest import build_savegame
+
+
+def make_map(rows):
+    """Returns a map from rows of "." (ocean), "p" (plain), "f" (forest) and "m" (mountain)."""
+    codes = {".": 0x19, "p": 0x02, "f": 0x0a, "m": 0x22}
+    map = reader.Map()
+    map.map_data = [bytes(codes[char] for char in row) for row in rows]
+    map.map_size = reader.Position()
+    map.map_size.x, map.map_size.y = len(rows[0]), len(rows)
+    return map
+
+
+def flood_labels(world):
+    """Components by flood fill, as sets of indices."""
+    seen = set()
+    components = []
+    for start in range(world.width * world.height):
+        if start in seen:
+            continue
+        component = {start}
+        stack = [start]
+        while stack:
+            index = stack.pop()
+            for neighbour in world.neighbours(index):
+                if neighbour not in component and world.land[neighbour] == world.land[start]:
+                    component.add(neighbour)
+                    stack.append(neighbour)
+        seen |= component
+        components.append(component)
+    return components
+
+
+def test_components():
+    map = make_map([
+        "pp..f.",
+        "p...m.",
+        ".p....",
+        "......",
+        "mm..pp",
+    ])
+    world = geography.Geography(map.map_data, map.map_size)
+    assert world.same_component((0, 0), (1, 1)) is False
+    assert world.same_component((0, 0), (0, 1))
+    # diagonal neighbours are connected
+    assert world.same_component((0, 1), (1, 2))
+    assert world.same_component((4, 0), (4, 1))
+    assert not world.same_component((0, 0), (4, 0))
+    assert [world.sizes[label] for label in world.components(land=True)] == [4, 2, 2, 2]
+    assert len(world.components(land=False)) == 1
+    assert world.coastal(0, 0) and world.coastal(4, 1)
+
+
+def test_components_match_flood_fill():
+    savegame = reader.parse_savegame(build_savegame(map_size=(30, 20), seed=5))
+    world = geography.geography(savegame.map)
+    groups = collections.defaultdict(set)
+    for index, label in enumerate(world.labels):
+        groups[label].add(index)
+    assert sorted(map(sorted, groups.values())) == sorted(map(sorted, flood_labels(world)))
+
+
+def test_distances():
+    map = make_map([
+        "pfmp.",
+        "ppppp",
+        "....p",
+    ])
+    world = geography.Geography(map.map_data, map.map_size)
+    field = world.distances([(0, 0)])
+    assert field[world.index(1, 0)] == 2
+    assert field[world.index(2, 0)] == 4
+    assert field[world.index(3, 0)] == 3
+    assert field[world.index(4, 2)] == 4
+    assert field[world.index(0, 2)] is None
+    assert world.distances([(0, 0)]) is field
+    assert world.distance([(0, 0), (4, 2)], 3, 0) == 2
+    sea = world.distances([(4, 0)], land=False)
+    assert sea[world.index(4, 0)] == 0 and sea[world.index(3, 2)] is None
+    assert world.distances([(3, 1)], land=False)[world.index(0, 2)] == 3
+
+
+def test_geography_is_cached_per_map_content():
+    first = reader.parse_savegame(build_savegame(seed=1)).map
+    second = reader.parse_savegame(build_savegame(seed=1)).map
+    assert geography.geography(first) is geography.geography(second)
+    assert geography.geography(reader.parse_savegame(build_savegame(seed=2)).map) is not geography.geography(first)
@@ -0,0 +1,45 @@
+import history
+import reader
+
+from conftest import build_savegame
+
+
+def test_ingest_campaign(tmp_path):
+    directory = tmp_path / "campaign"
+    directory.mkdir()
+    savegames = {}
+    for seed in range(3):
+        data = build_savegame(num_colonies=2, num_units=3, num_tribes=2, seed=seed)
+        (directory / "COLONY0{}.SAV".format(seed)).write_bytes(data)
+        savegames[seed] = reader.parse_savegame(data)
+
+    database = str(tmp_path / "history.db")
+    history.main([database, str(directory)])
+    # ingesting again doesn't store anything twice
+    history.main([database, str(directory / "COLONY01.SAV")])
+
+    with history.History(database) as store:
+        assert store.query("select count(*) from saves") == [(3,)]
+        gold = store.gold_per_turn("campaign")
+        assert len(gold) == 12
+        expected = sorted((savegame.turn, savegame.year, savegame.autumn, index, europe.gold)
+                          for savegame in savegames.values() for index, europe in enumerate(savegame.europe))
+        assert gold == expected
+
+        savegame = savegames[1]
+        assert (savegame.turn, savegame.year, savegame.autumn, savegame.units[2].pos.x, savegame.units[2].pos.y) in store.unit_positions("campaign", 2)
+        colony = savegame.colonies[0]
+        assert store.query(
+            "select g.amount from colony_goods g join saves s on s.id = g.save_id "
+            "where s.turn = ? and g.colony_index = 0 and g.goods = 'Food'", (savegame.turn,)) == [(colony.goods["Food"],)]
+        assert store.query("select count(*) from colony_buildings join saves s on s.id = save_id where s.turn = ? and colony_index = 0",
+                           (savegame.turn,)) == [(len(colony.buildings),)]
+
+
+def test_ingest_is_idempotent(tmp_path):
+    data = build_savegame(seed=4)
+    with history.History(str(tmp_path / "history.db")) as store:
+        assert store.ingest(data, "game") is not None
+        assert store.ingest(data, "game") is None
+        assert store.ingest(data, "other game") is not None
+        assert store.query("select count(*) from units") == [(10,)]
@@ -0,0 +1,56 @@
+import os
+import pickle
+
+import reader
+import parsecache
+
+from conftest import build_savegame
+from reader_test import assert_same_savegame
+
+
+def test_cache_returns_parsed_savegame(tmp_path, savegame_file):
+    cache = parsecache.ParseCache(str(tmp_path / "cache"))
+    expected = reader.read_savegame(savegame_file)
+    for slots in [False, True]:
+        assert_same_savegame(expected, reader.read_savegame(savegame_file, slots=slots, cache=cache))
+        savegame = reader.read_savegame(savegame_file, slots=slots, cache=cache)
+        assert isinstance(savegame, parsecache.CachedSavegame)
+        assert "units" not in vars(savegame) and savegame.num_units == 5
+        assert_same_savegame(expected, savegame)
+        assert_same_savegame(expected, pickle.loads(pickle.dumps(savegame)))
+        assert (type(savegame.units[0]) is reader.Unit.Record) == slots
+    assert (cache.hits, cache.misses) == (2, 2)
+    assert len(cache.entries()) == 2
+
+
+def test_unpickled_map_decodes_tiles():
+    savegame = reader.parse_savegame(build_savegame(seed=2))
+    data = pickle.dumps(savegame.map)
+    assert len(data) < len(pickle.dumps(savegame.map.tiles))
+    assert [tile.forest_neighbours for tile in pickle.loads(data).tiles] == [tile.forest_neighbours for tile in savegame.map.tiles]
+
+
+def test_schema_change_invalidates_entries(tmp_path, monkeypatch):
+    assert parsecache.describe(reader.Bean(reader.Tribe, x=reader.Word())) == "Tribe(x=Word())"
+    assert parsecache.describe(reader.Loop(4, reader.String(24))) == "Loop(4, String(length=24))"
+    assert parsecache.describe(reader.compiled_format) == parsecache.describe(reader.format)
+
+    directory = str(tmp_path / "cache")
+    data = build_savegame(seed=1)
+    parsecache.ParseCache(directory).parse(data)
+    assert len(os.listdir(directory)) == 1
+    monkeypatch.setattr(parsecache, "schema_version", lambda: "0123456789abcdef")
+    cache = parsecache.ParseCache(directory)
+    assert os.listdir(directory) == []
+    cache.parse(data)
+    assert cache.misses == 1
+
+
+def test_main(tmp_path, capsys):
+    cache = parsecache.ParseCache(str(tmp_path))
+    for seed in range(2):
+        cache.parse(build_savegame(seed=seed))
+    parsecache.main([str(tmp_path)])
+    assert capsys.readouterr().out.startswith("2 entries, ")
+    parsecache.main(["--clear", str(tmp_path)])
+    assert capsys.readouterr().out == "0 entries, 0.0 MB\n"
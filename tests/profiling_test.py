@@ -0,0 +1,44 @@
+import io
+import json
+
+import reader
+import profiling
+
+from conftest import build_savegame
+from reader_test import assert_same_savegame
+
+
+def find(block, *names):
+    for name in names:
+        block = block.childs[name]
+    return block
+
+
+def test_profile_savegame():
+    data = build_savegame(num_colonies=3, num_units=7, num_tribes=2, seed=2)
+    for compiled in [False, True]:
+        savegame, profile = profiling.profile_savegame(data, compiled)
+        assert_same_savegame(reader.parse_savegame(data), savegame)
+        root = profile.root
+        assert root.bytes == len(data)
+        assert find(root, "units", "[]").count == 7
+        assert find(root, "units", "[]").bytes == 7 * 28
+        assert find(root, "colonies", "[]", "after_read").count == 3
+        assert find(root, "map").bytes == 12 * 9
+        assert abs(root.time - sum(block.time for block in root.blocks)) < 1e-9
+
+
+def test_profile_export():
+    _, profile = profiling.profile_savegame(build_savegame(seed=1))
+    tree = json.loads(json.dumps(profile.to_dict()))
+    assert tree["name"] == "savegame"
+    assert [block["name"] for block in tree["blocks"]] == list(reader.format.reader)
+    units = next(block for block in tree["blocks"] if block["name"] == "units")
+    assert units["blocks"][0]["name"] == "[]"
+
+    output = io.StringIO()
+    profile.write_collapsed(output)
+    for line in output.getvalue().splitlines():
+        stack, micros = line.rsplit(" ", 1)
+        assert stack.startswith("savegame")
+        assert int(micros) > 0
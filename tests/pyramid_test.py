@@ -0,0 +1,57 @@
+import pytest
+
+from PIL import Image
+
+import reader
+import render
+import pyramid
+
+from conftest import build_savegame
+
+
+def test_highest_zoom_matches_render(tmp_path, images_directory):
+    savegame = reader.parse_savegame(build_savegame(map_size=(20, 35), seed=5))
+    atlas = render.SpriteAtlas.load(images_directory)
+    tiles = pyramid.TilePyramid(str(tmp_path), atlas)
+    zoom = pyramid.max_zoom(savegame.map_size)
+    assert (zoom, pyramid.tile_count(savegame.map_size, zoom), pyramid.tile_count(savegame.map_size, 0)) == (2, (2, 3), (1, 1))
+
+    full = Image.new("RGBA", (2 * pyramid.TILE_PIXELS, 3 * pyramid.TILE_PIXELS))
+    for x in range(2):
+        for y in range(3):
+            full.paste(tiles.image(savegame.map, zoom, x, y), (x * pyramid.TILE_PIXELS, y * pyramid.TILE_PIXELS))
+    expected = render.render_map(savegame.map, savegame.map_size, atlas)
+    assert full.crop((0, 0) + expected.size).tobytes() == expected.tobytes()
+
+    overview = tiles.image(savegame.map, 0, 0, 0)
+    assert overview.size == (pyramid.TILE_PIXELS, pyramid.TILE_PIXELS)
+    assert overview.tobytes() == full.reduce(2).reduce(2).crop((0, 0, 256, 256)).tobytes()
+
+
+def test_unchanged_tiles_are_reused(tmp_path, images_directory):
+    savegame = reader.parse_savegame(build_savegame(map_size=(40, 40), seed=6))
+    tiles = pyramid.TilePyramid(str(tmp_path), render.SpriteAtlas.load(images_directory))
+    tiles.tile(savegame.map, 0, 0, 0)
+    assert (tiles.hits, tiles.misses) == (0, 1 + 4 + 9)
+
+    # the next turn changes one tile of the map
+    map_data = list(savegame.map.map_data)
+    map_data[37] = map_data[37][:2] + bytes([map_data[37][2] ^ 0x08]) + map_data[37][3:]
+    next_turn = reader.parse_savegame(build_savegame(map_size=(40, 40), seed=6))
+    next_turn.map.map_data = map_data
+    next_turn.map.tiles = reader.Map().read_tiles(map_data, next_turn.map_size)
+    tiles.hits = tiles.misses = 0
+    png = tiles.tile(next_turn.map, 0, 0, 0)
+    # only the images which contain the tile are generated again, one per level
+    assert tiles.misses == 3
+    # the other images of level 1 and the other image of level 2 in the changed image of level 1
+    assert tiles.hits == 3 + 1
+    assert png != tiles.tile(savegame.map, 0, 0, 0)
+
+
+@pytest.mark.parametrize("zoom, x, y", [(1, 0, 0), (0, 1, 0), (0, 0, -1)])
+def test_tiles_outside_of_the_map(tmp_path, images_directory, zoom, x, y):
+    savegame = reader.parse_savegame(build_savegame(map_size=(10, 10)))
+    tiles = pyramid.TilePyramid(str(tmp_path), render.SpriteAtlas.load(images_directory))
+    with pytest.raises(IndexError):
+        tiles.tile(savegame.map, zoom, x, y)
@@ -0,0 +1,329 @@
+import io
+import os
+import sys
+import json
+import pickle
+import subprocess
+
+import pytest
+
+import reader
+import tools
+
+from conftest import build_savegame
+
+
+def read(data, format=reader.format):
+    return format.read(reader.Context(io.BytesIO(data)))
+
+
+def to_json(obj, encoder=tools.Encoder):
+    return json.dumps(obj, cls=encoder)
+
+
+def tile_values(tile):
+    return tuple(getattr(tile, name) for name in reader.Tile.__slots__)
+
+
+def assert_same_savegame(expected, actual, encoder=tools.Encoder):
+    assert to_json(expected) == to_json(actual, encoder)
+    for section in ["players", "colonies", "units", "europe", "tribes", "indians"]:
+        assert to_json(getattr(expected, section)) == to_json(getattr(actual, section), encoder)
+    assert [tile_values(tile) for tile in expected.map.tiles] == [tile_values(tile) for tile in actual.map.tiles]
+
+
+def test_read_savegame(savegame_file):
+    savegame = reader.read_savegame(savegame_file)
+    assert savegame.magic == "COLONIZE"
+    assert (savegame.map_size.x, savegame.map_size.y) == (12, 9)
+    assert len(savegame.colonies) == 3
+    assert len(savegame.units) == 5
+    assert len(savegame.tribes) == 4
+    assert [unit.id for unit in savegame.units] == [0, 1, 2, 3, 4]
+    assert len(savegame.map.tiles) == 12 * 9
+    assert savegame.pos == len(build_savegame()) - 320
+
+
+def test_compile_fixed_records():
+    assert reader.Colony().compile().format.startswith("BB24sB4sB")
+    assert reader.struct.calcsize("<" + reader.Colony().compile().format) == 202
+    assert reader.struct.calcsize("<" + reader.Unit().compile().format) == 28
+    assert reader.struct.calcsize("<" + reader.Europe().compile().format) == 316
+    assert reader.struct.calcsize("<" + reader.Tribe().compile().format) == 18
+    assert reader.struct.calcsize("<" + reader.Indian().compile().format) == 78
+    assert reader.struct.calcsize("<" + reader.Player().compile().format) == 52
+    assert reader.format.compile() is None
+
+
+def test_compiled_format_reads_same_objects():
+    for seed in range(5):
+        data = build_savegame(num_colonies=seed, num_units=2 * seed, num_tribes=seed + 1, seed=seed)
+        expected = read(data)
+        actual = read(data, reader.compiled_format)
+        assert_same_savegame(expected, actual)
+        for expected_unit, actual_unit in zip(expected.units, actual.units):
+            assert expected_unit.id == actual_unit.id
+            assert expected_unit.cargo == actual_unit.cargo
+        for expected_colony, actual_colony in zip(expected.colonies, actual.colonies):
+            assert to_json(expected_colony.colonists) == to_json(actual_colony.colonists)
+            assert expected_colony.goods == actual_colony.goods
+
+
+def test_read_compiled_savegame(savegame_file):
+    assert_same_savegame(reader.read_savegame(savegame_file), reader.read_savegame(savegame_file, compiled=True))
+
+
+def test_buffer_context():
+    context = reader.BufferContext(b"\x01\x02\x03\x04abc\0de")
+    assert reader.Word().read(context) == 0x0201
+    assert reader.Byte().read(context) == 3
+    assert context.tell() == 3
+    context.seek(1, reader.os.SEEK_CUR)
+    assert reader.String(5).read(context) == "abc"
+    assert context.tell() == 9
+    context.seek(-2, reader.os.SEEK_END)
+    assert reader.Bytes(2).read(context) == b"de"
+
+
+def test_parse_savegame_from_buffer():
+    data = build_savegame(num_colonies=4, num_units=7, seed=3)
+    expected = read(data)
+    assert_same_savegame(expected, reader.parse_savegame(data))
+    assert_same_savegame(expected, reader.parse_savegame(bytearray(data), compiled=True))
+    assert_same_savegame(expected, reader.parse_savegame(memoryview(data)))
+
+
+def test_read_savegame_with_mmap(savegame_file):
+    expected = reader.read_savegame(savegame_file)
+    assert_same_savegame(expected, reader.read_savegame(savegame_file, use_mmap=True))
+    assert_same_savegame(expected, reader.read_savegame(savegame_file, compiled=True, use_mmap=True))
+
+
+def test_map_neighbours_stay_inside_the_map():
+    map_size = reader.Position()
+    map_size.x, map_size.y = 3, 2
+    # forest everywhere
+    tiles = reader.Map(None).read_tiles([b"\x0a\x0a\x0a", b"\x0a\x0a\x0a"], map_size)
+    assert [tile.forest_neighbours for tile in tiles] == [0b0101, 0b0111, 0b0110, 0b1001, 0b1011, 0b1010]
+    assert [tile.mountain_neighbours for tile in tiles] == [0] * 6
+
+
+def test_array_map_matches_tiles():
+    for seed in range(3):
+        data = build_savegame(map_size=(17 + seed, 11), seed=seed)
+        expected = reader.parse_savegame(data)
+        actual = reader.parse_savegame(data, map_arrays=True)
+        assert isinstance(actual.map, reader.ArrayMap)
+        assert actual.map.map_data == expected.map.map_data
+        assert len(actual.map.tiles) == len(expected.map.tiles)
+        assert [tile_values(tile) for tile in actual.map.tiles] == [tile_values(tile) for tile in expected.map.tiles]
+        assert tile_values(actual.map.tiles[-1]) == tile_values(expected.map.tiles[-1])
+        assert to_json(actual.map) == to_json(expected.map)
+
+
+def test_lazy_savegame_reads_sections_on_access():
+    data = build_savegame(num_colonies=4, num_units=6, num_tribes=3, seed=7)
+    expected = read(data)
+    savegame = reader.load_savegame(data)
+    assert "units" not in vars(savegame)
+    assert savegame.num_units == 6
+    unit = savegame.units[4]
+    assert unit.id == 4
+    assert to_json(unit) == to_json(expected.units[4])
+    assert savegame.units.records[3] is None
+    assert savegame.pos == expected.pos
+    assert_same_savegame(expected, savegame)
+
+
+def test_lazy_savegame_section_index():
+    data = build_savegame(num_colonies=2, num_units=3, num_tribes=5, map_size=(10, 4))
+    savegame = reader.load_savegame(data, compiled=True)
+    assert savegame.section_index["colonies"] == (390, 2 * 202)
+    assert savegame.section_index["units"] == (390 + 2 * 202, 3 * 28)
+    assert savegame.section_index["map"][1] == 40
+    assert savegame.section_index["padding_final"] == (len(data) - 320, 320)
+
+
+def test_open_savegame(savegame_file):
+    expected = reader.read_savegame(savegame_file)
+    with reader.open_savegame(savegame_file, compiled=True, map_arrays=True) as savegame:
+        assert_same_savegame(expected, savegame)
+
+
+def test_slotted_records():
+    data = build_savegame(num_colonies=3, num_units=4, seed=5)
+    expected = read(data)
+    for compiled in [False, True]:
+        savegame = reader.parse_savegame(data, compiled=compiled, slots=True)
+        assert_same_savegame(expected, savegame)
+        colony = savegame.colonies[0]
+        assert not hasattr(colony, "__dict__")
+        assert type(colony) is reader.Colony.Record
+        assert not hasattr(colony, "colonists_occupation")
+        assert [colonist.occupation for colonist in colony.colonists] == [colonist.occupation for colonist in expected.colonies[0].colonists]
+        assert [unit.cargo for unit in savegame.units] == [unit.cargo for unit in expected.units]
+        assert savegame.europe[1].founding_fathers == expected.europe[1].founding_fathers
+
+
+def test_pickle_slotted_records():
+    savegame = reader.parse_savegame(build_savegame(seed=6), compiled=True, slots=True)
+    assert to_json(pickle.loads(pickle.dumps(savegame.units))) == to_json(savegame.units)
+    assert_same_savegame(savegame, pickle.loads(pickle.dumps(savegame)))
+
+
+def test_unpickle_slotted_records_in_new_process():
+    savegame = reader.parse_savegame(build_savegame(seed=6), compiled=True, slots=True)
+    script = "import pickle, sys; sys.path.insert(0, {!r}); print(pickle.load(sys.stdin.buffer).units[1].id)".format(
+        os.path.dirname(reader.__file__))
+    result = subprocess.run([sys.executable, "-c", script], input=pickle.dumps(savegame), stdout=subprocess.PIPE, check=True)
+    assert result.stdout.strip() == b"1"
+
+
+def test_unchanged_lazy_savegame_has_no_patches():
+    data = build_savegame(num_colonies=4, num_units=6, num_tribes=3, seed=8)
+    for compiled, slots in [(False, False), (True, True)]:
+        savegame = reader.load_savegame(data, compiled=compiled, slots=slots, map_arrays=compiled)
+        for section in ["players", "colonies", "units", "europe", "tribes", "indians"]:
+            list(getattr(savegame, section))
+        assert savegame.map.map_data
+        assert savegame.patches() == []
+        assert savegame.to_bytes() == data
+
+
+def test_write_changed_fields():
+    data = build_savegame(num_colonies=3, num_units=4, num_tribes=2, seed=3)
+    for compiled, slots in [(False, False), (True, True)]:
+        savegame = reader.load_savegame(data, compiled=compiled, slots=slots)
+        savegame.year += 1
+        savegame.europe[1].gold += 100
+        savegame.europe[1].founding_fathers = reader.FOUNDING_FATHERS[2:4]
+        savegame.units[2].pos.x += 1
+        colony = savegame.colonies[0]
+        colony.goods["Food"] = 77
+        colony.customs_house = ["Furs", "Silver"]
+        colony.buildings = colony.buildings[:-1]
+        colony.colonists[0].time = 5
+
+        patches = savegame.patches()
+        europe_offset = savegame.europe.offset + savegame.europe.record_size
+        assert all(europe_offset <= offset < europe_offset + savegame.europe.record_size
+                   for offset, _ in patches if offset >= savegame.section_index["europe"][0])
+        written = reader.parse_savegame(savegame.to_bytes(), compiled=compiled, slots=slots)
+        assert written.year == savegame.year
+        assert written.europe[1].gold == savegame.europe[1].gold
+        assert written.europe[1].founding_fathers == reader.FOUNDING_FATHERS[2:4]
+        assert written.units[2].pos.x == savegame.units[2].pos.x
+        assert written.colonies[0].goods == colony.goods
+        assert written.colonies[0].customs_house == ["Furs", "Silver"]
+        assert written.colonies[0].buildings == colony.buildings
+        assert to_json(written.colonies[0].colonists) == to_json(colony.colonists)
+        assert to_json(written.colonies[1:]) == to_json(savegame.colonies[1:])
+        assert to_json(written.tribes) == to_json(savegame.tribes)
+
+
+def test_write_changed_cargo():
+    data = build_savegame(num_units=4, seed=3)
+    for compiled, slots in [(False, False), (True, True)]:
+        savegame = reader.load_savegame(data, compiled=compiled, slots=slots)
+        savegame.units[0].cargo = [("Furs", 100), ("Horses", 50)]
+        savegame.units[1].cargo = savegame.units[1].cargo[1:]
+        savegame.units[2].cargo.append(("Muskets", 20))
+        written = reader.parse_savegame(savegame.to_bytes(), compiled=compiled, slots=slots)
+        assert written.units[0].cargo == [("Furs", 100), ("Horses", 50)]
+        assert written.units[1].cargo == [("Cloth", 107), ("Trade Goods", 132)]
+        assert written.units[2].cargo == [("Tools", 229), ("Muskets", 20)]
+        assert to_json(written.units[3]) == to_json(savegame.units[3])
+        # the last amount is not cargo, it is the number of tools of a pioneer
+        assert written.units[0].cargo_amount[-1] == savegame.units[0].cargo_amount[-1]
+
+        for count in [6, 7]:
+            savegame.units[0].cargo = [("Furs", 1)] * count
+            with pytest.raises(ValueError):
+                savegame.to_bytes()
+        savegame.units[0].cargo = [("Furs", 1)] * 5
+        written = reader.parse_savegame(savegame.to_bytes(), compiled=compiled, slots=slots)
+        assert written.units[0].cargo == [("Furs", 1)] * 5
+        assert written.units[0].cargo_amount[-1] == savegame.units[0].cargo_amount[-1]
+
+
+def test_save_patches_file(tmp_path):
+    filename = tmp_path / "COLONY00.SAV"
+    data = build_savegame(seed=4)
+    filename.write_bytes(data)
+    with reader.open_savegame(str(filename), compiled=True) as savegame:
+        savegame.units[0].pos.y = 3
+        assert savegame.save() == 1
+    changed = filename.read_bytes()
+    assert len(changed) == len(data)
+    assert sum(old != new for old, new in zip(data, changed)) <= 1
+    assert reader.parse_savegame(changed).units[0].pos.y == 3
+
+
+def test_codes_serialize_like_names():
+    data = build_savegame(num_colonies=4, num_units=8, num_tribes=3, seed=9)
+    names = reader.parse_savegame(data)
+    for compiled, slots in [(False, False), (True, True)]:
+        codes = reader.parse_savegame(data, compiled=compiled, slots=slots, codes=True)
+        assert_same_savegame(names, codes, tools.CodeEncoder)
+        unit = codes.units[0]
+        assert unit.type is reader.UnitType.of(int(unit.type)) and str(unit.type) == names.units[0].type
+        assert isinstance(unit.nation, reader.Nation) and unit.nation.name == names.units[0].nation
+        colony = codes.colonies[0]
+        assert {str(goods): amount for goods, amount in colony.goods.items()} == names.colonies[0].goods
+        assert colony.goods[reader.Goods.of(reader.GOODS.index("Food"))] == names.colonies[0].goods["Food"]
+        assert colony.goods[reader.GOODS.index("Food")] == names.colonies[0].goods["Food"]
+        assert [str(code) for code in colony.buildings] == names.colonies[0].buildings
+        assert pickle.loads(pickle.dumps(colony.nation)) is colony.nation
+        assert pickle.loads(pickle.dumps(codes)).units[0].type is unit.type
+
+
+def test_write_codes():
+    data = build_savegame(num_colonies=2, num_units=3, seed=5)
+    savegame = reader.load_savegame(data, compiled=True, codes=True)
+    for section in ["players", "colonies", "units", "europe", "tribes", "indians"]:
+        list(getattr(savegame, section))
+    assert savegame.patches() == []
+
+    savegame.units[1].nation = reader.Nation.of(2)
+    savegame.colonies[0].goods[reader.Goods.of(reader.GOODS.index("Ore"))] = 12
+    savegame.colonies[0].customs_house = [reader.Goods.of(4)]
+    savegame.europe[0].founding_fathers = reader.FoundingFather.values[:2]
+    written = reader.parse_savegame(savegame.to_bytes())
+    assert written.units[1].nation == "Spanish"
+    assert written.colonies[0].goods["Ore"] == 12
+    assert written.colonies[0].customs_house == ["Furs"]
+    assert written.europe[0].founding_fathers == reader.FOUNDING_FATHERS[:2]
+
+
+def test_codes_outside_of_the_table():
+    fields = [(reader.Lookup(reader.NATIONS, reader.Byte(), "none"), reader.Mission, "none"),
+              (reader.Lookup(reader.BUILDINGS, reader.Byte(), reader.BUILDINGS[-1]), reader.Production, "Nothing"),
+              (reader.Lookup(reader.UNITS, reader.Byte()), reader.UnitType, 200)]
+    for lookup, code_type, name in fields:
+        context = reader.BufferContext(bytes([200, 1]))
+        context.codes = True
+        codes = [lookup.read(context), lookup.read(context)]
+        assert [type(code) for code in codes] == [code_type, code_type]
+        assert sorted(codes) == [1, 200]
+        assert to_json(codes, tools.CodeEncoder) == to_json([name, lookup.lookup(1)])
+        assert pickle.loads(pickle.dumps(codes[0])) == 200
+        assert lookup.encode(codes[0], b"\0") == bytes([200])
+
+
+def test_sections_to_numpy():
+    data = build_savegame(num_colonies=3, num_units=7, num_tribes=2, seed=6)
+    savegame = reader.load_savegame(data, compiled=True)
+    parsed = reader.parse_savegame(data)
+    for section in ["players", "colonies", "units", "europe", "tribes", "indians"]:
+        array = savegame.to_numpy(section)
+        assert array.dtype.itemsize == getattr(savegame, section).record_size
+        assert len(array) == len(getattr(parsed, section))
+
+    units = savegame.to_numpy("units")
+    assert units.base is not None and not units.flags.owndata
+    assert [reader.UNITS.get(code, code) for code in units["type"].tolist()] == [unit.type for unit in parsed.units]
+    assert units["pos"]["x"].tolist() == [unit.pos.x for unit in parsed.units]
+    colonies = savegame.to_numpy("colonies")
+    assert [name.decode("utf-8") for name in colonies["name"]] == [colony.name for colony in parsed.colonies]
+    assert [dict(zip(reader.GOODS, storage.tolist())) for storage in colonies["storage"]] == [colony.goods for colony in parsed.colonies]
+    assert colonies["bells"].tolist() == [colony.bells for colony in parsed.colonies]
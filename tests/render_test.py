@@ -0,0 +1,97 @@
+import shutil
+
+from PIL import Image
+
+import reader
+import render
+
+from conftest import build_savegame
+
+
+def render_reference(map, map_size, directory):
+    """Renders the map with the sprites pasted one by one."""
+    def image(name):
+        return render.read_image(directory, name)
+
+    images = {k: image(name) for k, name in reader.TERRAIN.items()}
+    non_land_images = {k: image(name) for k, name in reader.TERRAIN_NON_LAND.items()}
+    forest_images = [image("surface/PHYS0.SS.{:03d}.png".format(i + reader.FOREST_START)) for i in range(16)]
+    mountain_images = [image("surface/PHYS0.SS.{:03d}.png".format(i + reader.MOUNTAIN_START)) for i in range(16)]
+    map_image = Image.new("RGBA", (map_size.x * 16, map_size.y * 16))
+    for index, tile in enumerate(map.tiles):
+        position = (index % map_size.x * 16, index // map_size.x * 16)
+        if tile.non_land == 1:
+            map_image.paste(non_land_images[tile.image_id], position)
+        else:
+            map_image.paste(images[tile.image_id], position)
+            if tile.forest > 0:
+                map_image.paste(forest_images[tile.forest_neighbours], position, forest_images[tile.forest_neighbours])
+            if tile.mountain > 0:
+                map_image.paste(mountain_images[tile.mountain_neighbours], position, mountain_images[tile.mountain_neighbours])
+    return map_image
+
+
+def test_render_map(images_directory):
+    savegame = reader.parse_savegame(build_savegame(map_size=(15, 10), seed=4))
+    atlas = render.SpriteAtlas.load(images_directory)
+    image = render.render_map(savegame.map, savegame.map_size, atlas)
+    assert image.tobytes() == render_reference(savegame.map, savegame.map_size, images_directory).tobytes()
+    assert len(atlas.tiles) < len(savegame.map.tiles)
+
+
+def test_packed_atlas(images_directory, tmp_path):
+    savegame = reader.parse_savegame(build_savegame(map_size=(15, 10), seed=5), map_arrays=True)
+    expected = render.render_map(savegame.map, savegame.map_size, render.SpriteAtlas.load(images_directory))
+
+    directory = tmp_path / "images"
+    shutil.copytree(images_directory, str(directory))
+    render.main(["--pack", "--images", str(directory)])
+    shutil.rmtree(str(directory / "terrain"))
+    shutil.rmtree(str(directory / "surface"))
+    image = render.render_map(savegame.map, savegame.map_size, render.SpriteAtlas.load(str(directory)))
+    assert image.tobytes() == expected.tobytes()
+
+
+def test_atlas_is_loaded_once(images_directory):
+    assert render.get_atlas(images_directory) is render.get_atlas(images_directory)
+
+
+def changed_savegame(data, changes):
+    """Returns a copy of the savegame bytes with map bytes changed: changes maps tile index to new value."""
+    savegame = reader.load_savegame(data)
+    offset, _ = savegame.section_index["map"]
+    data = bytearray(data)
+    for index, value in changes.items():
+        data[offset + index] = value
+    return bytes(data)
+
+
+def test_dirty_tiles():
+    data = build_savegame(map_size=(6, 5), seed=1)
+    previous = reader.parse_savegame(data)
+    # only terrain changes: 0x02 plains -> 0x03 prairie; forest appears at the corner
+    changed = reader.parse_savegame(changed_savegame(data, {14: 0x02, 0: 0x0a}))
+    current = reader.parse_savegame(changed_savegame(data, {14: 0x03, 0: 0x02}))
+    assert render.dirty_tiles(changed.map.map_data, current.map.map_data, current.map_size) == [0, 1, 6, 14]
+    assert render.dirty_tiles(previous.map.map_data, previous.map.map_data, previous.map_size) == []
+
+
+def test_update_map(images_directory):
+    data = build_savegame(map_size=(12, 8), seed=2)
+    atlas = render.SpriteAtlas.load(images_directory)
+    previous = reader.parse_savegame(data)
+    for changes in [{0: 0x0a, 95: 0x2b}, {40: 0x19, 41: 0x23, 53: 0x0b}, {}]:
+        current = reader.parse_savegame(changed_savegame(data, changes))
+        image = render.render_map(previous.map, previous.map_size, atlas)
+        updated = render.update_map(image, previous.map.map_data, current.map, current.map_size, atlas)
+        assert updated.tobytes() == render.render_map(current.map, current.map_size, atlas).tobytes()
+
+
+def test_buffer_matches_pasted_tiles(images_directory):
+    savegame = reader.parse_savegame(build_savegame(map_size=(23, 17), seed=8))
+    atlas = render.SpriteAtlas.load(images_directory)
+    expected = render.paste_map(savegame.map, savegame.map_size, atlas).tobytes()
+    assert render.render_map(savegame.map, savegame.map_size, atlas).tobytes() == expected
+    assert render.render_map(savegame.map, savegame.map_size, atlas, bands=3).tobytes() == expected
+    codes = render.tile_codes(savegame.map.map_data, savegame.map_size).ravel()
+    assert [render.code_key(int(code)) for code in codes] == [render.tile_key(tile) for tile in savegame.map.tiles]
@@ -0,0 +1,127 @@
+import io
+import os
+import json
+import asyncio
+
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+import reader
+import server
+
+from conftest import build_savegame
+
+
+async def request(port, path, headers=()):
+    stream_reader, stream_writer = await asyncio.open_connection("127.0.0.1", port)
+    lines = ["GET {} HTTP/1.1".format(path), "Host: localhost"] + ["{}: {}".format(*header) for header in headers]
+    stream_writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+    response = await stream_reader.read()
+    stream_writer.close()
+    head, _, body = response.partition(b"\r\n\r\n")
+    status_line, *header_lines = head.decode("latin-1").split("\r\n")
+    response_headers = dict(line.split(": ", 1) for line in header_lines)
+    return int(status_line.split()[1]), response_headers, body
+
+
+def serve(directory, client, **options):
+    async def run():
+        with ThreadPoolExecutor(2) as executor:
+            savegame_server = server.Server(str(directory), executor, **options)
+            http_server = await savegame_server.start(port=0)
+            async with http_server:
+                port = http_server.sockets[0].getsockname()[1]
+                return await client(port, savegame_server)
+    return asyncio.run(run())
+
+
+def test_server_responses(tmp_path, images_directory):
+    data = build_savegame(num_colonies=2, num_units=3, seed=3)
+    (tmp_path / "COLONY00.SAV").write_bytes(data)
+    (tmp_path / "notes.txt").write_text("not a savegame")
+    expected = reader.parse_savegame(data)
+
+    async def client(port, savegame_server):
+        status, _, body = await request(port, "/saves")
+        assert (status, json.loads(body)) == (200, ["COLONY00.SAV"])
+
+        status, headers, body = await request(port, "/saves/COLONY00.SAV/units")
+        assert status == 200
+        assert [unit["id"] for unit in json.loads(body)] == [unit.id for unit in expected.units]
+        etag = headers["ETag"]
+
+        status, headers, body = await request(port, "/saves/COLONY00.SAV/units", [("If-None-Match", etag)])
+        assert (status, body) == (304, b"")
+
+        status, _, body = await request(port, "/saves/COLONY00.SAV")
+        assert json.loads(body)["turn"] == expected.turn
+
+        status, headers, body = await request(port, "/saves/COLONY00.SAV/map.png")
+        assert headers["Content-Type"] == "image/png"
+        assert Image.open(io.BytesIO(body)).size == (12 * 16, 9 * 16)
+
+        assert (await request(port, "/saves/COLONY01.SAV/units"))[0] == 404
+        assert (await request(port, "/saves/COLONY00.SAV/secrets"))[0] == 404
+        assert (await request(port, "/saves/../conftest.py"))[0] == 404
+        assert (await request(port, "/saves/..%2F{}%2FCOLONY00.SAV".format(tmp_path.name)))[0] == 200
+        assert (await request(port, "/saves/notes.txt"))[0] == 404
+        assert (await request(port, "/saves/%2Fetc%2Fpasswd"))[0] == 404
+        assert len(savegame_server.cache.entries) == 1
+
+        # a changed file gets a new entry and ETag
+        (tmp_path / "COLONY00.SAV").write_bytes(build_savegame(seed=4))
+        status, headers, _ = await request(port, "/saves/COLONY00.SAV/units", [("If-None-Match", etag)])
+        assert status == 200
+        assert headers["ETag"] != etag
+
+    serve(tmp_path, client, images=images_directory)
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    for seed in range(3):
+        (tmp_path / "COLONY0{}.SAV".format(seed)).write_bytes(build_savegame(seed=seed))
+
+    async def client(port, savegame_server):
+        requests = [request(port, "/saves/COLONY0{}.SAV/colonies".format(seed)) for seed in range(3)]
+        assert [status for status, _, _ in await asyncio.gather(*requests)] == [200, 200, 200]
+        cache = savegame_server.cache
+        assert cache.size <= cache.max_size or len(cache.entries) == 1
+        assert len(cache.entries) == 2
+        assert len(cache.digests) == len(cache.entries)
+
+    savegame_size = server.object_size(reader.parse_savegame(build_savegame(), compiled=True, slots=True))
+    serve(tmp_path, client, cache_size=int(2.5 * savegame_size))
+
+
+def test_pyramid_tiles(tmp_path, images_directory):
+    saves = tmp_path / "saves"
+    saves.mkdir()
+    (saves / "COLONY00.SAV").write_bytes(build_savegame(map_size=(40, 20)))
+
+    async def client(port, savegame_server):
+        status, headers, body = await request(port, "/saves/COLONY00.SAV/tiles/0/0/0.png")
+        assert (status, headers["Content-Type"]) == (200, "image/png")
+        assert Image.open(io.BytesIO(body)).size == (256, 256)
+        assert (await request(port, "/saves/COLONY00.SAV/tiles/2/2/1.png"))[0] == 200
+        assert (await request(port, "/saves/COLONY00.SAV/tiles/1/2/0.png"))[0] == 404
+        assert (await request(port, "/saves/COLONY00.SAV/tiles/a/0/0.png"))[0] == 404
+        assert len(os.listdir(str(tmp_path / "tiles"))) == 1 + 2 + 6
+
+    serve(saves, client, images=images_directory, tiles=str(tmp_path / "tiles"))
+
+
+def test_revalidation_without_parsing(tmp_path):
+    data = build_savegame(seed=6)
+    (tmp_path / "COLONY00.SAV").write_bytes(data)
+    etag = '"{}"'.format(server.file_digest(str(tmp_path / "COLONY00.SAV")))
+
+    async def client(port, savegame_server):
+        status, headers, body = await request(port, "/saves/COLONY00.SAV/units", [("If-None-Match", etag)])
+        assert (status, headers["ETag"], body) == (304, etag, b"")
+        assert len(savegame_server.cache.entries) == 0
+        status, _, _ = await request(port, "/saves/COLONY00.SAV/units", [("If-None-Match", '"other"')])
+        assert status == 200
+        assert len(savegame_server.cache.entries) == 1
+
+    serve(tmp_path, client)
@@ -0,0 +1,59 @@
+import random
+
+import reader
+import spatial
+
+from conftest import build_savegame
+
+
+def random_entries(count, seed=0):
+    rnd = random.Random(seed)
+    return [spatial.Entry(rnd.randrange(58), rnd.randrange(72), rnd.choice(["unit", "colony", "tribe"]),
+                          rnd.choice(reader.NATIONS[:4]), index)
+            for index in range(count)]
+
+
+def test_queries_match_scans():
+    entries = random_entries(300)
+    index = spatial.SpatialIndex(entries, cell_size=5)
+    assert len(index) == 300
+    rnd = random.Random(1)
+    for _ in range(50):
+        x, y, distance = rnd.randrange(58), rnd.randrange(72), rnd.randrange(6)
+        expected = [entry for entry in entries if spatial.tile_distance(x, y, entry.x, entry.y) <= distance]
+        assert sorted(index.radius(x, y, distance)) == sorted(expected)
+        assert sorted(index.radius(x, y, distance, kind="unit", nation="English")) == \
+            sorted(entry for entry in expected if entry.kind == "unit" and entry.nation == "English")
+        assert sorted(index.point(x, y)) == sorted(entry for entry in entries if (entry.x, entry.y) == (x, y))
+        assert sorted(index.rectangle(x, y, x + 10, y + 3)) == \
+            sorted(entry for entry in entries if x <= entry.x <= x + 10 and y <= entry.y <= y + 3)
+
+        nearest = index.nearest(x, y, 5, kind="colony")
+        distances = sorted(spatial.tile_distance(x, y, entry.x, entry.y) for entry in entries if entry.kind == "colony")
+        assert [distance for distance, _ in nearest] == distances[:5]
+
+
+def test_pairs():
+    entries = random_entries(200, seed=2)
+    index = spatial.SpatialIndex(entries)
+    pairs = index.pairs(3)
+    expected = {frozenset([a.item, b.item]) for a in entries for b in entries
+                if a is not b and spatial.tile_distance(a.x, a.y, b.x, b.y) <= 3}
+    assert len(pairs) == len(expected)
+    assert {frozenset([a.item, b.item]) for a, b, _ in pairs} == expected
+
+    colonies = spatial.SpatialIndex([entry for entry in entries if entry.kind == "colony"], cell_size=8)
+    threats = colonies.pairs(2, index, other_kind="unit")
+    assert sorted((a.item, b.item) for a, b, _ in threats) == sorted(
+        (a.item, b.item) for a in entries for b in entries
+        if a.kind == "colony" and b.kind == "unit" and spatial.tile_distance(a.x, a.y, b.x, b.y) <= 2)
+
+
+def test_from_savegame():
+    savegame = reader.parse_savegame(build_savegame(num_colonies=3, num_units=5, num_tribes=4, seed=3))
+    index = spatial.SpatialIndex.from_savegame(savegame)
+    assert len(index) == 12
+    unit = savegame.units[2]
+    assert any(entry.item is unit for entry in index.point(unit.pos.x, unit.pos.y, kind="unit", nation=unit.nation))
+    colony = savegame.colonies[0]
+    assert index.nearest(colony.x, colony.y, kind="colony")[0] == (0, spatial.Entry(colony.x, colony.y, "colony", colony.nation, colony))
@@ -1,3 +1,9 @@
+import io
+import os
+import random
+
+from concurrent.futures import ThreadPoolExecutor
+
 import colsaves.tools as tools
 
 def test_stream_bits_one_byte():
@@ -43,3 +49,87 @@ def test_stream_bits_multiple_bytes():
     b = [227, 142]  #11100 011|10 00111 0
     assert [7, 0, 7, 0, 7, 0] == list(tools.stream_bits(b,  3))
     assert [28, 14, 7,  0] == list(tools.stream_bits(b,  5))
+
+
+def test_unpack_bits_like_stream_bits():
+    rnd = random.Random(0)
+    for length in range(0, 8):
+        b = bytes(rnd.randrange(256) for _ in range(length))
+        for num_bits in range(1, 20):
+            assert list(tools.stream_bits(b, num_bits)) == tools.unpack_bits(b, num_bits)
+
+
+def test_unpack_bits():
+    assert [7, 7, 3] == tools.unpack_bits([255], 3)
+    assert [7, 0, 7, 0, 7, 0] == tools.unpack_bits(bytes([227, 142]), 3)
+    assert [0, 0, 15, 15] == tools.unpack_bits(bytes([0, 255]), 4)
+    assert [1, 1, 1, 1, 0, 0, 0, 0] == tools.unpack_bits(bytes([240]), 1)
+
+
+def test_set_bit_indices():
+    b = bytes([0b10000001, 0, 0b01000000])
+    assert [0, 7, 17] == tools.set_bit_indices(b)
+    assert [0, 7, 22] == tools.set_bit_indices(b, msb_first=False)
+    assert [] == tools.set_bit_indices(bytes(4))
+    assert list(range(16)) == tools.set_bit_indices(b"\xff\xff", msb_first=False)
+
+
+def test_read_tokens():
+    data = b"first\0second\0\0last"
+    assert [b"first", b"second", b"", b"last"] == list(tools.read_tokens(io.BytesIO(data)))
+    assert [b"first", b"second", b""] == list(tools.read_tokens(io.BytesIO(data[:-4])))
+    assert [b"first", b"second"] == list(tools.read_tokens(io.BytesIO(data), size=13))
+    assert [b"a", b"b", b"c"] == list(tools.read_tokens(io.BytesIO(b"a\nb\rc"), b"\r\n"))
+    assert [b"first"] == list(tools.read_terminated_token(io.BytesIO(b"first\0"), tools.null_terminated))
+
+
+def test_read_tokens_across_chunks():
+    rnd = random.Random(1)
+    tokens = [bytes(rnd.randrange(1, 256) for _ in range(rnd.randrange(tools.CHUNK_SIZE * 2))) for _ in range(20)]
+    data = b"\0".join(tokens)
+    assert tokens == list(tools.read_tokens(io.BytesIO(data)))
+
+
+def test_split_tokens_without_copies():
+    data = bytearray(b"abc;de;;f")
+    tokens = list(tools.split_tokens(memoryview(data), b";"))
+    assert [b"abc", b"de", b"", b"f"] == [bytes(token) for token in tokens]
+    data[0:1] = b"x"
+    assert b"xbc" == bytes(tokens[0])
+    assert [b"ab", b"d"] == [bytes(token) for token in tools.split_tokens(b"ab\0d\0", tools.null_terminated)]
+
+
+def test_pack_bits():
+    rnd = random.Random(4)
+    for num_bits, num_bytes in [(4, 4), (3, 2), (1, 6), (5, 3)]:
+        data = bytes(rnd.randrange(256) for _ in range(num_bytes))
+        assert tools.pack_bits(tools.unpack_bits(data, num_bits), num_bits, num_bytes) == data
+        indices = tools.set_bit_indices(data, msb_first=False)
+        assert tools.pack_bit_indices(indices, num_bytes, msb_first=False) == data
+    assert tools.changed_ranges(b"abcdef", b"xbcdyz") == [(0, 1), (4, 6)]
+
+
+def test_disk_cache_evicts_least_recently_used(tmp_path):
+    cache = tools.DiskCache(str(tmp_path), 250)
+    paths = [os.path.join(str(tmp_path), "{}{}".format(name, cache.SUFFIX)) for name in "abc"]
+    for index, path in enumerate(paths[:2]):
+        cache.store(path, bytes([index]) * 100)
+        os.utime(path, ns=(index, index))
+    assert cache.load(paths[0]) == bytes(100)
+    cache.store(paths[2], b"c" * 100)
+    assert [path for _, _, path in cache.entries()] == [paths[0], paths[2]]
+    assert cache.size() == 200
+    other = os.path.join(str(tmp_path), "other")
+    open(other, "wb").close()
+    cache.max_size = 0
+    cache.evict()
+    assert os.listdir(str(tmp_path)) == ["other"]
+
+
+def test_disk_cache_concurrent_stores(tmp_path):
+    cache = tools.DiskCache(str(tmp_path), 1024)
+    path = os.path.join(str(tmp_path), "same" + cache.SUFFIX)
+    with ThreadPoolExecutor(4) as executor:
+        list(executor.map(lambda index: cache.store(path, bytes([index % 256]) * 100), range(200)))
+    assert os.listdir(str(tmp_path)) == [os.path.basename(path)]
+    assert len(cache.load(path)) == 100
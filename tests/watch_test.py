@@ -0,0 +1,69 @@
+import io
+import json
+
+from PIL import Image
+
+import reader
+import render
+import watch
+
+from conftest import build_savegame
+from reader_test import assert_same_savegame
+
+
+def test_read_changes_reuses_unchanged_records():
+    data = build_savegame(num_colonies=3, num_units=5, seed=4)
+    previous = watch.read_changes(data)
+    assert_same_savegame(reader.parse_savegame(data), previous)
+
+    changed = bytearray(data)
+    units_offset = previous.section_index["units"][0]
+    changed[units_offset + 2 * 28] = (changed[units_offset + 2 * 28] + 1) % 58
+    savegame = watch.read_changes(bytes(changed), previous)
+    assert_same_savegame(reader.parse_savegame(bytes(changed)), savegame)
+    assert savegame.colonies is previous.colonies
+    assert savegame.map is previous.map
+    assert savegame.units[1] is previous.units[1]
+    assert savegame.units[2] is not previous.units[2]
+
+
+def test_watcher_waits_until_files_are_written(tmp_path):
+    filename = tmp_path / "COLONY00.SAV"
+    filename.write_bytes(build_savegame(seed=1))
+    calls = []
+    watcher = watch.Watcher([str(tmp_path)], lambda name, savegame: calls.append((name, savegame.turn)))
+
+    assert watcher.poll() == []
+    assert watcher.poll() == [str(filename)]
+    assert watcher.poll() == []
+
+    data = build_savegame(seed=2)
+    filename.write_bytes(data)
+    assert watcher.poll() == []
+    assert watcher.poll() == [str(filename)]
+    assert calls == [(str(filename), reader.parse_savegame(build_savegame(seed=1)).turn),
+                     (str(filename), reader.parse_savegame(data).turn)]
+
+
+def test_watcher_reports_errors(tmp_path):
+    (tmp_path / "COLONY00.SAV").write_bytes(b"COLONIZE")
+    errors = []
+    watcher = watch.Watcher([str(tmp_path)], lambda name, savegame: None, lambda name, e: errors.append(name))
+    watcher.run(interval=0, polls=2)
+    assert errors == [str(tmp_path / "COLONY00.SAV")]
+
+
+def test_writers(tmp_path, images_directory):
+    atlas = render.SpriteAtlas.load(images_directory)
+    output = io.StringIO()
+    writers = [watch.LineWriter(output), watch.MapWriter(str(tmp_path), atlas)]
+    for seed in [1, 2]:
+        savegame = watch.read_changes(build_savegame(seed=seed))
+        for writer in writers:
+            writer("COLONY00.SAV", savegame)
+        expected = render.render_map(savegame.map, savegame.map_size, atlas)
+        with Image.open(str(tmp_path / "COLONY00.SAV.png")) as image:
+            assert image.convert("RGBA").tobytes() == expected.tobytes()
+    lines = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [line["file"] for line in lines] == ["COLONY00.SAV", "COLONY00.SAV"]
+    assert lines[1]["savegame"]["turn"] == savegame.turn